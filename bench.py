@@ -0,0 +1,333 @@
+"""
+Набор воспроизводимых замеров производительности VFS
+
+Замеряются загрузка образа, переходы по директориям, листинги, чтение
+файлов и выполнение целого скрипта. Результаты пишутся в JSON, и новый
+прогон можно сравнить с сохраненным, чтобы заметить замедления:
+
+    python bench.py --nodes 100000 --output base.json
+    python bench.py --nodes 100000 --output new.json --compare base.json
+
+С --memory вместо времени замеряется память, которую занимает
+загруженное дерево, и пик памяти во время загрузки: для обычного и
+компактного (compact.py) дерева, с содержимым файлов в памяти и ленивого.
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+from gen_vfs import PAYLOAD_DISTRIBUTIONS, generate_vfs
+from headless import run_headless
+from shell import Shell
+from vfs import VFS, VFSDirectory, VFSFile, decode_cache, walk
+
+# Сколько путей выбирается для замеров навигации и чтения
+DEFAULT_SAMPLES = 1000
+# Допустимое замедление относительно базового прогона
+DEFAULT_THRESHOLD = 0.2
+
+
+class NullOutput:
+    """Поток, отбрасывающий вывод"""
+
+    def write(self, text):
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+def measure(body: Callable[[], None], ops: int, repeats: int,
+            setup: Optional[Callable[[], None]] = None) -> dict:
+    """
+    Выполнить body несколько раз и собрать статистику времени
+
+    Args:
+        body: Замеряемое действие
+        ops: Сколько операций выполняет одно действие (для операций в секунду)
+        repeats: Число повторов
+        setup: Подготовка перед каждым повтором (в замер не входит)
+    """
+    times = []
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        gc.collect()
+        started = time.perf_counter()
+        body()
+        times.append(time.perf_counter() - started)
+
+    best = min(times)
+    return {
+        "repeats": repeats,
+        "ops": ops,
+        "min_s": best,
+        "median_s": statistics.median(times),
+        "mean_s": statistics.mean(times),
+        "ops_per_s": ops / best if best > 0 else None,
+    }
+
+
+def _sample(rng: random.Random, items: List[str], count: int) -> List[str]:
+    if not items:
+        return []
+    return [rng.choice(items) for _ in range(count)]
+
+
+def write_script(path: str, directories: List[str], files: List[str]):
+    """Скрипт из типичных команд по выбранным путям"""
+    with open(path, 'w', encoding='utf-8') as f:
+        for directory, file_path in zip(directories, files):
+            f.write(f"cd {directory}\nls\npwd\ncat {file_path}\ncd ..\n")
+        f.write("cd /\n")
+
+
+def run_benchmarks(image: str, samples: int = DEFAULT_SAMPLES, repeats: int = 3,
+                   seed: int = 0, log: Callable[[str], None] = print) -> Dict[str, dict]:
+    """
+    Выполнить все замеры над XML-образом
+
+    Returns:
+        Dict[str, dict]: Результаты по имени замера
+    """
+    results = {}
+    rng = random.Random(seed)
+
+    def record(name, result):
+        results[name] = result
+        log(f"{name:24} min {result['min_s'] * 1000:10.3f} мс"
+            + (f"  {result['ops_per_s']:12.0f} оп/с" if result['ops_per_s'] else ""))
+
+    vfs = VFS()
+    record("load_xml", measure(lambda: vfs.load_from_xml(image), 1, repeats))
+    lazy_vfs = VFS()
+    record("load_xml_lazy", measure(lambda: lazy_vfs.load_from_xml(image, lazy=True), 1, repeats))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        snapshot_path = os.path.join(tmp, "image.snap")
+        vfs.save_snapshot(snapshot_path, image)
+        snapshot_vfs = VFS()
+        record("load_snapshot", measure(lambda: snapshot_vfs.load_snapshot(snapshot_path),
+                                        1, repeats))
+
+    directories = []
+    files = []
+    for path, node, _ in walk(vfs.root):
+        if isinstance(node, VFSDirectory):
+            directories.append(path)
+        elif isinstance(node, VFSFile):
+            files.append(path)
+    directories = _sample(rng, directories, samples) or ["/"]
+    files = _sample(rng, files, samples)
+
+    def change_directories():
+        for path in directories:
+            vfs.change_directory(path)
+            vfs.change_directory("..")
+    record("change_directory", measure(change_directories, 2 * len(directories), repeats))
+
+    def list_directories():
+        for path in directories:
+            vfs.change_directory(path)
+            vfs.list_current_directory()
+    record("list_current_directory", measure(list_directories, len(directories), repeats))
+
+    shell = Shell(vfs, NullOutput().write)
+
+    def shell_ls():
+        for path in directories:
+            # cmd_ls - генератор: вывод нужно дочитать, иначе команда не выполнится
+            shell.drain(shell.cmd_ls([path]))
+    record("cmd_ls", measure(shell_ls, len(directories), repeats))
+
+    if files:
+        def read_files():
+            for path in files:
+                vfs.get_file_content(path)
+        record("get_file_content_cold", measure(read_files, len(files), repeats,
+                                                setup=decode_cache.clear))
+        record("get_file_content_warm", measure(read_files, len(files), repeats))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            script_path = os.path.join(tmp, "bench_script.txt")
+            write_script(script_path, directories, files)
+            commands = 5 * min(len(directories), len(files)) + 1
+            output = NullOutput()
+            stderr = sys.stderr
+
+            def run_script():
+                # Строка статистики run_headless не нужна в выводе замеров
+                sys.stderr = NullOutput()
+                try:
+                    run_headless(image, script_path, use_snapshot=False, output=output)
+                finally:
+                    sys.stderr = stderr
+            record("script", measure(run_script, commands, repeats))
+
+    vfs.change_directory("/")
+    return results
+
+
+def measure_memory(image: str, lazy: bool, compact: bool) -> dict:
+    """
+    Память Python, которую занимает загруженная VFS (по tracemalloc)
+
+    Отображение образа в память (mmap) не учитывается: его страницы
+    принадлежат файлу и вытесняются системой.
+    """
+    decode_cache.clear()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        started = time.perf_counter()
+        vfs = VFS()
+        vfs.load_from_xml(image, lazy=lazy, compact=compact)
+        elapsed = time.perf_counter() - started
+        gc.collect()
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del vfs
+    return {"retained_bytes": retained, "peak_bytes": peak, "load_s": elapsed}
+
+
+def run_memory_benchmarks(image: str, log: Callable[[str], None] = print) -> Dict[str, dict]:
+    """
+    Сравнить память обычного и компактного дерева
+
+    Returns:
+        Dict[str, dict]: Результаты по имени замера; у компактных замеров
+        ratio и peak_ratio - во сколько раз занятая после загрузки и пиковая
+        память меньше, чем у обычного дерева в том же режиме
+    """
+    results = {}
+    for lazy in (False, True):
+        suffix = "_lazy" if lazy else ""
+        base = results[f"memory_object{suffix}"] = measure_memory(image, lazy, compact=False)
+        compact = results[f"memory_compact{suffix}"] = measure_memory(image, lazy, compact=True)
+        compact["ratio"] = base["retained_bytes"] / max(compact["retained_bytes"], 1)
+        compact["peak_ratio"] = base["peak_bytes"] / max(compact["peak_bytes"], 1)
+        for name in (f"memory_object{suffix}", f"memory_compact{suffix}"):
+            result = results[name]
+            log(f"{name:24} {result['retained_bytes'] / 2 ** 20:10.1f} МБ"
+                f"  (пик {result['peak_bytes'] / 2 ** 20:.1f} МБ)"
+                + (f"  меньше в {result['ratio']:.1f} раза, пик - в {result['peak_ratio']:.1f}"
+                   if "ratio" in result else ""))
+    return results
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict],
+            threshold: float = DEFAULT_THRESHOLD) -> List[str]:
+    """
+    Сравнить результаты с базовым прогоном по лучшему времени
+
+    Returns:
+        List[str]: Описания замедлившихся замеров
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base or not base.get("min_s"):
+            continue
+        ratio = result["min_s"] / base["min_s"]
+        if ratio > 1 + threshold:
+            regressions.append(f"{name}: {base['min_s'] * 1000:.3f} мс -> "
+                               f"{result['min_s'] * 1000:.3f} мс (x{ratio:.2f})")
+    return regressions
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='Замеры производительности VFS')
+    parser.add_argument('--image', help='Готовый XML-образ (иначе генерируется синтетический)')
+    parser.add_argument('--nodes', type=int, default=100000, help='Число узлов образа')
+    parser.add_argument('--depth', type=int, default=6, help='Максимальная глубина образа')
+    parser.add_argument('--fanout', type=int, default=16, help='Число детей директории')
+    parser.add_argument('--dir-fraction', type=float, default=0.2,
+                        help='Доля директорий среди детей')
+    parser.add_argument('--payload', choices=PAYLOAD_DISTRIBUTIONS, default='lognormal',
+                        help='Распределение размеров файлов')
+    parser.add_argument('--payload-mean', type=int, default=256,
+                        help='Средний размер файла, байт')
+    parser.add_argument('--seed', type=int, default=0, help='Начальное значение генератора')
+    parser.add_argument('--samples', type=int, default=DEFAULT_SAMPLES,
+                        help='Сколько путей использовать в замерах навигации и чтения')
+    parser.add_argument('--repeats', type=int, default=3, help='Число повторов каждого замера')
+    parser.add_argument('--output', help='Куда записать результаты в JSON')
+    parser.add_argument('--compare', help='JSON базового прогона для сравнения')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Допустимое замедление относительно базового прогона (0.2 = 20%%)')
+    parser.add_argument('--memory', action='store_true',
+                        help='Замерить память обычного и компактного дерева вместо времени')
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    """
+    Returns:
+        int: 0 - без замедлений, 1 - есть замедления относительно базового прогона
+    """
+    args = parse_arguments(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        image = args.image
+        image_params = {"path": image}
+        if not image:
+            image = os.path.join(tmp, "bench_vfs.xml")
+            image_params = generate_vfs(image, nodes=args.nodes, depth=args.depth,
+                                        fanout=args.fanout, dir_fraction=args.dir_fraction,
+                                        payload=args.payload, payload_mean=args.payload_mean,
+                                        seed=args.seed)
+            image_params.update(seed=args.seed, fanout=args.fanout, payload=args.payload,
+                                payload_mean=args.payload_mean)
+            print(f"Сгенерирован образ: {image_params['nodes']} узлов, "
+                  f"{os.path.getsize(image)} байт")
+
+        if args.memory:
+            results = run_memory_benchmarks(image)
+        else:
+            results = run_benchmarks(image, samples=args.samples, repeats=args.repeats,
+                                     seed=args.seed)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "image": image_params,
+            "samples": args.samples,
+            "repeats": args.repeats,
+        },
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Результаты записаны в {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline.get("results", {}), args.threshold)
+        if regressions:
+            print("Замедления относительно базового прогона:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("Замедлений относительно базового прогона нет")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,379 @@
+"""
+Компактное хранение дерева VFS в массивах
+
+В деревьях на миллионы узлов объекты VFSFile/VFSDirectory и словари
+children занимают больше памяти, чем сами имена и содержимое. Здесь
+дерево хранится таблицами по одной записи на узел (struct-of-arrays):
+
+    names      уникальные имена: одинаковые имена хранятся один раз
+    name_ids   array('I'): индекс имени узла в names
+    kinds      bytearray: директория, текст или участок образа
+    offsets    array('Q'): у директории - позиция первого ребенка, у файла -
+               индекс текста в texts или смещение участка в образе
+    lengths    array('Q'): у директории - число детей, у файла - длина участка
+    order      array('I'): позиции детей каждой директории, отсортированные
+               по имени (для бинарного поиска и листинга по именам)
+
+Содержимое, загруженное в память (base64 - ASCII), складывается подряд в
+один буфер bytearray, который подключается как еще один образ: так на файл не
+тратится отдельный объект строки. В texts остается только содержимое с
+символами вне ASCII.
+
+Дети директории лежат подряд в порядке документа, поэтому директория
+описывается диапазоном позиций. Объекты узлов создаются только при
+обращении: директория - один объект на позицию, пока на него есть ссылки
+(курсоры и индекс сравнивают директории по идентичности), файл - заново
+при каждом обращении; декодированное содержимое все равно кэшируется в
+decode_cache по ключу участка, общему для всех копий.
+
+Таблицы только читаются. Изменения идут через копирование при записи
+(VFS._writable_directory): копия компактной директории - обычная
+VFSDirectory, а неизмененные поддеревья остаются в таблицах.
+"""
+
+import weakref
+from array import array
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from vfs import BlobStore, VFSDirectory, VFSError, VFSFile, VFSImage, VFSNode, join_path
+
+KIND_DIRECTORY = 0
+# Содержимое в base64 хранится строкой в CompactTree.texts
+KIND_TEXT = 1
+# Участок образа: kind = KIND_IMAGE + номер образа в CompactTree.images
+KIND_IMAGE = 2
+
+MAX_IMAGES = 256 - KIND_IMAGE
+
+
+class CompactTree:
+    """Таблицы узлов компактного дерева (строятся CompactTreeBuilder)"""
+
+    def __init__(self, names: List[str], name_ids: array, kinds: bytearray,
+                 offsets: array, lengths: array, order: array,
+                 texts: List[str], images: List[VFSImage]):
+        self.names = names
+        self.name_ids = name_ids
+        self.kinds = kinds
+        self.offsets = offsets
+        self.lengths = lengths
+        self.order = order
+        self.texts = texts
+        self.images = images
+        # Позиция -> объект директории, пока он где-то используется
+        self._directories = weakref.WeakValueDictionary()
+        self.root = CompactDirectory(self, 0, None)
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def name(self, position: int) -> str:
+        return self.names[self.name_ids[position]]
+
+    def node(self, position: int, parent: 'CompactDirectory') -> VFSNode:
+        """Объект узла на позиции position (parent - его директория)"""
+        kind = self.kinds[position]
+        if kind == KIND_DIRECTORY:
+            directory = self._directories.get(position)
+            if directory is None:
+                directory = self._directories.setdefault(
+                    position, CompactDirectory(self, position, parent))
+            return directory
+
+        name = self.names[self.name_ids[position]]
+        if kind == KIND_TEXT:
+            return VFSFile(name, self.texts[self.offsets[position]])
+        return VFSFile(name, image=self.images[kind - KIND_IMAGE],
+                       offset=self.offsets[position], length=self.lengths[position])
+
+    def find_child(self, position: int, name: str) -> Optional[int]:
+        """Позиция ребенка директории с именем name (бинарный поиск по order)"""
+        index = self.offsets[position] + self.lower_bound(position, name)
+        if index < self.offsets[position] + self.lengths[position]:
+            child = self.order[index]
+            if self.names[self.name_ids[child]] == name:
+                return child
+        return None
+
+    def lower_bound(self, position: int, name: str) -> int:
+        """Число детей директории с именем меньше name"""
+        first = self.offsets[position]
+        low = first
+        high = first + self.lengths[position]
+        order, names, name_ids = self.order, self.names, self.name_ids
+        while low < high:
+            middle = (low + high) // 2
+            if names[name_ids[order[middle]]] < name:
+                low = middle + 1
+            else:
+                high = middle
+        return low - first
+
+
+class CompactChildren(Mapping):
+    """Дети компактной директории как словарь только для чтения (имя -> узел)"""
+
+    __slots__ = ("_directory",)
+
+    def __init__(self, directory: 'CompactDirectory'):
+        self._directory = directory
+
+    def __getitem__(self, name: str) -> VFSNode:
+        node = self._directory.get_child(name)
+        if node is None:
+            raise KeyError(name)
+        return node
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._directory.list_children())
+
+    def __len__(self):
+        return self._directory.child_count()
+
+    def values(self) -> Iterator[VFSNode]:
+        """Узлы детей в порядке документа (без поиска по имени)"""
+        return self._directory.iter_children()
+
+    def items(self) -> Iterator[Tuple[str, VFSNode]]:
+        return ((node.name, node) for node in self._directory.iter_children())
+
+
+class CompactDirectory(VFSDirectory):
+    """
+    Директория компактного дерева
+
+    Дети читаются из таблиц CompactTree; children - вычисляемое
+    отображение только для чтения. Директория никогда не принадлежит
+    версии VFS (owner всегда None), поэтому перед изменением она
+    копируется в обычную VFSDirectory.
+    """
+
+    __slots__ = ("tree", "position", "__weakref__")
+
+    indexed = False
+
+    def __init__(self, tree: CompactTree, position: int, parent: Optional[VFSDirectory]):
+        # VFSDirectory.__init__ не вызывается: children здесь - свойство
+        self.name = tree.name(position)
+        self.parent = parent
+        self.path = join_path(parent.path, self.name) if parent is not None else "/"
+        self.index = None
+        self.owner = None
+        self._sorted_names = None
+        self.tree = tree
+        self.position = position
+
+    @property
+    def children(self) -> CompactChildren:
+        return CompactChildren(self)
+
+    def _range(self) -> Tuple[int, int]:
+        first = self.tree.offsets[self.position]
+        return first, first + self.tree.lengths[self.position]
+
+    def add_child(self, node: VFSNode):
+        raise VFSError(f"Директория '{self.path}' доступна только для чтения")
+
+    def remove_child(self, name: str) -> Optional[VFSNode]:
+        raise VFSError(f"Директория '{self.path}' доступна только для чтения")
+
+    def get_child(self, name: str) -> Optional[VFSNode]:
+        position = self.tree.find_child(self.position, name)
+        return self.tree.node(position, self) if position is not None else None
+
+    def iter_children(self) -> Iterator[VFSNode]:
+        """Дети в порядке документа"""
+        first, end = self._range()
+        node = self.tree.node
+        for position in range(first, end):
+            yield node(position, self)
+
+    def copy(self) -> VFSDirectory:
+        """Изменяемая копия: обычная VFSDirectory с теми же детьми"""
+        directory = VFSDirectory(self.name, self.parent)
+        directory.children = {node.name: node for node in self.iter_children()}
+        directory._sorted_names = self.sorted_names()
+        directory.path = self.path
+        return directory
+
+    def list_children(self) -> List[str]:
+        first, end = self._range()
+        name = self.tree.name
+        return [name(position) for position in range(first, end)]
+
+    def child_count(self) -> int:
+        return self.tree.lengths[self.position]
+
+    def name_range(self, start: int, end: int) -> List[str]:
+        first, last = self._range()
+        tree = self.tree
+        return [tree.name(position)
+                for position in tree.order[first + start:min(first + end, last)]]
+
+    def sorted_names(self) -> List[str]:
+        return self.name_range(0, self.child_count())
+
+    def prefix_range(self, prefix: str) -> Tuple[int, int]:
+        if not prefix:
+            return 0, self.child_count()
+        start = self.tree.lower_bound(self.position, prefix)
+        end = self.tree.lower_bound(self.position, prefix + "\U0010ffff")
+        return start, end
+
+    def list_page(self, offset: int = 0, limit: Optional[int] = None) -> List[VFSNode]:
+        first, last = self._range()
+        end = last if limit is None else min(last, first + offset + limit)
+        node = self.tree.node
+        return [node(position, self) for position in self.tree.order[first + offset:end]]
+
+
+class CompactTreeBuilder:
+    """
+    Построитель компактного дерева для загрузчиков образов
+
+    Интерфейс тот же, что у vfs.TreeBuilder, описатели директорий - номера
+    узлов. Во время разбора узлы дописываются в массивы в порядке
+    документа; finish() раскладывает их так, чтобы дети каждой
+    директории шли подряд, и строит отсортированный по именам order.
+    """
+
+    def __init__(self):
+        self._names: List[str] = []
+        self._name_ids: Dict[str, int] = {}
+        self._texts: List[str] = []
+        # id(строка) -> индекс в _texts: общие после дедупликации строки хранятся один раз
+        self._text_ids: Dict[int, int] = {}
+        self._images: List[Optional[VFSImage]] = []
+        # Буфер ASCII-содержимого и его номер в _images
+        self._pool = bytearray()
+        self._pool_image: Optional[int] = None
+        self._name_of = array('I')
+        self._parent_of = array('I')
+        self._kinds = bytearray()
+        self._offsets = array('Q')
+        self._lengths = array('Q')
+        self.root = self._add(0, "", KIND_DIRECTORY, 0, 0)
+
+    def _add(self, parent: int, name: str, kind: int, offset: int, length: int) -> int:
+        name_id = self._name_ids.get(name)
+        if name_id is None:
+            name_id = self._name_ids[name] = len(self._names)
+            self._names.append(name)
+        self._name_of.append(name_id)
+        self._parent_of.append(parent)
+        self._kinds.append(kind)
+        self._offsets.append(offset)
+        self._lengths.append(length)
+        return len(self._kinds) - 1
+
+    def add_directory(self, parent: int, name: str) -> int:
+        return self._add(parent, name, KIND_DIRECTORY, 0, 0)
+
+    def add_file(self, parent: int, name: str, content: str = "",
+                 image: Optional[VFSImage] = None, offset: int = 0, length: int = 0):
+        if image is None and content.isascii():
+            offset = len(self._pool)
+            self._pool += content.encode('ascii')
+            self._add(parent, name, KIND_IMAGE + self._pool_number(), offset, len(content))
+        elif image is None:
+            text_id = self._text_ids.get(id(content))
+            if text_id is None:
+                text_id = self._text_ids[id(content)] = len(self._texts)
+                self._texts.append(content)
+            self._add(parent, name, KIND_TEXT, text_id, 0)
+        else:
+            self._add(parent, name, KIND_IMAGE + self._image_number(image), offset, length)
+
+    def add_text(self, parent: int, name: str, text: str, blobs: BlobStore, key):
+        if not text.isascii():
+            self.add_file(parent, name, blobs.intern(key, text, len(text)))
+            return
+        # BlobStore запоминает смещение в буфере, а не строку: иначе на время
+        # загрузки все содержимое хранилось бы дважды - строками и в буфере
+        offset = len(self._pool)
+        offset = blobs.intern(key, offset, len(text))
+        if offset == len(self._pool):
+            self._pool += text.encode('ascii')
+        self._add(parent, name, KIND_IMAGE + self._pool_number(), offset, len(text))
+
+    def _pool_number(self) -> int:
+        """Номер буфера содержимого в _images"""
+        if self._pool_image is None:
+            self._pool_image = self._image_number(None)
+        return self._pool_image
+
+    def _image_number(self, image: Optional[VFSImage]) -> int:
+        """Номер образа в _images (None - место для буфера содержимого)"""
+        for number, known in enumerate(self._images):
+            if known is image:
+                return number
+        if len(self._images) >= MAX_IMAGES:
+            raise VFSError("слишком много образов в одном компактном дереве")
+        self._images.append(image)
+        return len(self._images) - 1
+
+    def finish(self) -> CompactDirectory:
+        """Разложить узлы по директориям и вернуть корень компактного дерева"""
+        count = len(self._kinds)
+        parent_of = self._parent_of
+
+        # Группировка детей по родителю подсчетом: порядок документа сохраняется
+        child_counts = array('I', bytes(4 * count))
+        for node in range(1, count):
+            child_counts[parent_of[node]] += 1
+        starts = array('I', bytes(4 * count))
+        running = 0
+        for node in range(count):
+            starts[node] = running
+            running += child_counts[node]
+        fill = array('I', starts)
+        grouped = array('I', bytes(4 * running))
+        for node in range(1, count):
+            parent = parent_of[node]
+            grouped[fill[parent]] = node
+            fill[parent] += 1
+        del fill
+
+        names = self._names
+        name_of = self._name_of
+        # Раскладка в ширину: layout[позиция] - номер узла в порядке разбора
+        layout = array('I', [self.root])
+        name_ids = array('I')
+        kinds = bytearray()
+        offsets = array('Q')
+        lengths = array('Q')
+        order = array('I', [0])
+
+        position = 0
+        while position < len(layout):
+            node = layout[position]
+            kind = self._kinds[node]
+            name_ids.append(name_of[node])
+            kinds.append(kind)
+            if kind == KIND_DIRECTORY:
+                start = starts[node]
+                children = grouped[start:start + child_counts[node]]
+                # Повторное имя, как и в словаре children, оставляет место
+                # первого узла, но сам узел - последний
+                unique = {name_of[child]: child for child in children}
+                if len(unique) != len(children):
+                    children = array('I', unique.values())
+                first = len(layout)
+                layout.extend(children)
+                order.extend(sorted(range(first, first + len(children)),
+                                    key=lambda child: names[name_of[layout[child]]]))
+                offsets.append(first)
+                lengths.append(len(children))
+            else:
+                offsets.append(self._offsets[node])
+                lengths.append(self._lengths[node])
+            position += 1
+
+        if self._pool_image is not None:
+            self._images[self._pool_image] = VFSImage("", mapping=self._pool)
+            self._pool = bytearray()
+
+        tree = CompactTree(names, name_ids, kinds, offsets, lengths, order,
+                           self._texts, self._images)
+        return tree.root
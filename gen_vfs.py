@@ -0,0 +1,182 @@
+"""
+Генератор синтетических XML-образов VFS
+
+Образ пишется потоково, поэтому можно генерировать деревья на миллионы
+узлов. При одинаковых параметрах и seed получается один и тот же файл.
+
+Пример:
+    python gen_vfs.py big_vfs.xml --nodes 1000000 --depth 8 --fanout 32
+"""
+
+import argparse
+import base64
+import math
+import random
+import sys
+from typing import List, Tuple
+from xml.sax.saxutils import quoteattr
+
+PAYLOAD_DISTRIBUTIONS = ("fixed", "uniform", "lognormal")
+
+WORDS = ("vfs", "shell", "emulator", "directory", "file", "path", "error", "config",
+         "user", "system", "network", "cache", "index", "node", "tree", "script")
+
+
+def _corpus(rng: random.Random, size: int = 1 << 16) -> bytes:
+    """Текст, из которого нарезается содержимое файлов"""
+    lines = []
+    length = 0
+    number = 0
+    while length < size:
+        number += 1
+        line = f"{number}: " + " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 10)))
+        lines.append(line)
+        length += len(line) + 1
+    return ("\n".join(lines) + "\n").encode('ascii')
+
+
+class PayloadGenerator:
+    """Размеры и содержимое файлов по заданному распределению"""
+
+    def __init__(self, rng: random.Random, distribution: str, mean: int, maximum: int):
+        if distribution not in PAYLOAD_DISTRIBUTIONS:
+            raise ValueError(f"неизвестное распределение '{distribution}'")
+        self.rng = rng
+        self.distribution = distribution
+        self.mean = max(0, mean)
+        self.maximum = max(self.mean, maximum)
+        self.corpus = _corpus(rng)
+
+    def size(self) -> int:
+        if self.distribution == "fixed" or self.mean == 0:
+            size = self.mean
+        elif self.distribution == "uniform":
+            size = self.rng.randint(0, 2 * self.mean)
+        else:
+            # Медиана около mean/2, длинный хвост крупных файлов
+            size = int(self.rng.lognormvariate(math.log(self.mean) - 0.5, 1.0))
+        return min(size, self.maximum)
+
+    def payload(self) -> bytes:
+        size = self.size()
+        if size == 0:
+            return b""
+        repeats = size // len(self.corpus) + 1
+        start = self.rng.randrange(len(self.corpus))
+        data = self.corpus[start:] + self.corpus * repeats
+        return data[:size]
+
+
+def generate_vfs(xml_path: str, nodes: int = 10000, depth: int = 6, fanout: int = 16,
+                 dir_fraction: float = 0.2, payload: str = "lognormal",
+                 payload_mean: int = 256, payload_max: int = 1 << 20, seed: int = 0) -> dict:
+    """
+    Записать синтетический XML-образ VFS
+
+    Бюджет узлов делится между поддиректориями поровну. У директории не
+    больше fanout детей, кроме директорий на максимальной глубине, куда
+    попадает весь оставшийся бюджет.
+
+    Args:
+        xml_path: Путь к создаваемому образу
+        nodes: Число узлов (файлов и директорий, без корня)
+        depth: Максимальная глубина директорий
+        fanout: Число детей директории
+        dir_fraction: Доля директорий среди детей
+        payload: Распределение размеров файлов: fixed, uniform или lognormal
+        payload_mean: Средний размер файла в байтах (до base64)
+        payload_max: Максимальный размер файла в байтах
+        seed: Начальное значение генератора случайных чисел
+
+    Returns:
+        dict: Фактические параметры образа (узлы, директории, файлы,
+        глубина, байты содержимого)
+    """
+    rng = random.Random(seed)
+    payloads = PayloadGenerator(rng, payload, payload_mean, payload_max)
+    fanout = max(1, fanout)
+    stats = {"nodes": 0, "directories": 0, "files": 0, "max_depth": 0, "payload_bytes": 0}
+
+    with open(xml_path, 'w', encoding='utf-8', newline='\n') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<vfs>\n')
+
+        # Элементы стека: (имя, глубина, бюджет) или (None, глубина, 0) - закрыть директорию
+        stack: List[Tuple[str, int, int]] = [("", 0, max(0, nodes))]
+        while stack:
+            name, level, budget = stack.pop()
+            indent = "    " * level
+            if name is None:
+                f.write(f"{indent}</directory>\n")
+                continue
+
+            if level > 0:
+                stats["nodes"] += 1
+                stats["directories"] += 1
+                stats["max_depth"] = max(stats["max_depth"], level)
+                if budget == 0:
+                    f.write(f"{indent}<directory name={quoteattr(name)} />\n")
+                    continue
+                f.write(f"{indent}<directory name={quoteattr(name)}>\n")
+                stack.append((None, level, 0))
+
+            if level >= depth:
+                children, directories = budget, 0
+            else:
+                children = min(fanout, budget)
+                directories = min(children, max(round(children * dir_fraction),
+                                                1 if budget > children else 0))
+            files = children - directories
+            rest = budget - children
+
+            child_indent = "    " * (level + 1)
+            for number in range(files):
+                data = payloads.payload()
+                stats["nodes"] += 1
+                stats["files"] += 1
+                stats["payload_bytes"] += len(data)
+                f.write(f'{child_indent}<file name="file{number}.txt">'
+                        f'{base64.b64encode(data).decode("ascii")}</file>\n')
+
+            subdirectories = []
+            for number in range(directories):
+                share = rest // directories + (1 if number < rest % directories else 0)
+                subdirectories.append((f"dir{number}", level + 1, share))
+            stack.extend(reversed(subdirectories))
+
+        f.write("</vfs>\n")
+
+    return stats
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='Генератор синтетических XML-образов VFS')
+    parser.add_argument('output', help='Путь к создаваемому образу')
+    parser.add_argument('--nodes', type=int, default=10000, help='Число узлов')
+    parser.add_argument('--depth', type=int, default=6, help='Максимальная глубина')
+    parser.add_argument('--fanout', type=int, default=16, help='Число детей директории')
+    parser.add_argument('--dir-fraction', type=float, default=0.2,
+                        help='Доля директорий среди детей')
+    parser.add_argument('--payload', choices=PAYLOAD_DISTRIBUTIONS, default='lognormal',
+                        help='Распределение размеров файлов')
+    parser.add_argument('--payload-mean', type=int, default=256,
+                        help='Средний размер файла, байт')
+    parser.add_argument('--payload-max', type=int, default=1 << 20,
+                        help='Максимальный размер файла, байт')
+    parser.add_argument('--seed', type=int, default=0, help='Начальное значение генератора')
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_arguments(argv)
+    stats = generate_vfs(args.output, nodes=args.nodes, depth=args.depth, fanout=args.fanout,
+                         dir_fraction=args.dir_fraction, payload=args.payload,
+                         payload_mean=args.payload_mean, payload_max=args.payload_max,
+                         seed=args.seed)
+    print(f"Образ записан в {args.output}: узлов {stats['nodes']} "
+          f"(директорий {stats['directories']}, файлов {stats['files']}), "
+          f"глубина {stats['max_depth']}, содержимое {stats['payload_bytes']} байт")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,181 @@
+"""
+Параллельный поиск по содержимому файлов VFS
+
+Декодирование base64 и поиск выполняются пачками в пуле процессов.
+Результаты возвращаются потоково и в порядке обхода файлов; поиск можно
+прервать событием отмены или просто перестав читать генератор.
+"""
+
+import atexit
+import base64
+import binascii
+import os
+import re
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from multiprocessing import get_context
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from vfs import VFSFile
+
+# Пачка для одного процесса: не больше стольких файлов...
+GREP_BATCH_FILES = 256
+# ...и не больше стольких байт содержимого
+GREP_BATCH_BYTES = 4 * 1024 * 1024
+# Сколько пачек на процесс может одновременно быть в работе
+IN_FLIGHT_PER_WORKER = 2
+# Как часто ожидание результата проверяет событие отмены (секунды)
+CANCEL_POLL_INTERVAL = 0.1
+
+# (путь, данные, закодированы ли в base64)
+Payload = Tuple[str, object, bool]
+# (путь, номер строки, строка)
+Match = Tuple[str, int, str]
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def grep_batch(batch: List[Payload], pattern: str, flags: int = 0) -> List[Match]:
+    """Декодировать пачку файлов и найти строки, подходящие под шаблон"""
+    regex = re.compile(pattern, flags)
+    matches = []
+    for path, data, encoded in batch:
+        try:
+            raw = base64.b64decode(data) if encoded else data
+            text = raw.decode('utf-8')
+        except (binascii.Error, ValueError):
+            # Двоичные файлы пропускаются
+            continue
+
+        if regex.search(text) is None:
+            continue
+        for number, line in enumerate(text.splitlines(), 1):
+            if regex.search(line):
+                matches.append((path, number, line))
+    return matches
+
+
+def _get_pool(workers: Optional[int]) -> ProcessPoolExecutor:
+    """Общий пул процессов; создается при первом использовании"""
+    global _pool, _pool_workers
+    workers = workers or os.cpu_count() or 1
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False, cancel_futures=True)
+            # spawn: дочерние процессы не наследуют потоки и состояние Qt
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"))
+            _pool_workers = workers
+        return _pool
+
+
+def shutdown_pool():
+    """Остановить пул процессов (вызывается при выходе из программы)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+# Пул общий для всех сеансов и окна, поэтому останавливается только при
+# выходе: незавершенные пачки отменяются, а не дорабатываются
+atexit.register(shutdown_pool)
+
+
+def _batches(files: Iterable[Tuple[str, VFSFile]]) -> Iterator[List[Payload]]:
+    batch: List[Payload] = []
+    batch_bytes = 0
+    for path, node in files:
+        data, encoded = node.get_payload()
+        if not data:
+            continue
+        batch.append((path, data, encoded))
+        batch_bytes += len(data)
+        if len(batch) >= GREP_BATCH_FILES or batch_bytes >= GREP_BATCH_BYTES:
+            yield batch
+            batch = []
+            batch_bytes = 0
+    if batch:
+        yield batch
+
+
+def grep_files(files: Iterable[Tuple[str, VFSFile]], pattern: str, flags: int = 0,
+               cancel: Optional[threading.Event] = None,
+               workers: Optional[int] = None) -> Iterator[Match]:
+    """
+    Найти строки, подходящие под регулярное выражение, в содержимом файлов
+
+    Если файлов хватает не больше чем на одну пачку, поиск идет в текущем
+    процессе. Иначе пачки раздаются пулу процессов; одновременно в работе
+    не больше IN_FLIGHT_PER_WORKER пачек на процесс, так что память
+    ограничена независимо от числа файлов.
+
+    Args:
+        files: Пары (полный путь, файл) в порядке вывода
+        pattern: Регулярное выражение
+        flags: Флаги re
+        cancel: Событие отмены; после него генератор завершается
+        workers: Число процессов (по умолчанию - число ядер)
+
+    Yields:
+        (путь, номер строки, строка) в порядке files
+    """
+    def cancelled():
+        return cancel is not None and cancel.is_set()
+
+    batches = _batches(files)
+    first = next(batches, None)
+    if first is None:
+        return
+    second = next(batches, None)
+    if second is None:
+        for match in grep_batch(first, pattern, flags):
+            if cancelled():
+                return
+            yield match
+        return
+
+    pool = _get_pool(workers)
+    max_in_flight = _pool_workers * IN_FLIGHT_PER_WORKER
+    in_flight = deque()
+
+    def wait(future):
+        while True:
+            if cancelled():
+                return None
+            try:
+                return future.result(timeout=CANCEL_POLL_INTERVAL)
+            except TimeoutError:
+                continue
+
+    try:
+        in_flight.append(pool.submit(grep_batch, first, pattern, flags))
+        in_flight.append(pool.submit(grep_batch, second, pattern, flags))
+        for batch in batches:
+            while len(in_flight) >= max_in_flight:
+                matches = wait(in_flight.popleft())
+                if matches is None:
+                    return
+                for match in matches:
+                    if cancelled():
+                        return
+                    yield match
+            if cancelled():
+                return
+            in_flight.append(pool.submit(grep_batch, batch, pattern, flags))
+
+        while in_flight:
+            matches = wait(in_flight.popleft())
+            if matches is None:
+                return
+            for match in matches:
+                if cancelled():
+                    return
+                yield match
+    finally:
+        for future in in_flight:
+            future.cancel()
@@ -0,0 +1,484 @@
+import shlex
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+from PyQt5.QtWidgets import (QMainWindow, QVBoxLayout, QHBoxLayout, QPlainTextEdit,
+                             QLineEdit, QPushButton, QWidget, QLabel, QShortcut,
+                             QListView, QSplitter)
+from PyQt5.QtCore import (Qt, QTimer, QObject, QEvent, QAbstractListModel, QModelIndex,
+                          pyqtSignal)
+from PyQt5.QtGui import QFont, QTextCursor, QKeySequence
+
+from vfs import VFS, VFSDirectory
+from shell import (COMMANDS, SEPARATOR, Shell, compile_command, compile_script, load_vfs,
+                   resolve_path, script_errors)
+
+# Через сколько миллисекунд буфер вывода сбрасывается в виджет
+OUTPUT_FLUSH_INTERVAL_MS = 30
+# При каком объеме накопленного текста (символов) буфер сбрасывается сразу
+OUTPUT_FLUSH_THRESHOLD = 64 * 1024
+# Сколько строк вывода хранится в окне по умолчанию (0 - без ограничения)
+DEFAULT_SCROLLBACK_LINES = 10000
+# Сколько строк листинга директории модель отдает представлению за раз
+LISTING_PAGE_ROWS = 500
+
+
+class BackgroundOutput(QObject):
+    """Передача вывода фоновой команды в поток интерфейса"""
+    text = pyqtSignal(str)
+    finished = pyqtSignal()
+
+
+class LoaderSignals(QObject):
+    """Передача вывода и прогресса загрузки VFS в поток интерфейса"""
+    text = pyqtSignal(str)
+    progress = pyqtSignal(int, int, int)
+    finished = pyqtSignal(object, bool)
+
+
+class DirectoryModel(QAbstractListModel):
+    """
+    Содержимое директории для QListView
+
+    Строки берутся из отсортированного индекса директории при отрисовке.
+    Модель отдает строки порциями по мере прокрутки (fetchMore), поэтому
+    смена директории и раскладка представления стоят O(показанных строк),
+    а не O(детей директории).
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.directory = None
+        self.loaded_rows = 0
+
+    def set_directory(self, directory):
+        self.beginResetModel()
+        self.directory = directory
+        self.loaded_rows = min(LISTING_PAGE_ROWS, directory.child_count()) if directory else 0
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self.loaded_rows
+
+    def canFetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self.directory is None:
+            return False
+        return self.loaded_rows < self.directory.child_count()
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self.directory is None:
+            return
+        count = min(LISTING_PAGE_ROWS, self.directory.child_count() - self.loaded_rows)
+        if count <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self.loaded_rows, self.loaded_rows + count - 1)
+        self.loaded_rows += count
+        self.endInsertRows()
+
+    def node(self, row):
+        if not 0 <= row < self.directory.child_count():
+            return None
+        return self.directory.list_page(row, 1)[0]
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or self.directory is None:
+            return None
+        node = self.node(index.row())
+        if node is None:
+            return None
+        return f"{node.name}/" if isinstance(node, VFSDirectory) else node.name
+
+
+class ShellEmulator(QMainWindow):
+    def __init__(self, vfs_path=None, script_path=None, lazy=False, use_snapshot=True,
+                 scrollback=DEFAULT_SCROLLBACK_LINES, journal=False, compact=False,
+                 mounts=None, preload=False, name_index=False):
+        super().__init__()
+
+        self.lazy = lazy
+        self.compact = compact
+        self.mounts = mounts or []
+        self.preload = preload
+        self.name_index = name_index
+        self.use_snapshot = use_snapshot
+        self.journal = journal
+        self.scrollback = scrollback
+
+        # Вывод копится в буфере и попадает в виджет пачками
+        self.output_buffer = []
+        self.output_buffer_size = 0
+        self.output_timer = QTimer()
+        self.output_timer.setSingleShot(True)
+        self.output_timer.timeout.connect(self.flush_output)
+
+        self.vfs_path = self.resolve_path(vfs_path) if vfs_path else None
+        self.script_path = self.resolve_path(script_path) if script_path else None
+
+        self.vfs = VFS()
+        self.shell = Shell(self.vfs, self.print_output)
+
+        # Долгие команды (grep) и загрузка VFS выполняются в отдельных
+        # потоках; команды, введенные в это время, ждут в очереди
+        self.background_shell = None
+        self.loading = False
+        self.pending_commands = deque()
+        self.background_output = BackgroundOutput()
+        self.background_output.text.connect(self.print_output)
+        self.background_output.finished.connect(self.background_finished)
+
+        self.loader_signals = LoaderSignals()
+        self.loader_signals.text.connect(self.print_output)
+        self.loader_signals.progress.connect(self.show_load_progress)
+        self.loader_signals.finished.connect(self.vfs_loaded)
+
+        self.setup_ui()
+
+        self.script_commands = []
+        self.current_script_line = 0
+        self.script_timer = QTimer()
+        self.script_timer.timeout.connect(self.execute_script_line)
+
+        self.print_startup_info()
+        self.load_vfs()
+
+        if self.script_path:
+            self.load_script()
+
+    def resolve_path(self, path):
+        """Преобразует относительный путь в абсолютный"""
+        return resolve_path(path)
+
+    def load_vfs(self):
+        """
+        Загрузка VFS в фоновом потоке
+
+        Окно доступно сразу; ход загрузки показывается в строке состояния,
+        а введенные до ее окончания команды ждут в очереди.
+        """
+        self.loading = True
+        self.load_started = time.perf_counter()
+        self.statusBar().showMessage("Загрузка VFS...")
+        threading.Thread(target=self.run_load, daemon=True).start()
+
+    def run_load(self):
+        """Тело потока загрузки: результат передается в окно сигналами"""
+        signals = self.loader_signals
+        vfs, loaded = load_vfs(self.vfs_path, signals.text.emit,
+                               lazy=self.lazy, use_snapshot=self.use_snapshot,
+                               journal=self.journal, progress=signals.progress.emit,
+                               compact=self.compact, mounts=self.mounts,
+                               preload=self.preload, name_index=self.name_index)
+        signals.finished.emit(vfs, loaded)
+
+    def show_load_progress(self, nodes, done_bytes, total_bytes):
+        """Отображение прогресса загрузки в строке состояния"""
+        percent = f" ({done_bytes * 100 // total_bytes}%)" if total_bytes else ""
+        self.statusBar().showMessage(f"Загрузка VFS: {nodes} узлов{percent}")
+
+    def vfs_loaded(self, vfs, loaded):
+        """Окончание загрузки: подключение дерева и выполнение команд из очереди"""
+        self.vfs = vfs
+        self.shell.vfs = vfs
+        self.loading = False
+
+        elapsed = time.perf_counter() - self.load_started
+        if loaded:
+            self.statusBar().showMessage(f"VFS загружена за {elapsed:.2f} с", 5000)
+        else:
+            self.statusBar().showMessage("Не удалось загрузить VFS, используется VFS по умолчанию")
+        self.update_path_display()
+        self.run_pending_commands()
+
+    def is_busy(self):
+        """Выполняется ли загрузка VFS или фоновая команда"""
+        return self.loading or self.background_shell is not None
+
+    def setup_ui(self):
+        """Настройка пользовательского интерфейса"""
+        central_widget = QWidget()
+        self.setCentralWidget(central_widget)
+        layout = QVBoxLayout(central_widget)
+
+        # Листинг текущей директории: отрисовываются только видимые строки
+        self.directory_model = DirectoryModel(self)
+        self.directory_view = QListView()
+        self.directory_view.setModel(self.directory_model)
+        self.directory_view.setUniformItemSizes(True)
+        self.directory_view.setFont(QFont("Consolas", 10))
+        self.directory_view.setStyleSheet("background-color: #252526; color: #d4d4d4;")
+        self.directory_view.doubleClicked.connect(self.open_listed_node)
+
+        self.output_area = QPlainTextEdit()
+        self.output_area.setReadOnly(True)
+        # Старые строки вытесняются, как в кольцевом буфере
+        self.output_area.setMaximumBlockCount(self.scrollback)
+        self.output_area.setFont(QFont("Consolas", 10))
+        self.output_area.setStyleSheet("background-color: #1e1e1e; color: #d4d4d4;")
+
+        splitter = QSplitter(Qt.Horizontal)
+        splitter.addWidget(self.directory_view)
+        splitter.addWidget(self.output_area)
+        splitter.setSizes([200, 600])
+        layout.addWidget(splitter)
+
+        status_frame = QWidget()
+        status_layout = QHBoxLayout(status_frame)
+        status_layout.setContentsMargins(5, 2, 5, 2)
+
+        status_label = QLabel("Текущий путь:")
+        status_label.setStyleSheet("color: #569cd6; font-weight: bold;")
+        status_layout.addWidget(status_label)
+
+        self.path_label = QLabel("/")
+        self.path_label.setStyleSheet("color: #ce9178;")
+        status_layout.addWidget(self.path_label)
+        status_layout.addStretch()
+
+        layout.addWidget(status_frame)
+
+        input_frame = QWidget()
+        input_layout = QHBoxLayout(input_frame)
+
+        self.prompt_label = QLabel(">>>")
+        self.prompt_label.setStyleSheet("color: #569cd6; font-weight: bold;")
+        input_layout.addWidget(self.prompt_label)
+
+        self.input_entry = QLineEdit()
+        self.input_entry.setStyleSheet("background-color: #3c3c3c; color: #d4d4d4;")
+        self.input_entry.returnPressed.connect(self.execute_command)
+        # Tab в поле ввода дополняет команду или путь, а не переключает фокус
+        self.input_entry.installEventFilter(self)
+        input_layout.addWidget(self.input_entry)
+
+        self.execute_button = QPushButton("Выполнить")
+        self.execute_button.clicked.connect(self.execute_command)
+        self.execute_button.setStyleSheet("background-color: #0e639c; color: white;")
+        input_layout.addWidget(self.execute_button)
+
+        self.cancel_button = QPushButton("Отмена")
+        self.cancel_button.clicked.connect(self.cancel_background)
+        self.cancel_button.setStyleSheet("background-color: #6e2c2c; color: white;")
+        self.cancel_button.setEnabled(False)
+        input_layout.addWidget(self.cancel_button)
+
+        layout.addWidget(input_frame)
+
+        QShortcut(QKeySequence(Qt.Key_Escape), self, activated=self.cancel_background)
+
+        self.input_entry.setFocus()
+
+    def eventFilter(self, watched, event):
+        """Перехват Tab в поле ввода для дополнения"""
+        if (watched is self.input_entry and event.type() == QEvent.KeyPress
+                and event.key() == Qt.Key_Tab):
+            self.complete_input()
+            return True
+        return super().eventFilter(watched, event)
+
+    def complete_input(self):
+        """Дополнение текста до курсора в поле ввода"""
+        if self.loading:
+            return
+        text = self.input_entry.text()
+        position = self.input_entry.cursorPosition()
+        completed, matches = self.shell.complete(text[:position])
+        if completed != text[:position]:
+            self.input_entry.setText(completed + text[position:])
+            self.input_entry.setCursorPosition(len(completed))
+        elif matches:
+            self.print_output("  ".join(matches) + "\n")
+
+    def print_output(self, text):
+        """Вывод текста в область вывода (через буфер)"""
+        self.output_buffer.append(text)
+        self.output_buffer_size += len(text)
+
+        if self.output_buffer_size >= OUTPUT_FLUSH_THRESHOLD:
+            self.flush_output()
+        elif not self.output_timer.isActive():
+            self.output_timer.start(OUTPUT_FLUSH_INTERVAL_MS)
+
+    def flush_output(self):
+        """Сброс накопленного вывода в область вывода одной вставкой"""
+        self.output_timer.stop()
+        if not self.output_buffer:
+            return
+
+        text = "".join(self.output_buffer)
+        self.output_buffer = []
+        self.output_buffer_size = 0
+
+        self.output_area.moveCursor(QTextCursor.End)
+        self.output_area.insertPlainText(text)
+        self.output_area.moveCursor(QTextCursor.End)
+
+    def update_path_display(self):
+        """Обновление отображения текущего пути и листинга директории"""
+        self.path_label.setText(self.shell.cursor.current_path)
+        self.directory_model.set_directory(self.shell.cursor.current_directory)
+
+    def open_listed_node(self, index):
+        """Двойной щелчок в листинге: переход в директорию или вывод файла"""
+        node = self.directory_model.node(index.row())
+        if node is None:
+            return
+        command = "cd" if isinstance(node, VFSDirectory) else "cat"
+        self.input_entry.setText(f"{command} {shlex.quote(node.name)}")
+        self.execute_command()
+
+    def print_startup_info(self):
+        """Вывод информации о запуске и параметрах конфигурации"""
+        self.print_output("Добро пожаловать в эмулятор командной оболочки!\n")
+        self.print_output("=" * 60 + "\n")
+        self.print_output("КОНФИГУРАЦИЯ ПРИ ЗАПУСКЕ:\n")
+
+        if self.vfs_path:
+            self.print_output(f"  VFS путь: {self.vfs_path}\n")
+        else:
+            self.print_output("  VFS путь: не указан (используется VFS по умолчанию)\n")
+
+        if self.script_path:
+            self.print_output(f"  Скрипт: {self.script_path}\n")
+        else:
+            self.print_output("  Скрипт: не указан\n")
+
+        self.print_output("=" * 60 + "\n")
+        self.print_output(f"Доступные команды: {', '.join(COMMANDS)}\n")
+        self.print_output("Введите команду ниже:\n" + "-" * 40 + "\n")
+
+        self.update_path_display()
+
+    def execute_command(self):
+        """Выполнение команды из поля ввода"""
+        command_text = self.input_entry.text().strip()
+
+        if not command_text:
+            return
+
+        self.input_entry.clear()
+
+        if self.is_busy():
+            self.pending_commands.append(command_text)
+            self.print_output(f"(в очереди) {command_text}\n")
+            return
+
+        self.print_output(f">>> {command_text}\n")
+        self.process_command(command_text)
+
+    def process_command(self, command_text):
+        """Обработка и выполнение команды"""
+        record = compile_command(command_text)
+        if record is not None:
+            self.run_record(record)
+
+    def run_record(self, record):
+        """Выполнение скомпилированной команды: долгие команды - в фоновом потоке"""
+        if record.background and record.error is None:
+            self.start_background(record)
+            return
+
+        self.shell.execute(record)
+        self.after_command()
+
+    def start_background(self, record):
+        """Запуск долгой команды в отдельном потоке"""
+        self.background_shell = Shell(self.vfs, self.background_output.text.emit, self.shell.cursor)
+        self.cancel_button.setEnabled(True)
+        threading.Thread(target=self.run_background, args=(self.background_shell, record),
+                         daemon=True).start()
+
+    def run_background(self, shell, record):
+        """Тело фонового потока: вывод передается в окно сигналами"""
+        try:
+            shell.execute(record)
+        except Exception as e:
+            shell.print_output(f"Пропуск ошибочной команды: {str(e)}\n")
+            shell.print_output(SEPARATOR)
+        finally:
+            self.background_output.finished.emit()
+
+    def background_finished(self):
+        """Завершение фоновой команды: выполнение команд из очереди"""
+        self.background_shell = None
+        self.cancel_button.setEnabled(False)
+        self.after_command()
+        self.run_pending_commands()
+
+    def run_pending_commands(self):
+        """Выполнение команд, введенных во время загрузки или фоновой команды"""
+        while self.pending_commands and not self.is_busy():
+            command_text = self.pending_commands.popleft()
+            self.print_output(f">>> {command_text}\n")
+            self.process_command(command_text)
+
+    def cancel_background(self):
+        """Прерывание выполняющейся фоновой команды"""
+        if self.background_shell is not None:
+            self.background_shell.cancel_event.set()
+
+    def after_command(self):
+        """Обновление окна после выполнения команды"""
+        self.update_path_display()
+
+        if self.shell.exit_requested:
+            self.script_timer.stop()
+            self.close()
+
+    def load_script(self):
+        """Загрузка стартового скрипта"""
+        try:
+            script_file = Path(self.script_path)
+            if not script_file.exists():
+                self.print_output(f"ОШИБКА: Скрипт '{self.script_path}' не найден\n")
+                return False
+
+            self.script_commands = compile_script(script_file)
+
+            self.print_output(f"Загружен скрипт: {self.script_path}\n")
+            self.print_output(f"Найдено команд: {len(self.script_commands)}\n")
+            errors = script_errors(self.script_commands)
+            if errors:
+                self.print_output(f"Найдено ошибок: {len(errors)}\n")
+                for error in errors:
+                    self.print_output(f"  {error}\n")
+            self.print_output("Запуск скрипта...\n" + "=" * 40 + "\n")
+
+            QTimer.singleShot(1000, self.start_script_execution)
+            return True
+
+        except Exception as e:
+            self.print_output(f"ОШИБКА загрузки скрипта: {str(e)}\n")
+            return False
+
+    def start_script_execution(self):
+        """Начало выполнения скрипта"""
+        if self.script_commands:
+            self.script_timer.start(500)
+
+    def execute_script_line(self):
+        """Выполнение очередной команды из скрипта"""
+        if self.is_busy():
+            # Ждем окончания загрузки VFS или фоновой команды
+            return
+
+        if self.current_script_line >= len(self.script_commands):
+            self.script_timer.stop()
+            self.print_output("=" * 40 + "\n")
+            self.print_output("Выполнение скрипта завершено!\n")
+            self.print_output("-" * 40 + "\n")
+            return
+
+        record = self.script_commands[self.current_script_line]
+        self.current_script_line += 1
+
+        self.print_output(f">>> {record.text}\n")
+
+        try:
+            self.run_record(record)
+        except Exception as e:
+            self.print_output(f"Пропуск ошибочной команды: {str(e)}\n")
+            self.print_output(SEPARATOR)
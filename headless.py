@@ -0,0 +1,97 @@
+"""
+Выполнение скриптов без графического интерфейса
+
+Модуль не импортирует PyQt5: команды выполняются подряд без задержек,
+вывод идет в stdout, а итоговая статистика - в stderr.
+"""
+
+import sys
+import time
+
+from shell import SEPARATOR, Shell, compile_script, load_vfs, resolve_path, script_errors
+
+# Коды завершения
+EXIT_OK = 0
+EXIT_COMMAND_FAILED = 1
+EXIT_LOAD_FAILED = 2
+
+
+def _print_error(text):
+    sys.stderr.write(text)
+
+
+def run_headless(vfs_path=None, script_path=None, lazy=False, use_snapshot=True,
+                 output=None, journal=False, compact=False, mounts=None, preload=False,
+                 name_index=False) -> int:
+    """
+    Выполнить скрипт против VFS с максимальной скоростью
+
+    Args:
+        vfs_path: Путь к XML-образу VFS (None - VFS по умолчанию)
+        script_path: Путь к скрипту
+        lazy: Ленивая загрузка содержимого файлов
+        use_snapshot: Использовать бинарный снимок рядом с образом
+        output: Поток для вывода команд (по умолчанию stdout)
+        journal: Проиграть журнал изменений образа и дописывать в него
+        compact: Хранить дерево в компактных таблицах
+        mounts: Пары (образ, путь в VFS) для подключения как точки монтирования
+        preload: Сразу загрузить образы точек монтирования параллельно
+        name_index: Построить в фоне индекс имен для locate
+
+    Returns:
+        int: Код завершения: 0 - все команды выполнены успешно,
+        1 - хотя бы одна команда завершилась ошибкой,
+        2 - не удалось загрузить VFS или скрипт
+    """
+    output = output or sys.stdout
+    write = output.write
+
+    if not script_path:
+        _print_error("ОШИБКА: Для режима без интерфейса нужен --script\n")
+        return EXIT_LOAD_FAILED
+
+    vfs_path = resolve_path(vfs_path, log=lambda text: None) if vfs_path else None
+    script_path = resolve_path(script_path, log=lambda text: None)
+
+    vfs, loaded = load_vfs(vfs_path, _print_error, lazy=lazy, use_snapshot=use_snapshot,
+                           journal=journal, compact=compact, mounts=mounts, preload=preload,
+                           name_index=name_index)
+    if not loaded:
+        return EXIT_LOAD_FAILED
+
+    try:
+        commands = compile_script(script_path)
+    except (OSError, UnicodeDecodeError) as e:
+        _print_error(f"ОШИБКА загрузки скрипта '{script_path}': {e}\n")
+        return EXIT_LOAD_FAILED
+
+    for error in script_errors(commands):
+        _print_error(f"{error}\n")
+
+    shell = Shell(vfs, write)
+    failed = 0
+    executed = 0
+    started = time.perf_counter()
+
+    for record in commands:
+        write(f">>> {record.text}\n")
+        executed += 1
+        try:
+            if not shell.execute(record):
+                failed += 1
+        except Exception as e:
+            write(f"Пропуск ошибочной команды: {str(e)}\n")
+            write(SEPARATOR)
+            failed += 1
+
+        if shell.exit_requested:
+            break
+
+    output.flush()
+    elapsed = time.perf_counter() - started
+    rate = executed / elapsed if elapsed > 0 else float('inf')
+    _print_error(f"Выполнено команд: {executed} (с ошибками: {failed}) "
+                 f"за {elapsed:.3f} с, {rate:.0f} команд/с\n")
+
+    return EXIT_COMMAND_FAILED if failed else EXIT_OK
+
@@ -0,0 +1,260 @@
+"""
+Журнал изменений VFS, дописываемый в конец файла
+
+Изменения (mkdir, write, rm) не переписывают XML-образ целиком, а
+добавляются в журнал рядом с ним, по одной JSON-записи на строку:
+
+    {"format": "vfs-journal", "version": 1, "base_size": ..., "base_mtime_ns": ...}
+    {"op": "mkdir", "path": "/a"}
+    {"op": "write", "path": "/a/x", "data": "<base64>", "append": false}
+    {"op": "rm", "path": "/a/x"}
+
+Первая строка - заголовок с размером и mtime образа, поверх которого
+записан журнал. При загрузке журнал проигрывается поверх образа, а
+уплотнение (compact) в фоне записывает новый образ и оставляет в журнале
+только записи, сделанные после начала уплотнения.
+"""
+
+import base64
+import json
+import os
+import threading
+from typing import Callable, Iterator, Optional, Tuple
+
+import metrics
+from vfs import VFS, VFSError
+
+FORMAT = "vfs-journal"
+VERSION = 1
+
+JOURNAL_SUFFIX = ".journal"
+
+
+class JournalError(Exception):
+    """Журнал поврежден или записан для другой версии образа"""
+
+
+def journal_path_for(xml_path: str) -> str:
+    """Путь к журналу, лежащему рядом с XML-образом"""
+    return xml_path + JOURNAL_SUFFIX
+
+
+def _base_stamp(base_path: str) -> Tuple[int, int]:
+    stat = os.stat(base_path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _header(base_path: str) -> bytes:
+    size, mtime = _base_stamp(base_path)
+    header = {"format": FORMAT, "version": VERSION, "base_size": size, "base_mtime_ns": mtime}
+    return (json.dumps(header) + "\n").encode('utf-8')
+
+
+class Journal:
+    """
+    Журнал изменений одного XML-образа
+
+    Каждая запись сбрасывается на диск сразу, поэтому стоимость сохранения
+    изменения пропорциональна его размеру, а не размеру образа. Оборванная
+    последняя строка (сбой во время записи) при открытии отбрасывается.
+    """
+
+    def __init__(self, path: str, base_path: str):
+        self.path = path
+        self.base_path = base_path
+        self._lock = threading.Lock()
+        self._compacting = False
+        self._open()
+
+    def _open(self):
+        """Открыть журнал на дозапись, создав или проверив его"""
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            with open(self.path, 'wb') as f:
+                f.write(_header(self.base_path))
+        else:
+            with open(self.path, 'rb') as f:
+                try:
+                    header = json.loads(f.readline())
+                except ValueError:
+                    raise JournalError("заголовок журнала поврежден")
+            if header.get("format") != FORMAT or header.get("version") != VERSION:
+                raise JournalError("неизвестный формат журнала")
+            if (header.get("base_size"), header.get("base_mtime_ns")) != _base_stamp(self.base_path):
+                raise JournalError("журнал записан для другой версии образа")
+            self._drop_torn_tail()
+
+        self._file = open(self.path, 'ab')
+
+    def _drop_torn_tail(self):
+        """Отрезать недописанную последнюю строку"""
+        with open(self.path, 'rb+') as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            position = size
+            while position > 0:
+                step = min(4096, position)
+                f.seek(position - step)
+                chunk = f.read(step)
+                newline = chunk.rfind(b"\n")
+                if newline >= 0:
+                    position = position - step + newline + 1
+                    break
+                position -= step
+            if position != size:
+                f.truncate(position)
+
+    def append(self, operation: str, path: str, data: Optional[bytes] = None, **fields):
+        """Дописать запись об изменении и сбросить ее на диск"""
+        record = {"op": operation, "path": path}
+        if data is not None:
+            record["data"] = base64.b64encode(data).decode('ascii')
+        record.update(fields)
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode('utf-8')
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def records(self) -> Iterator[dict]:
+        """Записи журнала по порядку (без заголовка)"""
+        with open(self.path, 'rb') as f:
+            f.readline()
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    raise JournalError(f"поврежденная запись: {line[:80]!r}")
+
+    def replay(self, vfs: VFS) -> int:
+        """
+        Применить записи журнала к VFS, загруженной из базового образа
+
+        Returns:
+            int: Число примененных записей
+        """
+        journal, vfs.journal = vfs.journal, None
+        applied = 0
+        try:
+            for record in self.records():
+                apply_record(vfs, record)
+                applied += 1
+        finally:
+            vfs.journal = journal
+        return applied
+
+    def size(self) -> int:
+        """Текущий размер журнала в байтах"""
+        with self._lock:
+            return self._file.tell()
+
+    def compact(self, vfs: VFS,
+                done: Optional[Callable[[bool], None]] = None) -> Optional[threading.Thread]:
+        """
+        Уплотнить журнал: в фоне записать новый образ и очистить журнал
+
+        Текущее состояние VFS фиксируется дешевым ответвлением (VFS.fork),
+        поэтому работа с VFS продолжается во время записи образа. Записи,
+        сделанные после начала уплотнения, переносятся в новый журнал.
+        Вызывать нужно из потока, который меняет VFS.
+
+        Args:
+            vfs: VFS, изменения которой пишутся в этот журнал
+            done: Вызывается по окончании с признаком успеха (из фонового потока)
+
+        Returns:
+            threading.Thread: Поток уплотнения или None, если оно уже идет
+        """
+        with self._lock:
+            if self._compacting:
+                return None
+            self._compacting = True
+            offset = self._file.tell()
+            frozen = vfs.fork()
+
+        def run():
+            ok = False
+            try:
+                ok = self._rewrite(frozen, offset)
+            except (OSError, JournalError) as e:
+                print(f"Ошибка уплотнения журнала: {e}")
+            finally:
+                with self._lock:
+                    self._compacting = False
+                if done is not None:
+                    done(ok)
+
+        # Не демон: выход из программы дожидается записи образа
+        thread = threading.Thread(target=run, name="journal-compact")
+        thread.start()
+        return thread
+
+    def _rewrite(self, frozen: VFS, offset: int) -> bool:
+        """Записать новый образ и журнал с записями после offset, затем подменить оба"""
+        image_tmp = self.base_path + ".compact"
+        journal_tmp = self.path + ".tmp"
+        if not frozen.save_to_xml(image_tmp):
+            return False
+
+        with self._lock:
+            self._file.flush()
+            # Переименование сохраняет размер и mtime, поэтому заголовок
+            # можно снять с временного образа заранее
+            with open(self.path, 'rb') as source, open(journal_tmp, 'wb') as target:
+                target.write(_header(image_tmp))
+                source.seek(offset)
+                while True:
+                    chunk = source.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    target.write(chunk)
+            self._file.close()
+            os.replace(image_tmp, self.base_path)
+            os.replace(journal_tmp, self.path)
+            self._file = open(self.path, 'ab')
+        return True
+
+    def close(self):
+        """Закрыть файл журнала"""
+        with self._lock:
+            self._file.close()
+
+
+def apply_record(vfs: VFS, record: dict):
+    """Применить одну запись журнала к VFS"""
+    operation = record.get("op")
+    path = record.get("path")
+    try:
+        if operation == "mkdir":
+            vfs.make_directory(path, cwd="/")
+        elif operation == "write":
+            vfs.write_file(path, base64.b64decode(record.get("data", "")), cwd="/",
+                           append=record.get("append", False))
+        elif operation == "rm":
+            vfs.remove(path, cwd="/", recursive=True)
+        else:
+            raise JournalError(f"неизвестная операция '{operation}'")
+    except VFSError as e:
+        raise JournalError(f"запись {operation} {path} не применяется к образу: {e}")
+
+
+def open_journal(vfs: VFS, xml_path: str) -> Tuple[Journal, int]:
+    """
+    Открыть журнал образа, проиграть его поверх VFS и подключить к ней
+
+    Returns:
+        Tuple[Journal, int]: Журнал и число проигранных записей
+
+    Raises:
+        JournalError: Журнал поврежден, не подходит к образу или не применяется
+        OSError: Журнал не удалось открыть
+    """
+    journal = Journal(journal_path_for(xml_path), xml_path)
+    try:
+        with metrics.timer("load.journal"):
+            applied = journal.replay(vfs)
+    except JournalError:
+        journal.close()
+        raise
+    vfs.journal = journal
+    return journal, applied
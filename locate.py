@@ -0,0 +1,303 @@
+"""
+Глобальный индекс имен файлов для команды locate
+
+Индекс строится один раз по всему дереву (при загрузке с --name-index
+или при первом вызове locate) в фоновом потоке и хранит все узлы
+плоскими таблицами: имена, отсортированные по возрастанию, номер
+директории каждого имени и массив позиций, отсортированный по
+перевернутым именам. Точное имя, префикс и суффикс находятся бинарным
+поиском за O(log n), произвольный шаблон сужается по своей постоянной
+части и проверяется fnmatch только на найденном диапазоне.
+
+Индекс строится по ответвлению VFS (VFS.fork), поэтому изменения во время
+построения его не затрагивают. Один индекс исходной VFS общий для всех ее
+ответвлений (например, сеансов сервера): узлы, созданные в версии после
+ответвления или построения, версия хранит сама (VFS.names_created), а
+удаленные отсеиваются при выдаче - каждый результат перед выводом
+проверяется по индексу путей этой версии. Содержимое точек монтирования
+в индекс не попадает, только сами точки.
+"""
+
+import bisect
+import fnmatch
+import re
+import threading
+import time
+from array import array
+from itertools import chain
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import metrics
+from vfs import VFS, VFSDirectory, join_path
+
+# Символы шаблона fnmatch, после которых имя перестает совпадать буквально
+WILDCARDS = "*?["
+
+# Построение индекса, запущенное locate или load_vfs (не больше одного на исходную VFS)
+_attach_lock = threading.Lock()
+
+
+def _matcher(pattern: str) -> Callable[[str], bool]:
+    """Функция проверки имени по шаблону (с учетом регистра, как find -name)"""
+    match = re.compile(fnmatch.translate(pattern)).match
+    return lambda name: match(name) is not None
+
+
+def _literal_parts(pattern: str) -> Tuple[str, str, bool]:
+    """
+    Постоянные начало и конец шаблона
+
+    Returns:
+        Tuple[str, str, bool]: Префикс до первого спецсимвола, суффикс после
+        последнего и признак шаблона без спецсимволов (точное имя)
+    """
+    positions = [pattern.find(char) for char in WILDCARDS if char in pattern]
+    if not positions:
+        return pattern, pattern, True
+    prefix = pattern[:min(positions)]
+    tail_start = max(pattern.rfind(char) for char in "*?]") + 1
+    suffix = pattern[tail_start:]
+    if any(char in suffix for char in "*?[]"):
+        suffix = ""
+    return prefix, suffix, False
+
+
+def _successor(prefix: str) -> Optional[str]:
+    """Наименьшая строка больше всех строк с этим префиксом (None - такой нет)"""
+    while prefix:
+        last = ord(prefix[-1])
+        if last < 0x10FFFF:
+            return prefix[:-1] + chr(last + 1)
+        prefix = prefix[:-1]
+    return None
+
+
+def iter_names(root: VFSDirectory) -> Iterator[Tuple[str, bool]]:
+    """
+    Обойти дерево, не заходя в точки монтирования
+
+    Yields:
+        (полный путь, является ли узел директорией)
+    """
+    stack = [(root, "/")]
+    while stack:
+        directory, path = stack.pop()
+        for child in directory.children.values():
+            child_path = join_path(path, child.name)
+            is_directory = isinstance(child, VFSDirectory)
+            yield child_path, is_directory
+            if is_directory and child.persistent:
+                stack.append((child, child_path))
+
+
+class NameIndex:
+    """
+    Индекс имен всех узлов дерева: имя -> полные пути
+
+    Пока индекс строится (ready не установлен), search ничего не находит;
+    locate в это время ищет обходом дерева.
+
+    Args:
+        removals: Число удалений в исходной VFS на момент построения
+    """
+
+    def __init__(self, removals: int = 0):
+        # Имена всех узлов по возрастанию; при равных именах - по номеру директории
+        self._names: List[str] = []
+        # Номер директории (в _directories) и тип узла для каждого имени
+        self._parents = array('I')
+        self._kinds = bytearray()
+        # Позиции в _names, упорядоченные по перевернутым именам
+        self._by_suffix = array('I')
+        # Номер директории -> ее полный путь и обратно
+        self._directories: List[str] = []
+        self._directory_numbers: Dict[str, int] = {}
+        self.removals = removals
+        self._lock = threading.Lock()
+        self.ready = threading.Event()
+        self.build_seconds: Optional[float] = None
+
+    def __len__(self):
+        return len(self._names)
+
+    def build(self, root: VFSDirectory):
+        """Построить индекс по дереву (долго: вызывается в фоновом потоке)"""
+        started = time.perf_counter()
+        with metrics.timer("load.names"):
+            names: List[str] = []
+            parents = array('I')
+            kinds = bytearray()
+            directories = ["/"]
+            # Директории обходятся в порядке номеров, поэтому при
+            # устойчивой сортировке одинаковые имена идут по номеру директории
+            queue: List[Optional[VFSDirectory]] = [root]
+            for number, path in enumerate(directories):
+                directory = queue[number]
+                queue[number] = None
+                for child in directory.children.values():
+                    is_directory = isinstance(child, VFSDirectory)
+                    names.append(child.name)
+                    parents.append(number)
+                    kinds.append(is_directory)
+                    if is_directory and child.persistent:
+                        directories.append(join_path(path, child.name))
+                        queue.append(child)
+
+            order = sorted(range(len(names)), key=names.__getitem__)
+            names = [names[position] for position in order]
+            parents = array('I', [parents[position] for position in order])
+            kinds = bytearray(kinds[position] for position in order)
+            by_suffix = array('I', sorted(range(len(names)), key=lambda position: names[position][::-1]))
+            directory_numbers = {path: number for number, path in enumerate(directories)}
+
+        with self._lock:
+            self._names, self._parents, self._kinds = names, parents, kinds
+            self._by_suffix, self._directories = by_suffix, directories
+            self._directory_numbers = directory_numbers
+        self.build_seconds = time.perf_counter() - started
+        self.ready.set()
+
+    def _path(self, position: int) -> str:
+        return join_path(self._directories[self._parents[position]], self._names[position])
+
+    def contains(self, path: str, is_directory: bool) -> bool:
+        """Есть ли узел в индексе"""
+        directory, _, name = path.rpartition('/')
+        number = self._directory_numbers.get(directory or "/")
+        if number is None:
+            return False
+        # Одинаковые имена упорядочены по номеру директории
+        names = self._names
+        start = bisect.bisect_left(names, name)
+        end = bisect.bisect_right(names, name, start)
+        position = bisect.bisect_left(range(start, end), number, key=self._parents.__getitem__) + start
+        return (position < end and self._parents[position] == number
+                and bool(self._kinds[position]) == is_directory)
+
+    def _name_range(self, prefix: str) -> Tuple[int, int]:
+        names = self._names
+        start = bisect.bisect_left(names, prefix)
+        successor = _successor(prefix)
+        end = len(names) if successor is None else bisect.bisect_left(names, successor, start)
+        return start, end
+
+    def _suffix_range(self, suffix: str) -> Tuple[int, int]:
+        names = self._names
+        key = lambda position: names[position][::-1]
+        reversed_suffix = suffix[::-1]
+        start = bisect.bisect_left(self._by_suffix, reversed_suffix, key=key)
+        successor = _successor(reversed_suffix)
+        end = (len(names) if successor is None
+               else bisect.bisect_left(self._by_suffix, successor, start, key=key))
+        return start, end
+
+    def search(self, pattern: str) -> Iterator[Tuple[str, bool]]:
+        """
+        Найти узлы, имя которых совпадает с шаблоном fnmatch
+
+        Результаты выдаются по мере поиска в порядке имен (для шаблонов
+        вида *суффикс - в порядке перевернутых имен). Узлы, созданные и
+        удаленные после построения, не учитываются.
+
+        Yields:
+            (полный путь, является ли узел директорией)
+        """
+        prefix, suffix, exact = _literal_parts(pattern)
+        match = None if exact else _matcher(pattern)
+
+        if exact or prefix:
+            start, end = self._name_range(prefix)
+            if exact:
+                end = bisect.bisect_right(self._names, prefix, start, end)
+            positions = range(start, end)
+            if suffix and not exact:
+                suffix_start, suffix_end = self._suffix_range(suffix)
+                if suffix_end - suffix_start < end - start:
+                    positions = map(self._by_suffix.__getitem__, range(suffix_start, suffix_end))
+        elif suffix:
+            start, end = self._suffix_range(suffix)
+            positions = map(self._by_suffix.__getitem__, range(start, end))
+        else:
+            positions = range(len(self._names))
+
+        names = self._names
+        for position in positions:
+            if match is None or match(names[position]):
+                yield self._path(position), bool(self._kinds[position])
+
+
+def _shared_index(vfs: VFS) -> Optional[NameIndex]:
+    """Индекс исходной VFS, если эта версия может им пользоваться"""
+    origin = vfs.names_origin
+    index = origin.names
+    if origin is vfs or index is None:
+        return index
+    # Узлы, удаленные в исходной VFS после ответвления, но до построения
+    # индекса, в него не попали, хотя в этой версии они есть
+    return index if index.removals <= vfs.origin_removals else None
+
+
+def attach_name_index(vfs: VFS, background: bool = True) -> NameIndex:
+    """
+    Построить индекс имен (если его еще нет) и подключить его к VFS
+
+    Индекс строится по ответвлению исходной VFS (VFS.names_origin) и
+    становится общим для нее и всех ее ответвлений. Если исходная VFS
+    после ответвления теряла узлы, эта версия строит собственный индекс.
+
+    Args:
+        vfs: VFS
+        background: Строить в фоновом потоке и вернуться сразу
+
+    Returns:
+        NameIndex: Индекс (при background=True, возможно, еще не готовый)
+    """
+    with _attach_lock:
+        index = _shared_index(vfs)
+        if index is not None:
+            return index
+        origin = vfs.names_origin
+        if origin is not vfs and (origin.names is not None
+                                  or origin.removals != vfs.origin_removals):
+            origin = vfs.names_origin = vfs
+        # Подключается до ответвления: узлы, созданные между ними, попадут
+        # в список созданных, а повторы с индексом отсеются при выдаче
+        index = origin.names = NameIndex(origin.removals)
+        origin.names_created = {}
+        root = origin.fork().root
+
+    if background:
+        threading.Thread(target=index.build, args=(root,), name="name-index",
+                         daemon=True).start()
+    else:
+        index.build(root)
+    return index
+
+
+def locate(vfs: VFS, pattern: str, node_type: Optional[str] = None) -> Iterator[str]:
+    """
+    Полные пути существующих узлов, имя которых совпадает с шаблоном
+
+    Если индекс еще не готов, дерево обходится целиком (как find).
+
+    Args:
+        vfs: VFS
+        pattern: Шаблон имени fnmatch
+        node_type: 'f' - только файлы, 'd' - только директории
+    """
+    index = _shared_index(vfs)
+    match = _matcher(pattern)
+    if index is not None and index.ready.is_set():
+        created = [(path, is_directory) for path, is_directory in list(vfs.names_created.items())
+                   if match(path.rpartition('/')[2]) and not index.contains(path, is_directory)]
+        candidates = chain(index.search(pattern), created)
+    else:
+        candidates = ((path, is_directory) for path, is_directory in iter_names(vfs.root)
+                      if match(path.rpartition('/')[2]))
+
+    for path, is_directory in candidates:
+        if node_type is not None and is_directory != (node_type == "d"):
+            continue
+        node = vfs.index.get(path)
+        if node is not None and isinstance(node, VFSDirectory) == is_directory:
+            yield path
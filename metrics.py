@@ -0,0 +1,178 @@
+"""
+Встроенные метрики: гистограммы задержек и счетчики
+
+По умолчанию сбор выключен, и места замеров проверяют только флаг
+enabled, не вызывая таймер. Включается через enable() (параметр
+--metrics). Имена метрик:
+
+    command.<имя>     время выполнения команды оболочки
+    load.<фаза>       фазы загрузки: parse, snapshot, index, journal
+    decode            декодирование содержимого файла
+    decode_cache.hit, decode_cache.miss, decode.bytes - счетчики
+"""
+
+import json
+import math
+import threading
+import time
+from typing import Dict, List, Optional
+
+# Проверяется в местах замеров; меняется только через enable()
+enabled = False
+
+# Границы корзин гистограмм растут в 2^(1/4) раза от 1 мкс:
+# погрешность перцентилей не больше ~19%
+BUCKET_BASE = 1e-6
+BUCKETS_PER_DOUBLING = 4
+BUCKET_COUNT = 4 * 40
+
+PERCENTILES = (0.5, 0.9, 0.99)
+
+
+class Histogram:
+    """Гистограмма длительностей с логарифмическими корзинами"""
+
+    def __init__(self):
+        self.counts = [0] * BUCKET_COUNT
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        if seconds <= BUCKET_BASE:
+            bucket = 0
+        else:
+            bucket = min(BUCKET_COUNT - 1,
+                         int(math.log2(seconds / BUCKET_BASE) * BUCKETS_PER_DOUBLING) + 1)
+        self.counts[bucket] += 1
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+    def percentile(self, fraction: float) -> float:
+        """Оценка перцентиля по верхней границе корзины"""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(fraction * self.count))
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                upper = BUCKET_BASE * 2 ** (bucket / BUCKETS_PER_DOUBLING)
+                return min(max(upper, self.min), self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        result = {
+            "count": self.count,
+            "total_s": self.total,
+            "mean_s": self.total / self.count if self.count else 0.0,
+            "min_s": self.min if self.count else 0.0,
+            "max_s": self.max,
+        }
+        for fraction in PERCENTILES:
+            result[f"p{round(fraction * 100)}_s"] = self.percentile(fraction)
+        return result
+
+
+_lock = threading.Lock()
+_histograms: Dict[str, Histogram] = {}
+_counters: Dict[str, int] = {}
+
+
+def enable(flag: bool = True):
+    """Включить или выключить сбор метрик"""
+    global enabled
+    enabled = flag
+
+
+def observe(name: str, seconds: float):
+    """Добавить длительность в гистограмму name"""
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.observe(seconds)
+
+
+def increment(name: str, value: int = 1):
+    """Увеличить счетчик name"""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+class _Timer:
+    __slots__ = ("name", "started")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        observe(self.name, time.perf_counter() - self.started)
+        return False
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(name: str):
+    """Контекстный менеджер, замеряющий блок в гистограмму name (если сбор включен)"""
+    return _Timer(name) if enabled else _NULL_TIMER
+
+
+def reset():
+    """Сбросить все собранные метрики"""
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+def snapshot() -> dict:
+    """Текущие метрики в виде словаря для сериализации"""
+    with _lock:
+        return {
+            "enabled": enabled,
+            "histograms": {name: histogram.summary()
+                           for name, histogram in sorted(_histograms.items())},
+            "counters": dict(sorted(_counters.items())),
+        }
+
+
+def format_stats(prefix: Optional[str] = None) -> List[str]:
+    """Строки таблицы метрик для вывода командой stats"""
+    data = snapshot()
+    lines = []
+    histograms = {name: summary for name, summary in data["histograms"].items()
+                  if prefix is None or name.startswith(prefix)}
+    if histograms:
+        width = max(len(name) for name in histograms)
+        lines.append(f"{'метрика':{width}}  {'число':>8}  {'p50, мс':>10}  {'p90, мс':>10}  "
+                     f"{'p99, мс':>10}  {'макс, мс':>10}")
+        for name, summary in histograms.items():
+            lines.append(f"{name:{width}}  {summary['count']:>8}  "
+                         f"{summary['p50_s'] * 1000:>10.3f}  {summary['p90_s'] * 1000:>10.3f}  "
+                         f"{summary['p99_s'] * 1000:>10.3f}  {summary['max_s'] * 1000:>10.3f}")
+    for name, value in data["counters"].items():
+        if prefix is None or name.startswith(prefix):
+            lines.append(f"{name}: {value}")
+    return lines
+
+
+def dump(path: str):
+    """Записать метрики в JSON-файл"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(snapshot(), f, ensure_ascii=False, indent=2)
@@ -0,0 +1,217 @@
+"""
+Подключение XML-образов в точки монтирования дерева VFS
+
+Команда mount (и параметр --mount) добавляет в дерево директорию-заглушку
+MountDirectory. Образ разбирается только при первом обращении к ее
+содержимому (cd, ls, cat внутрь нее), поэтому время запуска зависит
+только от образов, которые действительно используются. Загруженное
+содержимое можно выгрузить (unload): заглушка остается в дереве и при
+следующем обращении загрузит образ заново.
+
+Несколько образов можно загрузить заранее и параллельно (preload). Разбор
+XML занимает интерпретатор целиком, поэтому он идет в пуле процессов, и
+каждый процесс пишет рядом со своим образом бинарный снимок; затем снимки
+подключаются через mmap в пуле потоков, уже без разбора.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from typing import Iterable, List, Optional, Tuple
+
+import metrics
+from vfs import VFS, VFSDirectory, VFSError, VFSNode, iter_subdirectories, join_path
+
+
+class MountDirectory(VFSDirectory):
+    """
+    Точка монтирования: директория, содержимое которой - корень XML-образа
+
+    Образ загружается при первом обращении к детям (children, get_child,
+    листинги) отдельной VFS с параметрами lazy, compact и use_snapshot;
+    пути директорий образа отсчитываются от точки монтирования.
+    Точка монтирования доступна только для чтения: ее содержимое не
+    попадает ни в журнал, ни в сохраняемый образ.
+    """
+
+    __slots__ = ("image_path", "lazy", "compact", "use_snapshot", "error", "load_seconds",
+                 "_root", "_lock")
+
+    indexed = False
+    persistent = False
+
+    def __init__(self, name: str, image_path: str, lazy: bool = False, compact: bool = False,
+                 use_snapshot: bool = True):
+        # VFSDirectory.__init__ не вызывается: children здесь - свойство
+        self.name = name
+        self.parent = None
+        self.path = "/" + name
+        self.index = None
+        self.owner = None
+        self._sorted_names = None
+        self.image_path = image_path
+        self.lazy = lazy
+        self.compact = compact
+        self.use_snapshot = use_snapshot
+        # Сообщение о неудачной загрузке (содержимое тогда пустое)
+        self.error: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self._root: Optional[VFSDirectory] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        """Загружен ли образ"""
+        return self._root is not None
+
+    def load(self) -> VFSDirectory:
+        """Корень содержимого образа; при первом вызове образ загружается"""
+        root = self._root
+        if root is not None:
+            return root
+        with self._lock:
+            if self._root is None:
+                self._root = self._load()
+            return self._root
+
+    def _load(self) -> VFSDirectory:
+        started = time.perf_counter()
+        vfs = VFS()
+        with metrics.timer("load.mount"):
+            loaded = vfs.load_image(self.image_path, lazy=self.lazy,
+                                    use_snapshot=self.use_snapshot, compact=self.compact)
+        if loaded:
+            root = vfs.root
+            self.error = None
+        else:
+            root = VFSDirectory("")
+            self.error = f"не удалось загрузить образ '{self.image_path}'"
+
+        # Пути директорий образа отсчитываются от точки монтирования, а
+        # собственный индекс вспомогательной VFS больше не нужен
+        root.path = self.path
+        for directory in iter_subdirectories(root):
+            directory.index = None
+            if not directory.indexed:
+                continue
+            for child in directory.children.values():
+                if isinstance(child, VFSDirectory):
+                    child.path = join_path(directory.path, child.name)
+
+        self.load_seconds = time.perf_counter() - started
+        return root
+
+    def unload(self) -> bool:
+        """
+        Выгрузить содержимое образа
+
+        Returns:
+            bool: Был ли образ загружен
+        """
+        with self._lock:
+            loaded = self._root is not None
+            self._root = None
+            self.load_seconds = None
+        return loaded
+
+    @property
+    def children(self):
+        return self.load().children
+
+    def add_child(self, node: VFSNode):
+        raise VFSError(f"Точка монтирования '{self.path}' доступна только для чтения")
+
+    def remove_child(self, name: str) -> Optional[VFSNode]:
+        raise VFSError(f"Точка монтирования '{self.path}' доступна только для чтения")
+
+    def get_child(self, name: str) -> Optional[VFSNode]:
+        return self.load().get_child(name)
+
+    def copy(self) -> VFSDirectory:
+        raise VFSError(f"Точка монтирования '{self.path}' доступна только для чтения")
+
+    def list_children(self) -> List[str]:
+        return self.load().list_children()
+
+    def child_count(self) -> int:
+        return self.load().child_count()
+
+    def name_range(self, start: int, end: int) -> List[str]:
+        return self.load().name_range(start, end)
+
+    def sorted_names(self) -> List[str]:
+        return self.load().sorted_names()
+
+    def prefix_range(self, prefix: str) -> Tuple[int, int]:
+        return self.load().prefix_range(prefix)
+
+    def list_page(self, offset: int = 0, limit: Optional[int] = None) -> List[VFSNode]:
+        return self.load().list_page(offset, limit)
+
+    def __str__(self):
+        # Листинг родителя не должен загружать образ
+        if not self.loaded:
+            return f"Directory: {self.name} (образ {os.path.basename(self.image_path)}, не загружен)"
+        return super().__str__()
+
+
+def parse_mount_spec(spec: str) -> Tuple[str, str]:
+    """
+    Разобрать параметр --mount вида ОБРАЗ:ПУТЬ
+
+    Разделителем считается последнее двоеточие: путь в VFS начинается
+    с '/', а двоеточие может встречаться в пути к образу.
+
+    Raises:
+        ValueError: Нет пути точки монтирования или образа
+    """
+    image_path, separator, path = spec.rpartition(":")
+    if not separator or not image_path or not path.startswith("/"):
+        raise ValueError(f"ожидается ОБРАЗ:/путь, получено '{spec}'")
+    return image_path, path
+
+
+def build_snapshot(image_path: str) -> bool:
+    """Разобрать образ и записать снимок рядом с ним (выполняется в процессе пула)"""
+    return VFS().load_image(image_path, lazy=True, use_snapshot=True)
+
+
+def preload(mounts: Iterable[MountDirectory], workers: Optional[int] = None) -> List[MountDirectory]:
+    """
+    Загрузить несколько точек монтирования параллельно
+
+    Образы без свежего снимка сначала разбираются в пуле процессов, которые
+    записывают снимки; затем все образы загружаются в пуле потоков.
+
+    Args:
+        mounts: Точки монтирования (уже загруженные пропускаются)
+        workers: Число процессов и потоков (по умолчанию - число ядер)
+
+    Returns:
+        List[MountDirectory]: Точки монтирования, загруженные этим вызовом
+    """
+    from snapshot import is_snapshot_fresh
+
+    pending = [mount for mount in mounts if not mount.loaded]
+    if not pending:
+        return []
+    workers = min(len(pending), workers or os.cpu_count() or 1)
+
+    stale = sorted({mount.image_path for mount in pending
+                    if mount.use_snapshot and not is_snapshot_fresh(mount.image_path)})
+    if len(stale) > 1 and workers > 1:
+        try:
+            # spawn: дочерние процессы не наследуют потоки и состояние Qt
+            with ProcessPoolExecutor(max_workers=min(workers, len(stale)),
+                                     mp_context=get_context("spawn")) as pool:
+                list(pool.map(build_snapshot, stale))
+        except (OSError, BrokenProcessPool):
+            # Снимки не построены - образы будут разобраны в потоках
+            pass
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mount-preload") as pool:
+        list(pool.map(MountDirectory.load, pending))
+    return pending
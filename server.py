@@ -0,0 +1,272 @@
+"""
+Многопользовательский TCP-сервер командной оболочки
+
+Все клиенты работают с одним загруженным деревом VFS, у каждого сеанса
+своя версия дерева (VFS.fork): изменения сеанса копируют только
+затронутые директории и не видны другим клиентам. Протокол строчный, в UTF-8: клиент
+шлет команду строкой, сервер отвечает выводом команды и приглашением
+PROMPT. Команды выполняются в пуле потоков, а не в цикле событий, поэтому
+долгая команда одного клиента не останавливает остальные сеансы. Вывод
+команды отправляется клиенту порциями по мере появления: поток команды
+ждет, пока порция уйдет в сокет, так что память сеанса ограничена
+размером порции, а медленный клиент тормозит только свою команду.
+
+Команды с доступом к файлам машины сервера (save, mount, stats -dump и
+другие с Command.local_only) удаленным клиентам недоступны.
+"""
+
+import asyncio
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+from shell import Shell, compile_command, load_vfs, resolve_path
+from vfs import VFS
+
+PROMPT = ">>> "
+ENCODING = "utf-8"
+
+# Сколько символов вывода копится перед отправкой клиенту
+OUTPUT_CHUNK_CHARS = 64 * 1024
+
+# Потоки, в которых выполняются команды сеансов
+COMMAND_WORKERS = 32
+
+# Команды, которые клиент нагрузочного теста выполняет по кругу
+DEFAULT_LOAD_COMMANDS = ["pwd", "ls", "cd ..", "ls", "cd /", "pwd"]
+
+
+def parse_address(address: str) -> Tuple[str, int]:
+    """Разобрать адрес вида HOST:PORT"""
+    host, separator, port = address.rpartition(":")
+    if not separator or not port.isdigit():
+        raise ValueError(f"адрес должен иметь вид HOST:PORT: '{address}'")
+    return host or "127.0.0.1", int(port)
+
+
+class SessionOutput:
+    """
+    Вывод сеанса: копится в потоке команды и уходит клиенту порциями
+
+    write вызывается из потока команды; накопив OUTPUT_CHUNK_CHARS
+    символов, он передает порцию циклу событий и ждет, пока она будет
+    записана в сокет (writer.drain). Отключение клиента поднимает
+    ConnectionError прямо в потоке команды и прерывает ее.
+    """
+
+    def __init__(self, writer: asyncio.StreamWriter, loop: asyncio.AbstractEventLoop):
+        self.writer = writer
+        self.loop = loop
+        self._pending: List[str] = []
+        self._size = 0
+
+    def write(self, text: str):
+        self._pending.append(text)
+        self._size += len(text)
+        if self._size >= OUTPUT_CHUNK_CHARS:
+            self.flush()
+
+    def take(self) -> bytes:
+        """Забрать накопленный вывод"""
+        data = "".join(self._pending).encode(ENCODING)
+        self._pending.clear()
+        self._size = 0
+        return data
+
+    def flush(self):
+        """Отправить накопленный вывод из потока команды и дождаться его записи"""
+        if self._pending:
+            asyncio.run_coroutine_threadsafe(self._send(self.take()), self.loop).result()
+
+    async def _send(self, data: bytes):
+        self.writer.write(data)
+        await self.writer.drain()
+
+
+class ShellServer:
+    """TCP-сервер, раздающий сеансы оболочки над общей VFS"""
+
+    def __init__(self, vfs: VFS):
+        self.vfs = vfs
+        self.sessions_total = 0
+        self.sessions_active = 0
+        self.commands_total = 0
+        self.executor = ThreadPoolExecutor(max_workers=COMMAND_WORKERS,
+                                           thread_name_prefix="session")
+
+    @staticmethod
+    def run_command(shell: Shell, output: SessionOutput, record) -> bytes:
+        """
+        Выполнить команду в потоке пула
+
+        Returns:
+            bytes: Остаток вывода с приглашением; его отправляет цикл событий,
+            чтобы короткие команды не ждали его лишний раз
+        """
+        if record is not None:
+            shell.execute(record)
+        if not shell.exit_requested:
+            output.write(PROMPT)
+        return output.take()
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Обслуживание одного клиента"""
+        self.sessions_total += 1
+        self.sessions_active += 1
+        loop = asyncio.get_running_loop()
+        output = SessionOutput(writer, loop)
+        shell = Shell(self.vfs.fork(), output.write, remote=True)
+
+        try:
+            writer.write(f"Эмулятор командной оболочки, сеанс {self.sessions_total}\n{PROMPT}"
+                         .encode(ENCODING))
+            await writer.drain()
+
+            while not shell.exit_requested:
+                line = await reader.readline()
+                if not line:
+                    break
+
+                record = compile_command(line.decode(ENCODING, 'replace').strip())
+                data = await loop.run_in_executor(self.executor, self.run_command,
+                                                  shell, output, record)
+                if record is not None:
+                    self.commands_total += 1
+                writer.write(data)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            # Прерываем долгую команду, если клиент отключился во время нее
+            shell.cancel_event.set()
+            self.sessions_active -= 1
+            writer.close()
+
+    async def serve(self, host: str, port: int):
+        """Принимать клиентов до остановки"""
+        server = await asyncio.start_server(self.handle_client, host, port)
+        addresses = ", ".join(str(sock.getsockname()) for sock in server.sockets)
+        print(f"Сервер слушает {addresses}", file=sys.stderr)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def run_server(address: str, vfs_path=None, lazy=False, use_snapshot=True,
+               compact=False, mounts=None, preload=False, name_index=False) -> int:
+    """
+    Загрузить VFS и запустить сервер
+
+    Returns:
+        int: Код завершения
+    """
+    try:
+        host, port = parse_address(address)
+    except ValueError as e:
+        print(f"ОШИБКА: {e}", file=sys.stderr)
+        return 2
+
+    vfs_path = resolve_path(vfs_path, log=lambda text: None) if vfs_path else None
+    vfs, loaded = load_vfs(vfs_path, sys.stderr.write, lazy=lazy, use_snapshot=use_snapshot,
+                           compact=compact, mounts=mounts, preload=preload,
+                           name_index=name_index)
+    if not loaded:
+        return 2
+
+    server = ShellServer(vfs)
+    try:
+        asyncio.run(server.serve(host, port))
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        print(f"ОШИБКА: Не удалось запустить сервер: {e}", file=sys.stderr)
+        return 2
+
+    print(f"Обслужено сеансов: {server.sessions_total}, команд: {server.commands_total}",
+          file=sys.stderr)
+    return 0
+
+
+async def _load_session(host: str, port: int, commands: List[str], rounds: int,
+                        latencies: List[float]) -> int:
+    """Один клиент нагрузочного теста; возвращает число выполненных команд"""
+    reader, writer = await asyncio.open_connection(host, port)
+    prompt = PROMPT.encode(ENCODING)
+    done = 0
+    try:
+        await reader.readuntil(prompt)
+        for _ in range(rounds):
+            for command in commands:
+                started = time.perf_counter()
+                writer.write(f"{command}\n".encode(ENCODING))
+                await writer.drain()
+                try:
+                    await reader.readuntil(prompt)
+                except asyncio.IncompleteReadError:
+                    # Сервер закрыл сеанс (команда exit)
+                    return done + 1
+                latencies.append(time.perf_counter() - started)
+                done += 1
+    finally:
+        writer.close()
+    return done
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Перцентиль по отсортированному списку значений"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))
+    return values[index]
+
+
+async def _load_test(host: str, port: int, sessions: int, commands: List[str],
+                     rounds: int) -> dict:
+    latencies: List[float] = []
+    started = time.perf_counter()
+    results = await asyncio.gather(
+        *(_load_session(host, port, commands, rounds, latencies) for _ in range(sessions)),
+        return_exceptions=True)
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    completed = [result for result in results if not isinstance(result, BaseException)]
+    return {
+        "sessions": sessions,
+        "sessions_ok": len(completed),
+        "commands": sum(completed),
+        "seconds": elapsed,
+        "commands_per_second": sum(completed) / elapsed if elapsed > 0 else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "max_ms": (latencies[-1] if latencies else 0.0) * 1000,
+    }
+
+
+def run_load_test(address: str, sessions: int = 50, rounds: int = 20,
+                  commands: Optional[List[str]] = None) -> int:
+    """
+    Нагрузочный тест сервера: много одновременных сеансов с одинаковыми командами
+
+    Печатает число обслуженных сеансов, команд и задержки (p50, p99).
+
+    Returns:
+        int: 0, если все сеансы отработали без ошибок
+    """
+    try:
+        host, port = parse_address(address)
+    except ValueError as e:
+        print(f"ОШИБКА: {e}", file=sys.stderr)
+        return 2
+
+    report = asyncio.run(_load_test(host, port, sessions, commands or DEFAULT_LOAD_COMMANDS,
+                                    rounds))
+    print(f"Сеансов: {report['sessions_ok']} из {report['sessions']}, "
+          f"команд: {report['commands']} за {report['seconds']:.3f} с "
+          f"({report['commands_per_second']:.0f} команд/с)")
+    print(f"Задержка команды: p50 {report['p50_ms']:.2f} мс, p99 {report['p99_ms']:.2f} мс, "
+          f"макс. {report['max_ms']:.2f} мс")
+    return 0 if report['sessions_ok'] == sessions else 1
@@ -0,0 +1,1318 @@
+import bisect
+import fnmatch
+import inspect
+import os
+import re
+import shlex
+import threading
+import time
+import traceback
+from itertools import takewhile
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import metrics
+from grep import grep_files
+from locate import attach_name_index, locate
+from vfs import (VFS, VFSCursor, VFSDirectory, VFSError, VFSFile, create_default_vfs,
+                 iter_disk_usage, walk)
+
+# Разделитель, которым завершается вывод каждой команды
+SEPARATOR = "-" * 40 + "\n"
+
+
+def resolve_path(path, log: Callable[[str], None] = print):
+    """Преобразует относительный путь в абсолютный (относительно каталога программы)"""
+    try:
+        path_obj = Path(path)
+
+        if path_obj.is_absolute():
+            return str(path_obj)
+
+        script_dir = Path(__file__).parent
+        absolute_path = (script_dir / path).resolve()
+
+        log(f"Исходный путь: {path}")
+        log(f"Абсолютный путь: {absolute_path}")
+        log(f"Существует: {absolute_path.exists()}")
+
+        return str(absolute_path)
+    except Exception as e:
+        log(f"Ошибка в resolve_path: {e}")
+        return path
+
+
+def load_vfs(vfs_path, print_output: Callable[[str], None],
+             lazy: bool = False, use_snapshot: bool = True,
+             journal: bool = False,
+             progress: Optional[Callable[[int, int, int], None]] = None,
+             compact: bool = False, mounts: Optional[List[Tuple[str, str]]] = None,
+             preload: bool = False, name_index: bool = False) -> Tuple[VFS, bool]:
+    """
+    Загрузка VFS из файла или создание VFS по умолчанию
+
+    progress передается в VFS.load_image и вызывается как
+    progress(узлов, прочитано_байт, всего_байт).
+
+    С journal=True поверх образа проигрывается журнал изменений рядом с
+    ним, и дальнейшие изменения дописываются в этот журнал. С compact=True
+    дерево хранится в компактных таблицах (compact.py).
+
+    mounts - пары (образ, путь в VFS), подключаемые как точки монтирования
+    (до проигрывания журнала); с preload=True они сразу загружаются
+    параллельно, иначе - при первом обращении.
+
+    С name_index=True после загрузки в фоне строится индекс имен для
+    locate (иначе он строится при первом вызове locate).
+
+    Returns:
+        Tuple[VFS, bool]: Загруженная VFS и признак того, что указанный
+        образ действительно загружен (False, если создана VFS по умолчанию)
+    """
+    try:
+        if vfs_path:
+            print_output(f"Пытаемся загрузить VFS из: {vfs_path}\n")
+            print_output(f"Файл существует: {Path(vfs_path).exists()}\n")
+
+            vfs = VFS()
+            success = vfs.load_image(vfs_path, progress, lazy=lazy, use_snapshot=use_snapshot,
+                                     compact=compact)
+            if success:
+                print_output(f"VFS загружена из: {vfs_path}\n")
+                stats = vfs.load_stats
+                if stats and stats["duplicates"]:
+                    print_output(f"Общее содержимое: {stats['files']} файлов, "
+                                 f"{stats['unique']} уникальных, сэкономлено "
+                                 f"{stats['saved_bytes']} байт содержимого\n")
+                attach_mounts(vfs, mounts or [], print_output, lazy=lazy, compact=compact,
+                              use_snapshot=use_snapshot, preload=preload)
+                if journal:
+                    attach_journal(vfs, vfs_path, print_output)
+                if name_index:
+                    attach_name_index(vfs)
+                return vfs, True
+
+            print_output(f"ОШИБКА: Не удалось загрузить VFS из {vfs_path}\n")
+            print_output("Создана VFS по умолчанию\n")
+            return create_default_vfs(), False
+
+        print_output("VFS не указана, создана VFS по умолчанию\n")
+        vfs = create_default_vfs()
+        attach_mounts(vfs, mounts or [], print_output, lazy=lazy, compact=compact,
+                      use_snapshot=use_snapshot, preload=preload)
+        if name_index:
+            attach_name_index(vfs)
+        return vfs, True
+    except Exception as e:
+        print_output(f"КРИТИЧЕСКАЯ ОШИБКА при загрузке VFS: {str(e)}\n")
+        print_output(traceback.format_exc())
+        return create_default_vfs(), False
+
+
+def attach_journal(vfs: VFS, vfs_path: str, print_output: Callable[[str], None]) -> bool:
+    """Проиграть журнал изменений образа и подключить его к VFS"""
+    from journal import JournalError, open_journal
+    try:
+        journal, applied = open_journal(vfs, vfs_path)
+    except (JournalError, OSError) as e:
+        print_output(f"ОШИБКА журнала изменений: {e}; изменения не будут сохраняться\n")
+        return False
+    print_output(f"Журнал изменений: {journal.path}, применено записей: {applied}\n")
+    return True
+
+
+def attach_mounts(vfs: VFS, mounts: List[Tuple[str, str]], print_output: Callable[[str], None],
+                  lazy: bool = False, compact: bool = False, use_snapshot: bool = True,
+                  preload: bool = False) -> bool:
+    """Подключить образы в точки монтирования, при необходимости загрузив их параллельно"""
+    ok = True
+    attached = []
+    for image_path, path in mounts:
+        image_path = resolve_path(image_path, log=lambda text: None)
+        try:
+            attached.append(vfs.mount(image_path, path, cwd="/", lazy=lazy, compact=compact,
+                                      use_snapshot=use_snapshot))
+        except VFSError as e:
+            print_output(f"ОШИБКА монтирования: {e}\n")
+            ok = False
+            continue
+        print_output(f"Образ {image_path} подключен в {attached[-1].path}\n")
+    if preload and attached:
+        ok = report_preload(attached, print_output) and ok
+    return ok
+
+
+def report_preload(mounts: list, print_output: Callable[[str], None]) -> bool:
+    """Загрузить точки монтирования параллельно и напечатать итог по каждой"""
+    from mount import preload
+    started = time.perf_counter()
+    loaded = preload(mounts)
+    ok = True
+    for mount in loaded:
+        if mount.error:
+            print_output(f"ОШИБКА: {mount.path}: {mount.error}\n")
+            ok = False
+        else:
+            print_output(f"Загружен {mount.path} <- {mount.image_path} "
+                         f"за {mount.load_seconds:.3f} с\n")
+    print_output(f"Загружено образов: {len(loaded)} за {time.perf_counter() - started:.3f} с\n")
+    return ok
+
+
+def parse_options(args: List[str], flags: Dict[str, type]) -> Tuple[List[str], Dict[str, object]]:
+    """
+    Разобрать ключи команды
+
+    Args:
+        args: Аргументы команды
+        flags: Допустимые ключи: -ключ -> тип значения (bool - ключ без значения)
+
+    Returns:
+        Tuple[List[str], Dict[str, object]]: Позиционные аргументы и значения ключей
+
+    Raises:
+        ValueError: Неизвестный ключ или неверное значение
+    """
+    positional = []
+    options = {}
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg in flags:
+            kind = flags[arg]
+            if kind is bool:
+                options[arg] = True
+            else:
+                if i + 1 >= len(args):
+                    raise ValueError(f"ключ {arg} требует значения")
+                try:
+                    options[arg] = kind(args[i + 1])
+                except ValueError:
+                    raise ValueError(f"неверное значение ключа {arg}: '{args[i + 1]}'")
+                i += 1
+        elif arg.startswith('-') and len(arg) > 1:
+            raise ValueError(f"неизвестный ключ {arg}")
+        else:
+            positional.append(arg)
+        i += 1
+    return positional, options
+
+
+def non_negative(value: str) -> int:
+    """Тип значения ключа: целое число не меньше нуля"""
+    number = int(value)
+    if number < 0:
+        raise ValueError(value)
+    return number
+
+
+class Command:
+    """
+    Описание команды оболочки в реестре
+
+    handler - функция handler(shell, args) -> bool, обычно метод Shell.
+    Команды с большим выводом - генераторы (streaming): они выдают текст
+    вывода по частям и возвращают bool в конце, а сообщения об ошибках и
+    пояснения печатают сразу через shell.print_output, минуя конвейер.
+    Такой вывод читается лениво: если следующей команде конвейера больше
+    ничего не нужно, генератор закрывается и работа прекращается.
+    reads_input - команда-фильтр, которая может стоять после '|': она
+    вызывается как handler(shell, args, chunks), где chunks - итератор
+    частей текста предыдущей команды.
+    Число аргументов проверяется заранее, при компиляции команды.
+    background - долгая команда, которую интерфейс выполняет вне своего
+    потока; такие команды должны проверять shell.cancel_event.
+    local_only - команда читает или пишет файлы на машине оболочки и
+    недоступна удаленным клиентам (Shell с remote=True).
+    """
+
+    def __init__(self, name: str, handler: Callable, min_args: int = 0,
+                 max_args: Optional[int] = None, usage: Optional[str] = None,
+                 background: bool = False, reads_input: bool = False,
+                 local_only: bool = False):
+        self.name = name
+        self.handler = handler
+        self.min_args = min_args
+        self.max_args = max_args
+        self.usage = usage or name
+        self.background = background
+        self.reads_input = reads_input
+        self.local_only = local_only
+        self.streaming = inspect.isgeneratorfunction(handler)
+
+    def validate(self, args: List[str]) -> Optional[str]:
+        """Проверить аргументы; вернуть сообщение об ошибке или None"""
+        if len(args) < self.min_args or (self.max_args is not None and len(args) > self.max_args):
+            return f"Использование: {self.usage}"
+        return None
+
+
+# Реестр команд оболочки: имя -> Command
+COMMANDS: Dict[str, Command] = {}
+
+
+# Файлы больше этого размера cat выводит потоково, минуя кэш декодирования
+STREAM_THRESHOLD_BYTES = 1024 * 1024
+
+# Сколько строк выводят head и tail по умолчанию
+DEFAULT_HEAD_LINES = 10
+
+# Сколько записей ls выдает за раз
+LS_PAGE_ENTRIES = 256
+
+# Сколько вариантов дополнения возвращается для показа
+MAX_COMPLETIONS = 100
+
+# Сколько путей locate выводит без явного -limit
+DEFAULT_LOCATE_LIMIT = 1000
+
+
+def register_command(command: Command):
+    """Добавить команду в реестр"""
+    COMMANDS[command.name] = command
+
+
+def command(name: str, min_args: int = 0, max_args: Optional[int] = None,
+            usage: Optional[str] = None, background: bool = False, reads_input: bool = False,
+            local_only: bool = False):
+    """Декоратор: зарегистрировать функцию handler(shell, args) как команду"""
+    def decorator(handler):
+        register_command(Command(name, handler, min_args, max_args, usage, background,
+                                 reads_input, local_only))
+        return handler
+    return decorator
+
+
+class CompiledCommand(NamedTuple):
+    """Разобранная и проверенная строка команды"""
+    line: int
+    text: str
+    command: Optional[Command]
+    args: List[str]
+    # Сообщение об ошибке разбора или проверки; такая команда не выполняется
+    error: Optional[str]
+    # Следующие команды конвейера (после '|'): пары (команда, аргументы)
+    pipeline: Tuple[Tuple[Command, List[str]], ...] = ()
+
+    @property
+    def background(self) -> bool:
+        """Долгая ли команда (для конвейера - хотя бы одна из его команд)"""
+        if self.command is None:
+            return False
+        return self.command.background or any(stage.background for stage, _ in self.pipeline)
+
+    @property
+    def local_only(self) -> Optional[str]:
+        """Имя первой команды (в том числе конвейера), недоступной удаленным клиентам"""
+        if self.command is None:
+            return None
+        for stage in (self.command, *(stage for stage, _ in self.pipeline)):
+            if stage.local_only:
+                return stage.name
+        return None
+
+
+def split_pipeline(text: str) -> List[str]:
+    """Разбить строку на команды конвейера по '|' вне кавычек"""
+    if "|" not in text:
+        return [text]
+    parts = []
+    start = 0
+    quote = None
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if char == "\\" and quote != "'":
+            i += 2
+            continue
+        if quote is not None:
+            if char == quote:
+                quote = None
+        elif char in "'\"":
+            quote = char
+        elif char == "|":
+            parts.append(text[start:i])
+            start = i + 1
+        i += 1
+    parts.append(text[start:])
+    return parts
+
+
+def last_word_start(text: str) -> Tuple[int, int, Optional[str]]:
+    """
+    Найти последнее слово строки по правилам shlex (кавычки и '\\')
+
+    Returns:
+        Tuple[int, int, Optional[str]]: Позиция начала слова, число слов
+        перед ним и незакрытая кавычка (None - кавычки закрыты)
+    """
+    start = 0
+    words = 0
+    quote = None
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if char == "\\" and quote != "'":
+            i += 2
+            continue
+        if quote is not None:
+            if char == quote:
+                quote = None
+        elif char in "'\"":
+            quote = char
+        elif char.isspace():
+            if start < i:
+                words += 1
+            start = i + 1
+        i += 1
+    return start, words, quote
+
+
+def quote_prefix(text: str) -> str:
+    """Экранировать начало слова для shlex, оставив кавычку открытой для продолжения"""
+    quoted = shlex.quote(text)
+    return quoted[:-1] if quoted != text else quoted
+
+
+def compile_command(text: str, line: int = 0) -> Optional[CompiledCommand]:
+    """
+    Разобрать строку команды: токенизация, поиск в реестре и проверка аргументов
+
+    Строка может быть конвейером 'команда | фильтр | ...': каждая команда
+    после '|' должна читать ввод (Command.reads_input).
+
+    Returns:
+        Optional[CompiledCommand]: Команда или None для пустой строки
+    """
+    try:
+        stages = [shlex.split(part) for part in split_pipeline(text)]
+    except ValueError as e:
+        return CompiledCommand(line, text, None, [], f"ОШИБКА: Ошибка парсинга: {str(e)}")
+
+    if len(stages) == 1 and not stages[0]:
+        return None
+    if not all(stages):
+        return CompiledCommand(line, text, None, [], "ОШИБКА: Пустая команда в конвейере")
+
+    compiled = []
+    for number, parts in enumerate(stages):
+        name = parts[0].lower()
+        args = parts[1:]
+        found = COMMANDS.get(name)
+        if found is None:
+            return CompiledCommand(line, text, None, args, f"ОШИБКА: Неизвестная команда '{name}'")
+        if number and not found.reads_input:
+            error = f"ОШИБКА: Команда '{name}' не читает ввод из конвейера"
+        else:
+            error = found.validate(args)
+        if error is not None:
+            return CompiledCommand(line, text, found, args, error)
+        compiled.append((found, args))
+
+    (first, args), rest = compiled[0], compiled[1:]
+    return CompiledCommand(line, text, first, args, None, tuple(rest))
+
+
+# Число в начале строки для sort -n
+NUMBER_PREFIX = re.compile(r"\s*[-+]?(\d+(\.\d*)?|\.\d+)")
+
+
+def numeric_key(line: str) -> Tuple[float, str]:
+    """Ключ sort -n: число в начале строки (без числа - 0), затем сама строка"""
+    match = NUMBER_PREFIX.match(line)
+    return (float(match.group()) if match else 0.0), line
+
+
+def iter_lines(chunks: Iterable[str]) -> Iterator[str]:
+    """
+    Разбить поток частей текста на строки (без перевода строки)
+
+    Части читаются по одной и только пока нужны следующие строки.
+    """
+    pending = ""
+    for chunk in chunks:
+        if "\n" not in chunk:
+            pending += chunk
+            continue
+        lines = chunk.split("\n")
+        lines[0] = pending + lines[0]
+        pending = lines.pop()
+        yield from lines
+    if pending:
+        yield pending
+
+
+def compile_script(script_path) -> List[CompiledCommand]:
+    """
+    Прочитать и скомпилировать скрипт целиком
+
+    Пустые строки и комментарии (#) пропускаются. Строки с ошибками
+    остаются в результате с заполненным error, чтобы их можно было
+    показать сразу при загрузке.
+    """
+    with open(script_path, 'r', encoding='utf-8') as f:
+        lines = f.readlines()
+
+    compiled = []
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if line and not line.startswith('#'):
+            record = compile_command(line, number)
+            if record is not None:
+                compiled.append(record)
+    return compiled
+
+
+def script_errors(compiled: List[CompiledCommand]) -> List[str]:
+    """Сообщения об ошибках скомпилированного скрипта с номерами строк"""
+    return [f"Строка {record.line}: {record.error}" for record in compiled if record.error]
+
+
+class Shell:
+    """
+    Командная оболочка поверх VFS без привязки к интерфейсу
+
+    Весь вывод идет через функцию print_output, поэтому оболочку можно
+    использовать и из окна Qt, и из консоли без графической среды.
+    Команды находятся в реестре COMMANDS. Текущая директория хранится в
+    курсоре: без явного курсора используется курсор по умолчанию VFS.
+    """
+
+    def __init__(self, vfs: VFS, print_output: Callable[[str], None],
+                 cursor: Optional[VFSCursor] = None, remote: bool = False):
+        self.vfs = vfs
+        self.print_output = print_output
+        self._cursor = cursor
+        # Сеанс удаленного клиента: команды с доступом к файлам машины запрещены
+        self.remote = remote
+        self.exit_requested = False
+        # Устанавливается, чтобы прервать выполняющуюся долгую команду
+        self.cancel_event = threading.Event()
+        # Выполняется конвейер: вывод команды читает следующая команда,
+        # поэтому оформление только для экрана (как у cat) не добавляется
+        self.piped = False
+
+    @property
+    def cursor(self) -> VFSCursor:
+        """Курсор оболочки (текущая директория)"""
+        return self._cursor if self._cursor is not None else self.vfs.cursor
+
+    def process_command(self, command_text) -> bool:
+        """
+        Обработка и выполнение команды
+
+        Returns:
+            bool: Успешно ли выполнена команда
+        """
+        record = compile_command(command_text)
+        if record is None:
+            return True
+        return self.execute(record)
+
+    def complete(self, line: str) -> Tuple[str, List[str]]:
+        """
+        Дополнение строки ввода по Tab: имя команды или путь в VFS
+
+        Варианты берутся из отсортированного индекса имен директории
+        бинарным поиском, без просмотра всех детей. Слово разбирается по
+        тем же правилам shlex, что и команда, а вставленное имя
+        экранируется кавычками, если в нем есть пробелы или спецсимволы.
+
+        Returns:
+            Tuple[str, List[str]]: Строка после дополнения общим префиксом
+            и варианты (не больше MAX_COMPLETIONS), если их несколько
+        """
+        stages = split_pipeline(line)
+        start, words, quote = last_word_start(stages[-1])
+        head = line[:len(line) - len(stages[-1]) + start]
+        try:
+            # Слово разбирается так же, как при выполнении команды
+            word = shlex.split(line[len(head):] + (quote or ""))
+        except ValueError:
+            return line, []
+        word = word[0] if word else ""
+
+        if not words:
+            # Имя команды: в начале строки или фильтр после '|'
+            piped = len(stages) > 1
+            names = sorted(name for name, found in COMMANDS.items()
+                           if found.reads_input or not piped)
+            start = bisect.bisect_left(names, word)
+            matches = [name for name in names[start:] if name.startswith(word)]
+            if len(matches) == 1:
+                return f"{head}{matches[0]} ", []
+            common = os.path.commonprefix(matches)
+            return (f"{head}{common}" if len(common) > len(word) else line), matches
+
+        directory_part, slash, prefix = word.rpartition("/")
+        directory_path = (directory_part or "/") if slash else "."
+        directory = self.resolve_directory(directory_path)
+        if directory is None:
+            return line, []
+
+        start, end = directory.prefix_range(prefix)
+        if start == end:
+            return line, []
+        base = f"{directory_part}{slash}"
+        if end - start == 1:
+            node = directory.list_page(start, 1)[0]
+            if isinstance(node, VFSDirectory):
+                return head + shlex.quote(f"{base}{node.name}/"), []
+            return f"{head}{shlex.quote(base + node.name)} ", []
+
+        # Имена отсортированы: общий префикс диапазона - общий префикс крайних имен
+        matches = directory.name_range(start, min(end, start + MAX_COMPLETIONS))
+        common = os.path.commonprefix([matches[0], directory.name_range(end - 1, end)[0]])
+        if len(common) == len(prefix):
+            return line, matches
+        return head + quote_prefix(base + common), matches
+
+    def execute(self, record: CompiledCommand) -> bool:
+        """
+        Выполнение скомпилированной команды
+
+        Returns:
+            bool: Успешно ли выполнена команда
+        """
+        if record.error is not None:
+            self.print_output(f"{record.error}\n")
+            success = False
+        elif self.remote and record.local_only is not None:
+            self.print_output(f"ОШИБКА: Команда '{record.local_only}' недоступна "
+                              f"в удаленном сеансе\n")
+            success = False
+        else:
+            self.cancel_event.clear()
+            if metrics.enabled:
+                started = time.perf_counter()
+                success = self.run(record)
+                name = "pipeline" if record.pipeline else record.command.name
+                metrics.observe(f"command.{name}", time.perf_counter() - started)
+            else:
+                success = self.run(record)
+
+        self.print_output(SEPARATOR)
+        return success
+
+    def run(self, record: CompiledCommand) -> bool:
+        """
+        Выполнить команду или конвейер, напечатав вывод последней команды
+
+        Вывод конвейера вытягивается с конца: каждая команда читает ровно
+        столько вывода предыдущей, сколько ей нужно, а когда последняя
+        закончила, недочитанные генераторы закрываются.
+
+        Returns:
+            bool: Успешно ли выполнены все команды
+        """
+        command = record.command
+        if not record.pipeline:
+            if not command.streaming:
+                return command.handler(self, record.args)
+            return self.drain(command.handler(self, record.args))
+
+        stages = ((command, record.args),) + record.pipeline
+        # Результаты команд; None - команда закрыта, не дойдя до конца
+        results: List[Optional[bool]] = [None] * len(stages)
+        outputs = []
+        chunks = None
+        self.piped = True
+        try:
+            for number, (stage, args) in enumerate(stages):
+                chunks = self.stage_output(stage, args, chunks, results, number)
+                outputs.append(chunks)
+            for chunk in chunks:
+                self.print_output(chunk)
+        finally:
+            self.piped = False
+            for output in reversed(outputs):
+                output.close()
+        return all(result is not False for result in results)
+
+    def drain(self, output) -> bool:
+        """Напечатать вывод команды-генератора и вернуть ее результат"""
+        try:
+            while True:
+                self.print_output(next(output))
+        except StopIteration as stop:
+            return stop.value
+
+    def stage_output(self, command: Command, args: List[str], chunks: Optional[Iterator[str]],
+                     results: List[Optional[bool]], number: int):
+        """Вывод одной команды конвейера; ее результат записывается в results[number]"""
+        if command.streaming:
+            output = (command.handler(self, args) if chunks is None
+                      else command.handler(self, args, chunks))
+            results[number] = yield from output
+            return
+
+        # Обычная команда печатает сама: ее вывод собирается целиком
+        collected = []
+        print_output = self.print_output
+        self.print_output = collected.append
+        try:
+            results[number] = command.handler(self, args)
+        finally:
+            self.print_output = print_output
+        yield from collected
+
+    @command("ls", usage="ls [путь] [-offset N] [-limit N]")
+    def cmd_ls(self, args):
+        """Команда ls - вывод содержимого директории, постранично с -offset/-limit"""
+        try:
+            positional, options = parse_options(
+                args, {"-offset": non_negative, "-limit": non_negative})
+            if len(positional) > 1:
+                raise ValueError("можно указать только один путь")
+            if options.get("-limit") == 0:
+                raise ValueError("размер страницы -limit должен быть больше нуля")
+        except ValueError as e:
+            self.print_output(f"ОШИБКА: {e}\n")
+            return False
+
+        path = positional[0] if positional else None
+        directory = self.resolve_directory(path)
+        if directory is None:
+            self.print_output(f"ОШИБКА: Директория '{path}' не найдена\n")
+            return False
+
+        total = directory.child_count()
+        if not total:
+            self.print_output("Директория пуста\n")
+            return True
+
+        offset = options.get("-offset", 0)
+        if offset >= total:
+            self.print_output(f"... нет записей: в директории всего {total}\n")
+            return True
+        limit = options.get("-limit")
+        stop = total if limit is None else min(total, offset + limit)
+        # Листинг выдается страницами, чтобы фильтр конвейера (ls | head)
+        # мог остановить его, не дожидаясь всей директории
+        end = offset
+        while end < stop:
+            nodes = directory.list_page(end, min(LS_PAGE_ENTRIES, stop - end))
+            if not nodes:
+                break
+            yield "".join(f"{node}\n" for node in nodes)
+            end += len(nodes)
+
+        if offset or end < total:
+            footer = f"... показаны записи {offset + 1}-{end} из {total}"
+            if end < total:
+                # Подсказка должна листать ту же директорию теми же страницами
+                footer += f", далее: ls -offset {end}"
+                if limit is not None:
+                    footer += f" -limit {limit}"
+                footer += f" {shlex.quote(path if path is not None else self.cursor.current_path)}"
+            self.print_output(footer + "\n")
+        return True
+
+    @command("cd", min_args=1, usage="cd <путь>")
+    def cmd_cd(self, args):
+        """Команда cd - смена текущей директории"""
+        path = args[0]
+        success = self.cursor.change_directory(path)
+
+        if success:
+            self.print_output(f"Переход в: {self.cursor.current_path}\n")
+        else:
+            self.print_output(f"ОШИБКА: Директория '{path}' не найдена\n")
+        return success
+
+    @command("cat", min_args=1, usage="cat [-offset N] [-c N] <имя_файла>")
+    def cmd_cat(self, args):
+        """Команда cat - вывод содержимого файла или его диапазона байт"""
+        try:
+            positional, options = parse_options(args, {"-offset": non_negative, "-c": non_negative})
+            if len(positional) != 1:
+                raise ValueError("нужен ровно один файл")
+        except ValueError as e:
+            self.print_output(f"ОШИБКА: {e}\n")
+            return False
+
+        filename = positional[0]
+        node = self.cursor.resolve_path(filename)
+        if not isinstance(node, VFSFile):
+            self.print_output(f"ОШИБКА: Файл '{filename}' не найден или не является файлом\n")
+            return False
+
+        if options:
+            start = options.get("-offset", 0)
+            end = node.size() if "-c" not in options else min(node.size(), start + options["-c"])
+            if not self.piped:
+                self.print_output(f"Содержимое файла '{filename}' (байты {start}-{max(start, end)}):\n")
+            return (yield from self.output_bytes(node, node.read_range, start, max(0, end - start)))
+
+        # В конвейере заголовок смешался бы с результатом следующей команды
+        if not self.piped:
+            self.print_output(f"Содержимое файла '{filename}':\n")
+        if node.size() <= STREAM_THRESHOLD_BYTES:
+            yield node.get_content()
+        elif node.is_binary():
+            yield "[Binary data]"
+        else:
+            # Большой файл выводится порциями, не собираясь в одну строку
+            try:
+                yield from node.iter_text()
+            except ValueError as e:
+                self.print_output(f"\nОШИБКА: Содержимое файла повреждено: {e}\n")
+                return False
+        if not self.piped:
+            yield "\n"
+        return True
+
+    def output_bytes(self, node: VFSFile, read: Callable, *args):
+        """Выдать байты, прочитанные read(*args), как текст (двоичные - заглушкой)"""
+        if node.is_binary():
+            yield "[Binary data]\n"
+            return True
+        try:
+            data = read(*args)
+        except ValueError as e:
+            self.print_output(f"ОШИБКА: Содержимое файла повреждено: {e}\n")
+            return False
+        text = data.decode('utf-8', 'replace')
+        yield text if not text or text.endswith("\n") else text + "\n"
+        return True
+
+    def resolve_file(self, path: str) -> Optional[VFSFile]:
+        """Найти файл по пути, напечатав ошибку, если его нет"""
+        node = self.cursor.resolve_path(path)
+        if not isinstance(node, VFSFile):
+            self.print_output(f"ОШИБКА: Файл '{path}' не найден или не является файлом\n")
+            return None
+        return node
+
+    @command("head", reads_input=True, usage="head [-n строк] [-c байт] <файл> | ... | head [-n строк | строк]")
+    def cmd_head(self, args, chunks=None):
+        """Команда head - начало файла или ввода; декодируются и читаются только нужные блоки"""
+        try:
+            positional, options = parse_options(args, {"-n": non_negative, "-c": non_negative})
+            count = options.get("-n", DEFAULT_HEAD_LINES)
+            if chunks is None:
+                if len(positional) != 1:
+                    raise ValueError("нужен ровно один файл")
+            elif "-c" in options:
+                raise ValueError("в конвейере head считает только строки")
+            elif len(positional) > 1 or (positional and "-n" in options):
+                raise ValueError("в конвейере head принимает только число строк")
+            elif positional:
+                try:
+                    count = non_negative(positional[0])
+                except ValueError:
+                    raise ValueError(f"неверное число строк: '{positional[0]}'")
+        except ValueError as e:
+            self.print_output(f"ОШИБКА: {e}\n")
+            return False
+
+        if chunks is not None:
+            if count:
+                # Следующая строка не запрашивается, когда нужные уже выданы
+                for line in iter_lines(chunks):
+                    yield line + "\n"
+                    count -= 1
+                    if not count:
+                        break
+            return True
+
+        node = self.resolve_file(positional[0])
+        if node is None:
+            return False
+        if "-c" in options:
+            return (yield from self.output_bytes(node, node.read_range, 0, options["-c"]))
+        return (yield from self.output_bytes(node, node.head_lines, count))
+
+    @command("tail", min_args=1, usage="tail [-n строк] [-c байт] <файл>")
+    def cmd_tail(self, args):
+        """Команда tail - конец файла; содержимое читается с конца"""
+        try:
+            positional, options = parse_options(args, {"-n": non_negative, "-c": non_negative})
+            if len(positional) != 1:
+                raise ValueError("нужен ровно один файл")
+        except ValueError as e:
+            self.print_output(f"ОШИБКА: {e}\n")
+            return False
+
+        node = self.resolve_file(positional[0])
+        if node is None:
+            return False
+        if "-c" in options:
+            size = node.size()
+            count = min(options["-c"], size)
+            return (yield from self.output_bytes(node, node.read_range, size - count, count))
+        return (yield from self.output_bytes(node, node.tail_lines,
+                                             options.get("-n", DEFAULT_HEAD_LINES)))
+
+    @command("pwd")
+    def cmd_pwd(self, args):
+        """Команда pwd - вывод текущего пути"""
+        self.print_output(f"Текущий путь: {self.cursor.current_path}\n")
+        return True
+
+    def resolve_directory(self, path: Optional[str]) -> Optional[VFSDirectory]:
+        """Найти директорию по пути (None - текущая директория)"""
+        if path is None:
+            return self.cursor.current_directory
+        node = self.cursor.resolve_path(path)
+        return node if isinstance(node, VFSDirectory) else None
+
+    @command("find", usage="find [путь] [-name шаблон] [-type f|d] [-limit N]")
+    def cmd_find(self, args):
+        """Команда find - поиск узлов по шаблону имени и типу"""
+        try:
+            positional, options = parse_options(
+                args, {"-name": str, "-type": str, "-limit": non_negative})
+            if len(positional) > 1:
+                raise ValueError("можно указать только один путь")
+            if options.get("-type", "f") not in ("f", "d"):
+                raise ValueError("тип должен быть f или d")
+        except ValueError as e:
+            self.print_output(f"ОШИБКА: {e}\n")
+            return False
+
+        path = positional[0] if positional else None
+        directory = self.resolve_directory(path)
+        if directory is None:
+            self.print_output(f"ОШИБКА: Директория '{path}' не найдена\n")
+            return False
+
+        pattern = options.get("-name")
+        node_type = options.get("-type")
+        limit = options.get("-limit")
+        found = 0
+
+        for node_path, node, _ in walk(directory):
+            if limit is not None and found >= limit:
+                self.print_output(f"... показаны первые {limit} результатов\n")
+                break
+            if node_type == "d" and not isinstance(node, VFSDirectory):
+                continue
+            if node_type == "f" and isinstance(node, VFSDirectory):
+                continue
+            if pattern is not None and not fnmatch.fnmatchcase(node.name, pattern):
+                continue
+            yield f"{node_path}\n"
+            found += 1
+
+        if not found:
+            self.print_output("Ничего не найдено\n")
+        return True
+
+    @command("locate", usage="locate [-type f|d] [-limit N] <шаблон>")
+    def cmd_locate(self, args):
+        """Команда locate - поиск узлов по имени во всем дереве через индекс имен"""
+        try:
+            positional, options = parse_options(args, {"-type": str, "-limit": non_negative})
+            if len(positional) != 1:
+                raise ValueError("нужен ровно один шаблон имени")
+            if options.get("-type", "f") not in ("f", "d"):
+                raise ValueError("тип должен быть f или d")
+        except ValueError as e:
+            self.print_output(f"ОШИБКА: {e}\n")
+            return False
+
+        index = attach_name_index(self.vfs)
+        if not index.ready.is_set():
+            self.print_output("Индекс имен строится в фоне, поиск обходом дерева\n")
+
+        limit = options.get("-limit", DEFAULT_LOCATE_LIMIT)
+        found = 0
+        for node_path in locate(self.vfs, positional[0], options.get("-type")):
+            if found >= limit:
+                self.print_output(f"... показаны первые {limit} результатов\n")
+                break
+            yield f"{node_path}\n"
+            found += 1
+
+        if not found:
+            self.print_output("Ничего не найдено\n")
+        return True
+
+    @command("tree", usage="tree [путь] [-L глубина] [-limit N]")
+    def cmd_tree(self, args):
+        """Команда tree - вывод дерева директорий"""
+        try:
+            positional, options = parse_options(args, {"-L": non_negative, "-limit": non_negative})
+            if len(positional) > 1:
+                raise ValueError("можно указать только один путь")
+        except ValueError as e:
+            self.print_output(f"ОШИБКА: {e}\n")
+            return False
+
+        path = positional[0] if positional else None
+        directory = self.resolve_directory(path)
+        if directory is None:
+            self.print_output(f"ОШИБКА: Директория '{path}' не найдена\n")
+            return False
+
+        limit = options.get("-limit")
+        directories = files = 0
+
+        yield f"{directory.path}\n"
+        for _, node, depth in walk(directory, max_depth=options.get("-L")):
+            if limit is not None and directories + files >= limit:
+                self.print_output(f"... показаны первые {limit} узлов\n")
+                break
+            if isinstance(node, VFSDirectory):
+                directories += 1
+                yield f"{'    ' * (depth - 1)}{node.name}/\n"
+            else:
+                files += 1
+                yield f"{'    ' * (depth - 1)}{node.name}\n"
+
+        self.print_output(f"Директорий: {directories}, файлов: {files}\n")
+        return True
+
+    @command("du", usage="du [путь] [-d глубина] [-s] [-limit N]")
+    def cmd_du(self, args):
+        """Команда du - размеры директорий по длине содержимого файлов"""
+        try:
+            positional, options = parse_options(
+                args, {"-d": non_negative, "-s": bool, "-limit": non_negative})
+            if len(positional) > 1:
+                raise ValueError("можно указать только один путь")
+        except ValueError as e:
+            self.print_output(f"ОШИБКА: {e}\n")
+            return False
+
+        path = positional[0] if positional else None
+        directory = self.resolve_directory(path)
+        if directory is None:
+            self.print_output(f"ОШИБКА: Директория '{path}' не найдена\n")
+            return False
+
+        max_depth = 0 if "-s" in options else options.get("-d")
+        limit = options.get("-limit")
+        printed = 0
+
+        for dir_path, size, depth in iter_disk_usage(directory):
+            if max_depth is not None and depth > max_depth:
+                continue
+            if limit is not None and printed >= limit:
+                self.print_output(f"... показаны первые {limit} директорий\n")
+                break
+            yield f"{size}\t{dir_path}\n"
+            printed += 1
+        return True
+
+    @command("grep", min_args=1, background=True, reads_input=True,
+             usage="grep [-r] [-i] [-limit N] <шаблон> [путь] | ... | grep [-i] [-limit N] <шаблон>")
+    def cmd_grep(self, args, chunks=None):
+        """Команда grep - поиск строк по регулярному выражению в содержимом файлов или вводе"""
+        try:
+            positional, options = parse_options(
+                args, {"-r": bool, "-i": bool, "-limit": non_negative})
+            if not 1 <= len(positional) <= 2:
+                raise ValueError("нужен шаблон и не больше одного пути")
+            if chunks is not None and len(positional) > 1:
+                raise ValueError("в конвейере grep читает ввод и не принимает путь")
+            flags = re.IGNORECASE if "-i" in options else 0
+            regex = re.compile(positional[0], flags)
+        except (ValueError, re.error) as e:
+            self.print_output(f"ОШИБКА: {e}\n")
+            return False
+
+        if chunks is not None:
+            # Строки ввода проверяются здесь же: пул процессов для них не нужен
+            lines = takewhile(lambda line: not self.cancel_event.is_set(), iter_lines(chunks))
+            matches = (line + "\n" for line in lines if regex.search(line))
+        else:
+            pattern = positional[0]
+            path = positional[1] if len(positional) > 1 else None
+            node = (self.cursor.resolve_path(path) if path is not None
+                    else self.cursor.current_directory)
+            if node is None:
+                self.print_output(f"ОШИБКА: Путь '{path}' не найден\n")
+                return False
+
+            if isinstance(node, VFSFile):
+                files = [(self.cursor.resolve_full_path(path), node)]
+            else:
+                max_depth = None if "-r" in options else 1
+                files = ((node_path, child)
+                         for node_path, child, _ in walk(node, max_depth=max_depth)
+                         if isinstance(child, VFSFile))
+            matches = (f"{file_path}:{number}: {line}\n" for file_path, number, line
+                       in grep_files(files, pattern, flags, self.cancel_event))
+
+        limit = options.get("-limit")
+        found = 0
+        for match in matches:
+            if limit is not None and found >= limit:
+                self.print_output(f"... показаны первые {limit} совпадений\n")
+                break
+            yield match
+            found += 1
+
+        if self.cancel_event.is_set():
+            self.print_output("Поиск прерван\n")
+        elif not found:
+            self.print_output("Совпадений не найдено\n")
+        return True
+
+    def input_text(self, positional: List[str], chunks: Optional[Iterator[str]]):
+        """
+        Текст для фильтра: ввод конвейера или содержимое файла из аргумента
+
+        Returns:
+            Tuple: (части текста, файл или None); (None, None), если ввода нет
+            (ошибка уже напечатана)
+        """
+        if chunks is not None:
+            if positional:
+                self.print_output("ОШИБКА: в конвейере команда читает ввод и не принимает файл\n")
+                return None, None
+            return chunks, None
+        if len(positional) != 1:
+            self.print_output("ОШИБКА: нужен файл или ввод из конвейера\n")
+            return None, None
+        node = self.resolve_file(positional[0])
+        if node is None:
+            return None, None
+        return node.iter_text(), node
+
+    @command("wc", reads_input=True, usage="wc [-l] [-w] [-c] <файл> | ... | wc [-l] [-w] [-c]")
+    def cmd_wc(self, args, chunks=None):
+        """Команда wc - число строк, слов и байт файла или ввода"""
+        try:
+            positional, options = parse_options(args, {"-l": bool, "-w": bool, "-c": bool})
+        except ValueError as e:
+            self.print_output(f"ОШИБКА: {e}\n")
+            return False
+        text, node = self.input_text(positional, chunks)
+        if text is None:
+            return False
+        if node is not None and set(options) == {"-c"}:
+            # Размер файла известен без декодирования
+            text = ()
+
+        lines = words = size = 0
+        # Слово, начатое в конце предыдущей части, продолжается в следующей
+        in_word = False
+        try:
+            for chunk in text:
+                if not chunk:
+                    continue
+                lines += chunk.count("\n")
+                words += len(chunk.split())
+                if in_word and not chunk[0].isspace():
+                    words -= 1
+                in_word = not chunk[-1].isspace()
+                if node is None:
+                    size += len(chunk.encode('utf-8'))
+        except ValueError as e:
+            self.print_output(f"ОШИБКА: Содержимое файла повреждено: {e}\n")
+            return False
+        if node is not None:
+            size = node.size()
+
+        selected = [count for flag, count in (("-l", lines), ("-w", words), ("-c", size))
+                    if flag in options] or [lines, words, size]
+        yield " ".join(map(str, selected)) + (f" {positional[0]}" if positional else "") + "\n"
+        return True
+
+    @command("sort", reads_input=True, usage="sort [-r] [-n] <файл> | ... | sort [-r] [-n]")
+    def cmd_sort(self, args, chunks=None):
+        """Команда sort - строки файла или ввода по порядку; ввод читается целиком"""
+        try:
+            positional, options = parse_options(args, {"-r": bool, "-n": bool})
+        except ValueError as e:
+            self.print_output(f"ОШИБКА: {e}\n")
+            return False
+        text, _ = self.input_text(positional, chunks)
+        if text is None:
+            return False
+
+        try:
+            lines = list(iter_lines(text))
+        except ValueError as e:
+            self.print_output(f"ОШИБКА: Содержимое файла повреждено: {e}\n")
+            return False
+        lines.sort(key=numeric_key if "-n" in options else None, reverse="-r" in options)
+        for line in lines:
+            yield line + "\n"
+        return True
+
+    def modify(self, operation: Callable, paths: List[str], **options) -> bool:
+        """Применить изменяющую операцию VFS к каждому пути, печатая ошибки"""
+        ok = True
+        for path in paths:
+            try:
+                operation(path, cwd=self.cursor.current_path, **options)
+            except VFSError as e:
+                self.print_output(f"ОШИБКА: {e}\n")
+                ok = False
+        return ok
+
+    @command("mkdir", min_args=1, usage="mkdir [-p] <путь>...")
+    def cmd_mkdir(self, args):
+        """Команда mkdir - создание директорий"""
+        try:
+            paths, options = parse_options(args, {"-p": bool})
+        except ValueError as e:
+            self.print_output(f"ОШИБКА: {e}\n")
+            return False
+        return self.modify(self.vfs.make_directory, paths, parents="-p" in options)
+
+    @command("touch", min_args=1, usage="touch <путь>...")
+    def cmd_touch(self, args):
+        """Команда touch - создание пустых файлов"""
+        return self.modify(self.vfs.touch, args)
+
+    @command("rm", min_args=1, usage="rm [-r] <путь>...")
+    def cmd_rm(self, args):
+        """Команда rm - удаление файлов и директорий"""
+        try:
+            paths, options = parse_options(args, {"-r": bool})
+        except ValueError as e:
+            self.print_output(f"ОШИБКА: {e}\n")
+            return False
+        return self.modify(self.vfs.remove, paths, recursive="-r" in options)
+
+    @command("write", min_args=2, usage="write [-a] <путь> <текст>...")
+    def cmd_write(self, args):
+        """Команда write - запись текста в файл (-a - дописать в конец)"""
+        try:
+            positional, options = parse_options(args, {"-a": bool})
+            if len(positional) < 2:
+                raise ValueError("нужен путь и текст")
+        except ValueError as e:
+            self.print_output(f"ОШИБКА: {e}\n")
+            return False
+        data = (" ".join(positional[1:]) + "\n").encode('utf-8')
+        return self.modify(self.vfs.write_file, positional[:1], data=data,
+                           append="-a" in options)
+
+    @command("mount", local_only=True, usage="mount [-lazy] [-compact] <образ> <путь> | mount")
+    def cmd_mount(self, args):
+        """Команда mount - подключение XML-образа в точку монтирования или список подключенных"""
+        try:
+            positional, options = parse_options(args, {"-lazy": bool, "-compact": bool})
+            if len(positional) not in (0, 2):
+                raise ValueError("нужен образ и путь точки монтирования")
+        except ValueError as e:
+            self.print_output(f"ОШИБКА: {e}\n")
+            return False
+
+        if not positional:
+            mounts = self.vfs.mounts()
+            if not mounts:
+                self.print_output("Подключенных образов нет\n")
+            for mount in mounts:
+                if mount.error:
+                    state = f"ошибка: {mount.error}"
+                elif mount.loaded:
+                    state = f"загружен за {mount.load_seconds:.3f} с"
+                else:
+                    state = "не загружен"
+                self.print_output(f"{mount.path} <- {mount.image_path} ({state})\n")
+            return True
+
+        image_path = resolve_path(positional[0], log=lambda text: None)
+        try:
+            mount = self.vfs.mount(image_path, positional[1], cwd=self.cursor.current_path,
+                                   lazy="-lazy" in options, compact="-compact" in options)
+        except VFSError as e:
+            self.print_output(f"ОШИБКА: {e}\n")
+            return False
+        self.print_output(f"Образ {image_path} подключен в {mount.path}\n")
+        return True
+
+    def resolve_mounts(self, paths: List[str]) -> Optional[list]:
+        """Точки монтирования по путям (без путей - все), печатая ошибки"""
+        if not paths:
+            return self.vfs.mounts()
+        mounts = {mount.path: mount for mount in self.vfs.mounts()}
+        selected = []
+        for path in paths:
+            mount = mounts.get(self.cursor.resolve_full_path(path))
+            if mount is None:
+                self.print_output(f"ОШИБКА: '{path}' не является точкой монтирования\n")
+                return None
+            selected.append(mount)
+        return selected
+
+    @command("preload", local_only=True, usage="preload [путь]...")
+    def cmd_preload(self, args):
+        """Команда preload - параллельная загрузка образов точек монтирования"""
+        mounts = self.resolve_mounts(args)
+        if mounts is None:
+            return False
+        if all(mount.loaded for mount in mounts):
+            self.print_output("Все выбранные образы уже загружены\n")
+            return True
+        return report_preload(mounts, self.print_output)
+
+    @command("unload", min_args=1, local_only=True, usage="unload <путь>...")
+    def cmd_unload(self, args):
+        """Команда unload - выгрузка содержимого точек монтирования из памяти"""
+        ok = True
+        for path in args:
+            try:
+                unloaded = self.vfs.unload(path, cwd=self.cursor.current_path)
+            except VFSError as e:
+                self.print_output(f"ОШИБКА: {e}\n")
+                ok = False
+                continue
+            full_path = self.cursor.resolve_full_path(path)
+            self.print_output(f"Образ {full_path} выгружен\n" if unloaded
+                              else f"Образ {full_path} не был загружен\n")
+        return ok
+
+    @command("save", max_args=1, local_only=True, usage="save [путь]")
+    def cmd_save(self, args):
+        """Команда save - запись VFS в XML-файл или уплотнение журнала изменений"""
+        if args:
+            if not self.vfs.save_to_xml(args[0]):
+                self.print_output(f"ОШИБКА: Не удалось сохранить VFS в '{args[0]}'\n")
+                return False
+            self.print_output(f"VFS сохранена в: {args[0]}\n")
+            return True
+
+        journal = self.vfs.journal
+        if journal is None:
+            self.print_output("ОШИБКА: Журнал изменений не подключен, укажите путь\n")
+            return False
+        if journal.compact(self.vfs) is None:
+            self.print_output("Уплотнение журнала уже выполняется\n")
+        else:
+            self.print_output(f"Уплотнение журнала в образ {journal.base_path} запущено в фоне\n")
+        return True
+
+    @command("stats", max_args=2, usage="stats [префикс] | stats -dump <файл>")
+    def cmd_stats(self, args):
+        """Команда stats - перцентили задержек команд и загрузки, счетчики кэша"""
+        if args and args[0] == "-dump":
+            if self.remote:
+                self.print_output("ОШИБКА: stats -dump недоступна в удаленном сеансе\n")
+                return False
+            if len(args) != 2:
+                self.print_output("ОШИБКА: Использование: stats -dump <файл>\n")
+                return False
+            try:
+                metrics.dump(args[1])
+            except OSError as e:
+                self.print_output(f"ОШИБКА: Не удалось записать метрики: {e}\n")
+                return False
+            self.print_output(f"Метрики записаны в: {args[1]}\n")
+            return True
+        if len(args) > 1:
+            self.print_output("ОШИБКА: Использование: stats [префикс]\n")
+            return False
+
+        if not metrics.enabled:
+            self.print_output("Сбор метрик выключен (запустите с --metrics)\n")
+        lines = metrics.format_stats(args[0] if args else None)
+        if not lines:
+            self.print_output("Метрик пока нет\n")
+        for line in lines:
+            self.print_output(line + "\n")
+        return True
+
+    @command("exit")
+    def cmd_exit(self, args):
+        """Команда exit - завершение работы"""
+        self.print_output("Завершение работы эмулятора...\n")
+        self.exit_requested = True
+        return True
@@ -0,0 +1,211 @@
+"""
+Компактный бинарный снимок VFS для быстрого запуска
+
+Формат (little-endian):
+    заголовок      HEADER: сигнатура, версия, размеры таблиц, смещения
+                   областей, размер и mtime исходного XML-образа
+    содержимое     уже декодированные из base64 байты файлов подряд
+    строки         (n_strings + 1) смещений u32 и UTF-8 данные имен
+    узлы           записи NODE в прямом порядке обхода: имя (индекс строки),
+                   родитель (индекс узла), тип, смещение и длина содержимого
+
+Корень всегда записывается первым, и родитель любого узла стоит в таблице
+раньше него самого. Область содержимого не читается при загрузке: файлы
+ссылаются на нее через отображение в память.
+"""
+
+import binascii
+import os
+import struct
+from typing import Dict, List, Optional, Tuple
+
+from vfs import BlobStore, TreeBuilder, VFSDirectory, VFSImage, VFSNode, content_digest
+
+MAGIC = b"VFSSNAP\0"
+VERSION = 1
+
+# magic, version, n_strings, n_nodes, payload_offset, payload_size,
+# strings_offset, strings_size, nodes_offset, source_size, source_mtime_ns
+HEADER = struct.Struct("<8sIIIQQQQQQq")
+# name_index, parent_index, kind, payload_offset, payload_length
+NODE = struct.Struct("<IIBQQ")
+
+NO_PARENT = 0xFFFFFFFF
+
+KIND_DIRECTORY = 0
+# Содержимое хранится декодированным
+KIND_FILE = 1
+# Содержимое не удалось декодировать - хранится исходный base64
+KIND_FILE_BASE64 = 2
+
+SNAPSHOT_SUFFIX = ".snap"
+
+
+class SnapshotError(Exception):
+    """Ошибка чтения снимка VFS"""
+
+
+def snapshot_path_for(xml_path: str) -> str:
+    """Путь к снимку, лежащему рядом с XML-образом"""
+    return xml_path + SNAPSHOT_SUFFIX
+
+
+def _source_stamp(source_path: Optional[str]) -> Tuple[int, int]:
+    if not source_path:
+        return 0, 0
+    stat = os.stat(source_path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def is_snapshot_fresh(xml_path: str, snapshot_path: Optional[str] = None) -> bool:
+    """Снят ли снимок с текущей версии XML-образа"""
+    snapshot_path = snapshot_path or snapshot_path_for(xml_path)
+    try:
+        with open(snapshot_path, 'rb') as f:
+            header = f.read(HEADER.size)
+        if len(header) < HEADER.size:
+            return False
+        fields = HEADER.unpack(header)
+        return (fields[0] == MAGIC and fields[1] == VERSION
+                and (fields[9], fields[10]) == _source_stamp(xml_path))
+    except OSError:
+        return False
+
+
+def save_snapshot(root: VFSDirectory, snapshot_path: str, source_path: Optional[str] = None):
+    """
+    Записать дерево VFS в бинарный снимок
+
+    Содержимое файлов пишется потоково, в памяти держатся только таблица
+    узлов, таблица имен и хеши содержимого: одинаковое содержимое пишется
+    один раз, и файлы ссылаются на общий участок. Файл заменяется атомарно.
+
+    Args:
+        root: Корень дерева VFS
+        snapshot_path: Путь к файлу снимка
+        source_path: XML-образ, с которого снят снимок (для проверки свежести)
+    """
+    strings: Dict[str, int] = {}
+    nodes = bytearray()
+    node_count = 0
+    payload_size = 0
+    # (хеш, тип) -> смещение уже записанного содержимого
+    payloads: Dict[Tuple[bytes, int], int] = {}
+    tmp_path = snapshot_path + ".tmp"
+
+    def intern(name: str) -> int:
+        index = strings.get(name)
+        if index is None:
+            index = strings[name] = len(strings)
+        return index
+
+    with open(tmp_path, 'wb') as f:
+        f.write(b"\0" * HEADER.size)
+        payload_offset = HEADER.size
+
+        # Обход в прямом порядке с явным стеком: (узел, индекс родителя)
+        stack: List[Tuple[VFSNode, int]] = [(root, NO_PARENT)]
+        while stack:
+            node, parent_index = stack.pop()
+            if isinstance(node, VFSDirectory):
+                if not node.persistent:
+                    continue
+                nodes += NODE.pack(intern(node.name), parent_index, KIND_DIRECTORY, 0, 0)
+                for child in reversed(list(node.children.values())):
+                    stack.append((child, node_count))
+            else:
+                kind = KIND_FILE
+                try:
+                    data = node.get_bytes()
+                except (binascii.Error, ValueError):
+                    kind = KIND_FILE_BASE64
+                    data = node.get_encoded()
+                    if isinstance(data, str):
+                        data = data.encode('ascii', 'replace')
+                key = (content_digest((data,)), kind)
+                offset = payloads.get(key)
+                if offset is None:
+                    offset = payloads[key] = payload_size
+                    f.write(data)
+                    payload_size += len(data)
+                nodes += NODE.pack(intern(node.name), parent_index, kind, offset, len(data))
+            node_count += 1
+
+        strings_offset = payload_offset + payload_size
+        encoded_names = [name.encode('utf-8') for name in strings]
+        offsets = [0]
+        for name in encoded_names:
+            offsets.append(offsets[-1] + len(name))
+        f.write(struct.pack(f"<{len(offsets)}I", *offsets))
+        for name in encoded_names:
+            f.write(name)
+        strings_size = 4 * len(offsets) + offsets[-1]
+
+        nodes_offset = strings_offset + strings_size
+        f.write(nodes)
+
+        source_size, source_mtime = _source_stamp(source_path)
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, len(strings), node_count,
+                            payload_offset, payload_size, strings_offset, strings_size,
+                            nodes_offset, source_size, source_mtime))
+
+    os.replace(tmp_path, snapshot_path)
+
+
+def load_snapshot(snapshot_path: str,
+                  builder: Optional[TreeBuilder] = None) -> Tuple[VFSDirectory, dict]:
+    """
+    Загрузить дерево VFS из бинарного снимка
+
+    Снимок отображается в память; содержимое файлов не копируется,
+    а читается из отображения по запросу.
+
+    Args:
+        snapshot_path: Путь к файлу снимка
+        builder: Построитель дерева (по умолчанию - обычное дерево объектов)
+
+    Returns:
+        Tuple[VFSDirectory, dict]: Корень загруженного дерева и статистика
+        общего содержимого (BlobStore.stats)
+    """
+    raw_image = VFSImage(snapshot_path, encoded=False)
+    base64_image = raw_image.view(encoded=True)
+
+    if len(raw_image) < HEADER.size:
+        raise SnapshotError("файл слишком мал")
+    (magic, version, n_strings, n_nodes, payload_offset, payload_size,
+     strings_offset, strings_size, nodes_offset, _, _) = HEADER.unpack(raw_image.read(0, HEADER.size))
+    if magic != MAGIC:
+        raise SnapshotError("неверная сигнатура")
+    if version != VERSION:
+        raise SnapshotError(f"неподдерживаемая версия {version}")
+    if nodes_offset + n_nodes * NODE.size > len(raw_image) or n_nodes == 0:
+        raise SnapshotError("таблица узлов повреждена")
+
+    strings = raw_image.read(strings_offset, strings_size)
+    offsets = struct.unpack_from(f"<{n_strings + 1}I", strings)
+    names_start = 4 * (n_strings + 1)
+    names = [strings[names_start + offsets[i]:names_start + offsets[i + 1]].decode('utf-8')
+             for i in range(n_strings)]
+
+    if builder is None:
+        builder = TreeBuilder()
+    # Описатели директорий по индексу узла (для файлов - None)
+    built: list = []
+    blobs = BlobStore()
+    table = raw_image.read(nodes_offset, n_nodes * NODE.size)
+    for name_index, parent_index, kind, offset, length in NODE.iter_unpack(table):
+        handle = None
+        if parent_index == NO_PARENT:
+            handle = builder.root
+        elif kind == KIND_DIRECTORY:
+            handle = builder.add_directory(built[parent_index], names[name_index])
+        else:
+            image = raw_image if kind == KIND_FILE else base64_image
+            blobs.intern((kind, offset), None, length)
+            builder.add_file(built[parent_index], names[name_index], image=image,
+                             offset=payload_offset + offset, length=length)
+        built.append(handle)
+
+    return builder.finish(), blobs.stats()
@@ -0,0 +1,49 @@
+import base64
+import os
+import sys
+
+import pytest
+
+# Модули проекта лежат в корне репозитория
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Содержимое файлов образа payload_image: разные длины добивки base64,
+# многобайтовый UTF-8, двоичные данные и пустой файл
+PAYLOADS = {
+    "text.txt": "".join(f"Строка {number}: содержимое файла\n" for number in range(200)).encode(),
+    "pad1.bin": bytes(range(7)) * 13,
+    "pad2.bin": bytes(range(11)) * 7,
+    "binary.bin": bytes(range(256)) * 5,
+    "empty.txt": b"",
+}
+
+# Файлы, base64 которых записан с переносами строк (как base64.encodebytes)
+WRAPPED = {
+    "wrapped.txt": "".join(f"line {number}\n" for number in range(300)).encode(),
+    "wrapped.bin": bytes(range(200)) * 3,
+}
+
+
+@pytest.fixture
+def payload_image(tmp_path):
+    """
+    XML-образ с файлами PAYLOADS в /clean и WRAPPED в /wrapped
+
+    Returns:
+        (путь к образу, словарь полный путь -> ожидаемые байты)
+    """
+    expected = {}
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>', "<vfs>", '  <directory name="clean">']
+    for name, data in PAYLOADS.items():
+        expected[f"/clean/{name}"] = data
+        lines.append(f'    <file name="{name}"> {base64.b64encode(data).decode()} </file>')
+    lines += ["  </directory>", '  <directory name="wrapped">']
+    for name, data in WRAPPED.items():
+        expected[f"/wrapped/{name}"] = data
+        encoded = base64.encodebytes(data).decode().replace("\n", "\n      ")
+        lines.append(f'    <file name="{name}">\n      {encoded}</file>')
+    lines += ["  </directory>", "</vfs>"]
+
+    path = tmp_path / "payloads.xml"
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return str(path), expected
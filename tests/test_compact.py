@@ -0,0 +1,80 @@
+"""Компактное дерево: тот же API, что у дерева объектов, и копирование при записи"""
+
+import pytest
+
+from compact import CompactDirectory
+from vfs import VFS, VFSDirectory, VFSError, walk
+
+
+def load(image, compact, lazy=False):
+    vfs = VFS()
+    assert vfs.load_from_xml(image, lazy=lazy, compact=compact)
+    return vfs
+
+
+def listing(directory):
+    return [(name, isinstance(directory.get_child(name), VFSDirectory))
+            for name in directory.sorted_names()]
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_compact_tree_matches_object_tree(payload_image, lazy):
+    image, expected = payload_image
+    objects, compact = load(image, False, lazy), load(image, True, lazy)
+    assert isinstance(compact.root, CompactDirectory)
+
+    assert ([(path, isinstance(node, VFSDirectory)) for path, node, _ in walk(compact.root, "/")]
+            == [(path, isinstance(node, VFSDirectory)) for path, node, _ in walk(objects.root, "/")])
+    for path in ("/", "/clean", "/wrapped"):
+        plain, packed = objects.resolve_path(path), compact.resolve_path(path)
+        assert listing(packed) == listing(plain)
+        assert packed.child_count() == plain.child_count()
+        assert packed.list_children() == plain.list_children()
+        assert packed.prefix_range("pad") == plain.prefix_range("pad")
+        assert packed.name_range(1, 3) == plain.name_range(1, 3)
+        assert [node.name for node in packed.list_page(1, 2)] == \
+            [node.name for node in plain.list_page(1, 2)]
+    for path, data in expected.items():
+        assert compact.resolve_path(path).get_bytes() == data, path
+
+
+def test_compact_directories_are_copied_on_write(payload_image):
+    image, expected = payload_image
+    vfs = load(image, True)
+    wrapped = vfs.resolve_path("/wrapped")
+    clean = vfs.resolve_path("/clean")
+    with pytest.raises(VFSError):
+        clean.add_child(VFSDirectory("direct"))
+
+    vfs.write_file("/clean/new.txt", b"new")
+    vfs.remove("/clean/empty.txt")
+
+    # Измененная директория стала обычной, соседняя осталась в таблицах
+    assert not isinstance(vfs.resolve_path("/clean"), CompactDirectory)
+    assert vfs.resolve_path("/wrapped") is wrapped
+    assert vfs.resolve_path("/clean/new.txt").get_bytes() == b"new"
+    assert vfs.resolve_path("/clean/empty.txt") is None
+    assert vfs.resolve_path("/clean/binary.bin").get_bytes() == expected["/clean/binary.bin"]
+
+
+def test_compact_fork_keeps_base_tables(payload_image):
+    image, _ = payload_image
+    base = load(image, True)
+    fork = base.fork()
+    fork.make_directory("/wrapped/sub")
+
+    assert base.resolve_path("/wrapped/sub") is None
+    assert isinstance(base.resolve_path("/wrapped"), CompactDirectory)
+    assert fork.resolve_path("/wrapped/sub") is not None
+
+
+def test_compact_eager_load_stores_duplicates_once(tmp_path):
+    image = tmp_path / "duplicates.xml"
+    image.write_text('<vfs><file name="a">QUJD</file><file name="b">QUJD</file>'
+                     '<file name="c">REVG</file></vfs>', encoding="utf-8")
+    vfs = load(str(image), True)
+
+    a, b, c = (vfs.resolve_path(f"/{name}") for name in "abc")
+    assert a.content_key() == b.content_key() != c.content_key()
+    assert (a.get_bytes(), c.get_bytes()) == (b"ABC", b"DEF")
+    assert vfs.load_stats["duplicates"] == 1
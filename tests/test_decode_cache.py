@@ -0,0 +1,35 @@
+"""Кэш декодированного содержимого: бюджет в байтах памяти, а не в символах"""
+
+import sys
+
+from vfs import DecodeCache
+
+
+def test_budget_counts_memory_of_non_ascii_text():
+    ascii_text = "a" * 1000
+    cyrillic_text = "я" * 1000
+    assert sys.getsizeof(cyrillic_text) > 2 * len(cyrillic_text)
+
+    cache = DecodeCache(max_bytes=3 * sys.getsizeof(ascii_text))
+    for number in range(3):
+        cache.put(("ascii", number), ascii_text)
+    assert len(cache) == 3
+
+    # Две кириллические строки занимают больше, чем три ASCII той же длины
+    cache.put("first", cyrillic_text)
+    cache.put("second", cyrillic_text)
+    assert len(cache) == 1 and cache.get("second") == cyrillic_text
+    assert cache.current_bytes == sys.getsizeof(cyrillic_text)
+
+
+def test_replacing_and_oversized_values():
+    cache = DecodeCache(max_bytes=sys.getsizeof("x" * 100))
+    cache.put("key", "x" * 10)
+    cache.put("key", "y" * 20)
+    assert len(cache) == 1 and cache.current_bytes == sys.getsizeof("y" * 20)
+
+    cache.put("big", "z" * 200)
+    assert cache.get("big") is None and cache.get("key") == "y" * 20
+
+    cache.set_limit(0)
+    assert len(cache) == 0 and cache.current_bytes == 0
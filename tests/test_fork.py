@@ -0,0 +1,63 @@
+"""Версии VFS: изменения копируют только путь от корня и не видны другим версиям"""
+
+import pytest
+
+from vfs import MAX_INDEX_LAYERS, VFSError, create_default_vfs
+
+
+def test_fork_changes_stay_private():
+    base = create_default_vfs()
+    fork = base.fork()
+
+    fork.make_directory("/home/new")
+    fork.write_file("/home/new/file.txt", b"fork")
+    fork.write_file("/home/readme.txt", b"changed")
+    fork.remove("/tmp")
+
+    assert base.resolve_path("/home/new") is None
+    assert base.resolve_path("/tmp") is not None
+    assert base.resolve_path("/home/readme.txt").get_bytes() != b"changed"
+    assert fork.resolve_path("/home/new/file.txt").get_bytes() == b"fork"
+    assert fork.resolve_path("/tmp") is None
+
+    # И в обратную сторону: изменения основы не попадают в версию
+    base.make_directory("/var/log")
+    assert fork.resolve_path("/var/log") is None
+
+
+def test_fork_shares_untouched_nodes():
+    base = create_default_vfs()
+    base.write_file("/var/data.bin", b"x" * 1000)
+    fork = base.fork()
+    fork.make_directory("/home/documents/new")
+
+    # Директории на пути изменения скопированы, остальное дерево общее
+    assert fork.root is not base.root
+    assert fork.resolve_path("/home") is not base.resolve_path("/home")
+    assert fork.resolve_path("/var") is base.resolve_path("/var")
+    assert fork.resolve_path("/var/data.bin") is base.resolve_path("/var/data.bin")
+    assert fork.resolve_path("/home/note.txt") is base.resolve_path("/home/note.txt")
+
+
+def test_fork_chain_flattens_index_layers():
+    versions = [create_default_vfs()]
+    for number in range(MAX_INDEX_LAYERS * 3):
+        vfs = versions[-1].fork()
+        vfs.make_directory(f"/tmp/v{number}")
+        versions.append(vfs)
+
+    last = versions[-1]
+    assert all(last.resolve_path(f"/tmp/v{number}") is not None
+               for number in range(MAX_INDEX_LAYERS * 3))
+    assert versions[3].resolve_path("/tmp/v3") is None
+    assert versions[3].resolve_path("/tmp/v2") is not None
+
+
+def test_failed_write_leaves_fork_unchanged():
+    base = create_default_vfs()
+    fork = base.fork()
+    with pytest.raises(VFSError):
+        fork.make_directory("/home/readme.txt/child")
+    with pytest.raises(VFSError):
+        fork.remove("/home")
+    assert fork.resolve_path("/home/readme.txt") is base.resolve_path("/home/readme.txt")
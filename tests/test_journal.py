@@ -0,0 +1,88 @@
+"""Журнал изменений: проигрывание поверх образа и уплотнение в фоне"""
+
+import os
+
+import pytest
+
+from journal import JournalError, journal_path_for, open_journal
+from vfs import VFS, create_default_vfs
+
+
+@pytest.fixture
+def image(tmp_path):
+    path = tmp_path / "image.xml"
+    assert create_default_vfs().save_to_xml(str(path))
+    return str(path)
+
+
+def load(image_path):
+    vfs = VFS()
+    assert vfs.load_from_xml(image_path)
+    journal, applied = open_journal(vfs, image_path)
+    return vfs, journal, applied
+
+
+def test_replay_restores_changes(image):
+    vfs, journal, applied = load(image)
+    assert applied == 0
+    vfs.make_directory("/home/new")
+    vfs.write_file("/home/new/log.txt", b"one\n")
+    vfs.write_file("/home/new/log.txt", b"two\n", append=True)
+    vfs.remove("/tmp")
+    journal.close()
+
+    restored, journal, applied = load(image)
+    journal.close()
+    assert applied == 4
+    assert restored.resolve_path("/home/new/log.txt").get_bytes() == b"one\ntwo\n"
+    assert restored.resolve_path("/tmp") is None
+
+
+def test_torn_last_record_is_dropped(image):
+    vfs, journal, _ = load(image)
+    vfs.make_directory("/kept")
+    journal.close()
+    with open(journal_path_for(image), "ab") as f:
+        f.write(b'{"op": "mkdir", "pa')
+
+    restored, journal, applied = load(image)
+    restored.make_directory("/after")
+    journal.close()
+    assert applied == 1
+
+    restored, journal, applied = load(image)
+    journal.close()
+    assert applied == 2
+    assert restored.resolve_path("/after") is not None
+
+
+def test_journal_for_other_image_is_rejected(image):
+    vfs, journal, _ = load(image)
+    vfs.make_directory("/kept")
+    journal.close()
+    stat = os.stat(image)
+    os.utime(image, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    with pytest.raises(JournalError, match="другой версии"):
+        load(image)
+
+
+def test_compact_writes_image_and_keeps_later_records(image):
+    vfs, journal, _ = load(image)
+    vfs.make_directory("/before")
+    thread = journal.compact(vfs)
+    vfs.make_directory("/during")
+    thread.join()
+    journal.close()
+
+    # Образ содержит изменения до уплотнения, журнал - только последующие
+    base = VFS()
+    assert base.load_from_xml(image)
+    assert base.resolve_path("/before") is not None
+    assert base.resolve_path("/during") is None
+
+    restored, journal, applied = load(image)
+    journal.close()
+    assert restored.resolve_path("/before") is not None
+    assert restored.resolve_path("/during") is not None
+    assert applied == 1
@@ -0,0 +1,60 @@
+"""Индекс имен locate: один индекс исходной VFS на все ответвления"""
+
+from locate import attach_name_index, locate
+from vfs import create_default_vfs
+
+
+def build_base():
+    vfs = create_default_vfs()
+    vfs.make_directory("/shared")
+    vfs.write_file("/shared/notes.txt", b"x")
+    return vfs
+
+
+def test_forks_share_one_index():
+    base = build_base()
+    first, second = base.fork(), base.fork()
+
+    index = attach_name_index(first, background=False)
+    assert attach_name_index(second, background=False) is index
+    assert base.names is index and first.names is None and second.names is None
+
+    # Созданное в сеансе видно только в нем самом
+    first.write_file("/shared/drafts.txt", b"y")
+    assert list(locate(first, "*s*.txt")) == ["/shared/notes.txt", "/shared/drafts.txt"]
+    assert list(locate(second, "*s*.txt")) == ["/shared/notes.txt"]
+    assert second.names_created == {}
+
+    # Удаленное в сеансе отсеивается проверкой по его дереву
+    second.remove("/shared/notes.txt")
+    assert list(locate(second, "*s*.txt")) == []
+    assert list(locate(first, "notes.txt")) == ["/shared/notes.txt"]
+
+
+def test_fork_builds_own_index_after_origin_removal():
+    base = build_base()
+    fork = base.fork()
+    base.remove("/shared/notes.txt")
+
+    index = attach_name_index(fork, background=False)
+    assert index is fork.names and base.names is None
+    assert list(locate(fork, "notes.txt")) == ["/shared/notes.txt"]
+
+
+def test_contains_among_many_equal_names():
+    vfs = create_default_vfs()
+    for number in range(300):
+        vfs.make_directory(f"/d{number}")
+        vfs.write_file(f"/d{number}/README", b"x")
+    index = attach_name_index(vfs, background=False)
+
+    assert all(index.contains(f"/d{number}/README", False) for number in range(300))
+    assert not index.contains("/d7/README", True)
+    assert not index.contains("/home/README", False)
+    assert not index.contains("/missing/README", False)
+
+    # Новые узлы с частым именем находятся ровно один раз
+    vfs.write_file("/home/README", b"y")
+    vfs.write_file("/d7/README", b"z")
+    found = list(locate(vfs, "README"))
+    assert len(found) == 301 and found.count("/home/README") == 1
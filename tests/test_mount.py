@@ -0,0 +1,80 @@
+"""Точки монтирования: только чтение, без следа в журнале и сохраняемом образе"""
+
+import pytest
+
+from shell import load_vfs
+from vfs import VFSError, create_default_vfs
+
+
+def quiet(text):
+    pass
+
+
+@pytest.fixture
+def images(tmp_path):
+    """Основной образ и подключаемый образ с директорией /data"""
+    base = tmp_path / "base.xml"
+    assert create_default_vfs().save_to_xml(str(base))
+
+    mounted_vfs = create_default_vfs()
+    mounted_vfs.make_directory("/data")
+    mounted = tmp_path / "mounted.xml"
+    assert mounted_vfs.save_to_xml(str(mounted))
+    return base, mounted
+
+
+def test_write_inside_mount_is_rejected(images):
+    base, mounted = images
+    vfs, loaded = load_vfs(str(base), quiet, use_snapshot=False, journal=True,
+                           mounts=[(str(mounted), "/mnt")])
+    assert loaded
+
+    for operation in (lambda: vfs.make_directory("/mnt/new"),
+                      lambda: vfs.write_file("/mnt/data/file.txt", b"x"),
+                      lambda: vfs.remove("/mnt/data")):
+        with pytest.raises(VFSError, match="только для чтения"):
+            operation()
+
+    # Точка монтирования осталась точкой монтирования
+    assert [mount.path for mount in vfs.mounts()] == ["/mnt"]
+    assert vfs.unload("/mnt")
+    vfs.journal.close()
+
+
+def test_mount_survives_save_and_restart(images, tmp_path):
+    base, mounted = images
+    vfs, _ = load_vfs(str(base), quiet, use_snapshot=False, journal=True,
+                      mounts=[(str(mounted), "/mnt")])
+    vfs.make_directory("/new")
+    with pytest.raises(VFSError):
+        vfs.make_directory("/mnt/new")
+    assert vfs.resolve_path("/mnt/data") is not None
+
+    saved = tmp_path / "saved.xml"
+    assert vfs.save_to_xml(str(saved))
+    assert "data" not in saved.read_text(encoding="utf-8")
+    vfs.journal.close()
+
+    # Без --mount журнал проигрывается без ошибок, и изменения снова пишутся
+    messages = []
+    restarted, loaded = load_vfs(str(base), messages.append, use_snapshot=False, journal=True)
+    assert loaded
+    assert not any("ОШИБКА" in message for message in messages)
+    assert restarted.journal is not None
+    assert restarted.resolve_path("/new") is not None
+    assert restarted.resolve_path("/mnt") is None
+    restarted.journal.close()
+
+
+def test_rm_unmounts_without_journal_entry(images):
+    base, mounted = images
+    vfs, _ = load_vfs(str(base), quiet, use_snapshot=False, journal=True,
+                      mounts=[(str(mounted), "/mnt")])
+    vfs.remove("/mnt")
+    assert vfs.resolve_path("/mnt") is None
+    assert vfs.mounts() == []
+    vfs.journal.close()
+
+    messages = []
+    load_vfs(str(base), messages.append, use_snapshot=False, journal=True)[0].journal.close()
+    assert not any("ОШИБКА" in message for message in messages)
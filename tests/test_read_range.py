@@ -0,0 +1,54 @@
+"""Чтение диапазонов байт и строк без декодирования всего файла"""
+
+import pytest
+
+from snapshot import snapshot_path_for
+from vfs import VFS, _split_lines
+
+LOADERS = {
+    "eager": lambda vfs, image: vfs.load_from_xml(image),
+    "lazy": lambda vfs, image: vfs.load_from_xml(image, lazy=True),
+    "compact": lambda vfs, image: vfs.load_from_xml(image, compact=True),
+    "lazy-compact": lambda vfs, image: vfs.load_from_xml(image, lazy=True, compact=True),
+    "snapshot": lambda vfs, image: (VFS().load_image(image, use_snapshot=True)
+                                    and vfs.load_snapshot(snapshot_path_for(image))),
+}
+
+
+@pytest.fixture(params=sorted(LOADERS))
+def loaded(request, payload_image):
+    image, expected = payload_image
+    vfs = VFS()
+    assert LOADERS[request.param](vfs, image)
+    return vfs, expected
+
+
+def test_read_range_matches_slices(loaded):
+    vfs, expected = loaded
+    for path, data in expected.items():
+        node = vfs.resolve_path(path)
+        assert node.size() == len(data), path
+        for start in (0, 1, 2, 3, 4, 5, len(data) // 2, max(len(data) - 1, 0), len(data)):
+            for length in (0, 1, 2, 3, 4, 7, 100, len(data) + 10):
+                assert node.read_range(start, length) == data[start:start + length], \
+                    (path, start, length)
+
+
+def test_iter_bytes_small_chunks(loaded):
+    vfs, expected = loaded
+    for path, data in expected.items():
+        node = vfs.resolve_path(path)
+        chunks = list(node.iter_bytes(5, len(data) - 3, chunk_size=7))
+        assert all(len(chunk) <= 6 for chunk in chunks), path
+        assert b"".join(chunks) == data[5:len(data) - 3], path
+
+
+@pytest.mark.parametrize("count", [0, 1, 2, 10, 1000])
+def test_head_and_tail_lines(loaded, count):
+    vfs, expected = loaded
+    for path, data in expected.items():
+        node = vfs.resolve_path(path)
+        lines = _split_lines(data)
+        assert node.head_lines(count) == b"".join(lines[:count]), path
+        assert node.tail_lines(count, chunk_size=64) == \
+            (b"".join(lines[-count:]) if count else b""), path
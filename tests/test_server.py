@@ -0,0 +1,31 @@
+"""Удаленные сеансы: команды с доступом к файлам машины сервера запрещены"""
+
+from shell import Shell, compile_command
+from vfs import create_default_vfs
+
+
+def run(shell, text):
+    return shell.execute(compile_command(text))
+
+
+def test_remote_session_refuses_host_commands(tmp_path):
+    output = []
+    shell = Shell(create_default_vfs(), output.append, remote=True)
+    image = tmp_path / "image.xml"
+    dump = tmp_path / "metrics.json"
+
+    for text in (f"save {tmp_path / 'saved.xml'}", f"stats -dump {dump}",
+                 f"mount {image} /mnt", "mount", "preload", "unload /mnt"):
+        output.clear()
+        assert not run(shell, text), text
+        assert "недоступна в удаленном сеансе" in "".join(output)
+    assert list(tmp_path.iterdir()) == []
+
+    assert run(shell, "ls /home | head 1")
+    assert run(shell, "stats")
+
+
+def test_local_session_keeps_host_commands(tmp_path):
+    shell = Shell(create_default_vfs(), lambda text: None)
+    assert run(shell, f"save {tmp_path / 'saved.xml'}")
+    assert (tmp_path / "saved.xml").exists()
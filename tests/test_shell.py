@@ -0,0 +1,105 @@
+"""Конвейеры и дополнение ввода оболочки"""
+
+from shell import SEPARATOR, STREAM_THRESHOLD_BYTES, Shell, compile_command, split_pipeline
+from vfs import VFSFile, create_default_vfs
+
+
+def run(shell, text):
+    """Выполнить команду и вернуть ее вывод без разделителя"""
+    output = []
+    shell.print_output = output.append
+    assert shell.execute(compile_command(text))
+    return "".join(output).removesuffix(SEPARATOR)
+
+
+def test_split_pipeline_ignores_quoted_bars():
+    assert split_pipeline("grep 'a|b' /x | head 2") == ["grep 'a|b' /x ", " head 2"]
+    assert split_pipeline('grep "a|b" /x') == ['grep "a|b" /x']
+    assert split_pipeline("grep a\\|b /x|wc") == ["grep a\\|b /x", "wc"]
+
+
+def test_pipeline_stage_must_read_input():
+    assert compile_command("ls | cd /").error == "ОШИБКА: Команда 'cd' не читает ввод из конвейера"
+    assert compile_command("ls |").error == "ОШИБКА: Пустая команда в конвейере"
+    assert compile_command("ls | head 1").error is None
+
+
+def test_pipeline_filters():
+    vfs = create_default_vfs()
+    vfs.write_file("/tmp/fruit.txt", b"10 apple\n9 banana\n2 cherry\napricot\n")
+    shell = Shell(vfs, lambda text: None)
+
+    assert run(shell, "cat /tmp/fruit.txt | wc -l") == "4\n"
+    assert run(shell, "cat /tmp/fruit.txt | grep ap | sort -r") == "apricot\n10 apple\n"
+    assert run(shell, "cat /tmp/fruit.txt | sort -n | head 2") == "apricot\n2 cherry\n"
+
+
+def test_pipeline_stops_reading_upstream(monkeypatch):
+    vfs = create_default_vfs()
+    line = b"x" * 99 + b"\n"
+    vfs.write_file("/tmp/big.log", line * (4 * STREAM_THRESHOLD_BYTES // len(line)))
+    shell = Shell(vfs, lambda text: None)
+
+    decoded = []
+    iter_bytes = VFSFile.iter_bytes
+
+    def counting_iter_bytes(self, *args, **kwargs):
+        for chunk in iter_bytes(self, *args, **kwargs):
+            decoded.append(len(chunk))
+            yield chunk
+
+    monkeypatch.setattr(VFSFile, "iter_bytes", counting_iter_bytes)
+    assert run(shell, "cat /tmp/big.log | head 2") == (line * 2).decode()
+    # Прочитана первая порция, а не все 4 МБ
+    assert sum(decoded) < STREAM_THRESHOLD_BYTES // 8
+
+
+def test_cat_header_stays_out_of_pipeline():
+    vfs = create_default_vfs()
+    vfs.write_file("/tmp/lines.txt", b"b\na\n")
+    shell = Shell(vfs, lambda text: None)
+
+    assert run(shell, "cat /tmp/lines.txt | sort") == "a\nb\n"
+    assert run(shell, "cat -offset 2 /tmp/lines.txt | head 1") == "a\n"
+    assert run(shell, "cat /tmp/lines.txt").startswith("Содержимое файла '/tmp/lines.txt':\n")
+
+
+def test_completion_quotes_names_with_spaces():
+    vfs = create_default_vfs()
+    vfs.make_directory("/home/my docs")
+    vfs.write_file("/home/my docs/a b.txt", b"x")
+    vfs.write_file("/home/my docs/a c.txt", b"x")
+    shell = Shell(vfs, lambda text: None)
+
+    assert shell.complete("ls /home/my") == ("ls '/home/my docs/'", [])
+    assert shell.complete("ls /home/my\\ d") == ("ls '/home/my docs/'", [])
+    # Общий префикс вставляется с открытой кавычкой, чтобы ввод продолжался
+    assert shell.complete("ls '/home/my docs/") == ("ls '/home/my docs/a ", ["a b.txt", "a c.txt"])
+    assert shell.complete("cat \"/home/my docs/a b") == ("cat '/home/my docs/a b.txt' ", [])
+    assert shell.complete("ls /home/") == ("ls /home/", ["documents", "downloads", "my docs",
+                                                         "note.txt", "readme.txt"])
+    assert shell.complete("ls | he") == ("ls | head ", [])
+
+
+def test_ls_page_footer():
+    shell = Shell(create_default_vfs(), lambda text: None)
+    shell.cursor.change_directory("/tmp")
+
+    # Смещение за концом директории: ни записей, ни неверного диапазона
+    assert run(shell, "ls -offset 10 /home") == "... нет записей: в директории всего 4\n"
+
+    # Подсказка листает ту же директорию с тем же размером страницы
+    first_page = run(shell, "ls -limit 3 /home")
+    assert first_page.endswith("... показаны записи 1-3 из 4, далее: ls -offset 3 -limit 3 /home\n")
+    last_page = run(shell, "ls -offset 3 -limit 3 /home")
+    assert last_page.endswith("... показаны записи 4-4 из 4\n")
+    assert first_page.count("\n") + last_page.count("\n") == 4 + 2
+
+    # Без пути в подсказку попадает текущая директория
+    shell.vfs.make_directory("/tmp/my dir")
+    shell.vfs.make_directory("/tmp/other")
+    assert run(shell, "ls -limit 1").endswith("далее: ls -offset 1 -limit 1 /tmp\n")
+    shell.cursor.change_directory("/tmp/my dir")
+    shell.vfs.make_directory("/tmp/my dir/a")
+    shell.vfs.make_directory("/tmp/my dir/b")
+    assert run(shell, "ls -limit 1").endswith("далее: ls -offset 1 -limit 1 '/tmp/my dir'\n")
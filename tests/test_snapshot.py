@@ -0,0 +1,49 @@
+"""Бинарный снимок: то же дерево и содержимое, что и в XML-образе"""
+
+import os
+
+import pytest
+
+from snapshot import is_snapshot_fresh, snapshot_path_for
+from vfs import VFS, VFSDirectory, walk
+
+
+def tree(vfs):
+    return [(path, isinstance(node, VFSDirectory)) for path, node, _ in walk(vfs.root, "/")]
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_snapshot_round_trip(payload_image, compact):
+    image, expected = payload_image
+    source = VFS()
+    assert source.load_image(image, use_snapshot=True)
+    snapshot = snapshot_path_for(image)
+    assert is_snapshot_fresh(image, snapshot)
+
+    restored = VFS()
+    assert restored.load_snapshot(snapshot, compact=compact)
+    assert sorted(tree(restored)) == sorted(tree(source))
+    for path, data in expected.items():
+        node = restored.resolve_path(path)
+        assert node.get_bytes() == data, path
+        assert node.size() == len(data), path
+
+
+def test_snapshot_keeps_undecodable_payload(tmp_path):
+    image = tmp_path / "broken.xml"
+    image.write_text('<vfs><file name="bad.txt">not base64!</file></vfs>', encoding="utf-8")
+    source = VFS()
+    assert source.load_image(str(image), use_snapshot=True)
+
+    restored = VFS()
+    assert restored.load_snapshot(snapshot_path_for(str(image)))
+    assert source.resolve_path("/bad.txt").get_encoded() == "not base64!"
+    assert restored.resolve_path("/bad.txt").get_encoded() == b"not base64!"
+
+
+def test_snapshot_goes_stale_when_image_changes(payload_image):
+    image, _ = payload_image
+    assert VFS().load_image(image, use_snapshot=True)
+    stat = os.stat(image)
+    os.utime(image, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert not is_snapshot_fresh(image)
@@ -1,77 +1,1086 @@
 import xml.etree.ElementTree as ET
 import base64
+import bisect
+import codecs
+import hashlib
+import mmap
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
 from pathlib import Path
-from typing import Dict, List, Optional, Union
+from typing import Callable, Dict, List, Optional, Tuple, Union
+from xml.parsers import expat
+from xml.sax.saxutils import escape, quoteattr
+
+import metrics
+
+
+# Как часто (в узлах) потоковый загрузчик сообщает о прогрессе
+PROGRESS_INTERVAL = 10000
+
+# Бюджет кэша декодированного содержимого по умолчанию (байт)
+DEFAULT_DECODE_CACHE_BYTES = 64 * 1024 * 1024
+
+# Размер порции, которой ленивый загрузчик подает образ в парсер
+LAZY_PARSE_CHUNK = 1024 * 1024
+
+# Сколько недавно разрешенных относительных путей запоминается
+RELATIVE_PATH_CACHE_SIZE = 256
+
+# После скольких слоев (ответвлений версий) индекс путей уплотняется в один
+MAX_INDEX_LAYERS = 8
+
+# Порция потокового декодирования содержимого файла (байт, кратно 3)
+DECODE_CHUNK_BYTES = 48 * 1024
+
+# Сколько первых байт файла проверяется, чтобы отличить двоичный файл от текста
+BINARY_SAMPLE_BYTES = 8 * 1024
+
+BASE64_WHITESPACE = " \t\r\n"
+_BASE64_WHITESPACE_BYTES = BASE64_WHITESPACE.encode('ascii')
+
+
+class DecodeCache:
+    """
+    LRU-кэш декодированного содержимого файлов с ограничением по байтам
+
+    Учитывается память строк (sys.getsizeof), а не число символов: строка
+    с кириллицей занимает по 2 байта на символ, с эмодзи - по 4.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_DECODE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        # ключ -> (значение, занимаемая им память)
+        self._entries: "OrderedDict[object, Tuple[str, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key) -> Optional[str]:
+        """Получить значение и отметить его как недавно использованное"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value: str):
+        """Положить значение, вытесняя самые старые записи сверх бюджета"""
+        size = sys.getsizeof(value)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[1]
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+            self._evict()
+
+    def set_limit(self, max_bytes: int):
+        """Изменить бюджет кэша"""
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self):
+        """Очистить кэш"""
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def _evict(self):
+        while self.current_bytes > self.max_bytes and self._entries:
+            _, (_, size) = self._entries.popitem(last=False)
+            self.current_bytes -= size
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Общий кэш декодированного содержимого для всех файлов VFS
+decode_cache = DecodeCache()
+
+
+def set_decode_cache_limit(max_bytes: int):
+    """Задать общий бюджет кэша декодированного содержимого (байт)"""
+    decode_cache.set_limit(max_bytes)
+
+
+def content_digest(chunks) -> bytes:
+    """Хеш содержимого, переданного кусками (str или bytes)"""
+    digest = hashlib.blake2b(digest_size=16)
+    for chunk in chunks:
+        digest.update(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+    return digest.digest()
+
+
+class BlobStore:
+    """
+    Таблица содержимого файлов по хешу на время загрузки образа
+
+    Одинаковое содержимое хранится в одном экземпляре: файлы получают
+    общую строку base64 (или общий участок образа), а значит и общую
+    запись в decode_cache. refs считает файлы, ссылающиеся на каждый
+    экземпляр; после загрузки таблица не нужна - временем жизни общего
+    содержимого управляет обычный подсчет ссылок Python.
+    """
+
+    def __init__(self):
+        # ключ -> [общее содержимое, число ссылок, размер в байтах]
+        self._blobs: Dict[object, list] = {}
+        self.files = 0
+        self.total_bytes = 0
+
+    def intern(self, key, payload, size: int):
+        """Вернуть общий экземпляр содержимого с ключом key, запомнив payload при первой встрече"""
+        self.files += 1
+        self.total_bytes += size
+        blob = self._blobs.get(key)
+        if blob is None:
+            self._blobs[key] = [payload, 1, size]
+            return payload
+        blob[1] += 1
+        return blob[0]
+
+    def stats(self) -> dict:
+        """Сколько файлов и байт содержимого удалось разделить"""
+        unique_bytes = sum(blob[2] for blob in self._blobs.values())
+        return {
+            "files": self.files,
+            "unique": len(self._blobs),
+            "duplicates": self.files - len(self._blobs),
+            "total_bytes": self.total_bytes,
+            "saved_bytes": self.total_bytes - unique_bytes,
+            "max_refs": max((blob[1] for blob in self._blobs.values()), default=0),
+        }
+
+
+class VFSImage:
+    """
+    Образ VFS, отображенный в память (mmap) только для чтения
+
+    encoded указывает, хранятся ли участки содержимого файлов в base64
+    (XML-образ) или уже декодированными байтами (бинарный снимок).
+    Вместо отображения можно передать готовый буфер bytearray (так
+    компактное дерево хранит содержимое, загруженное в память).
+    """
+
+    def __init__(self, path: str, encoded: bool = True,
+                 mapping: Optional[Union[mmap.mmap, bytearray]] = None):
+        self.path = path
+        self.encoded = encoded
+        if mapping is None:
+            with open(path, 'rb') as f:
+                mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._map = mapping
+
+    def view(self, encoded: bool) -> 'VFSImage':
+        """Тот же образ с другим способом хранения содержимого (без копирования)"""
+        return VFSImage(self.path, encoded, self._map)
+
+    def __len__(self):
+        return len(self._map)
+
+    def read(self, offset: int, length: int) -> bytes:
+        """Прочитать участок образа"""
+        data = self._map[offset:offset + length]
+        return data if isinstance(data, bytes) else bytes(data)
+
+    def find(self, sub: bytes, start: int, end: int) -> int:
+        """Найти подстроку в участке образа без копирования"""
+        return self._map.find(sub, start, end)
+
+    def close(self):
+        self._map.close()
+
+
+def base64_decoded_size(encoded: Union[str, bytes]) -> int:
+    """Размер данных после декодирования base64 (пробельные символы не считаются)"""
+    whitespace = b" \t\r\n" if isinstance(encoded, bytes) else " \t\r\n"
+    length = len(encoded)
+    for char in whitespace:
+        length -= encoded.count(char)
+
+    padding = 0
+    end = len(encoded)
+    while end > 0 and padding < 2:
+        char = encoded[end - 1:end]
+        end -= 1
+        if char in whitespace:
+            continue
+        if char in ("=", b"="):
+            padding += 1
+        else:
+            break
+    return max(length * 3 // 4 - padding, 0)
+
+
+class VFSError(Exception):
+    """Ошибка операции над VFS (неверный путь, конфликт имен и т.п.)"""
 
 
 class VFSNode:
-    """Базовый класс для узлов VFS"""
+    """
+    Базовый класс для узлов VFS
+
+    Узлы объявляют __slots__: в больших деревьях словарь атрибутов на
+    каждый узел занимал бы больше памяти, чем имена и содержимое.
+    """
+
+    __slots__ = ("name",)
 
     def __init__(self, name: str):
         self.name = name
 
 
 class VFSFile(VFSNode):
-    """Класс файла в VFS"""
+    """
+    Класс файла в VFS
 
-    def __init__(self, name: str, content: str = ""):
+    Содержимое (base64) хранится либо прямо в content, либо, в ленивом
+    режиме, только как смещение и длина участка в отображенном образе.
+    Декодированный текст не хранится в узле, а кэшируется в общем
+    decode_cache с ограниченным бюджетом.
+
+    Большие файлы читаются потоково (iter_bytes, read_range, head_lines,
+    tail_lines): декодируются только нужные блоки base64 по 4 символа.
+    Если внутри base64 есть пробельные символы (перенос строк), смещения
+    блоков заранее неизвестны, и чтение идет от начала содержимого.
+    """
+
+    __slots__ = ("content", "_image", "_offset", "_length", "_layout_cache")
+
+    def __init__(self, name: str, content: str = "",
+                 image: Optional[VFSImage] = None, offset: int = 0, length: int = 0):
         super().__init__(name)
         self.content = content
-        self._decoded_content = None
+        self._image = image
+        self._offset = offset
+        self._length = length
+        # (начало, конец значащей части base64, нет ли внутри пробельных символов)
+        self._layout_cache: Optional[Tuple[int, int, bool]] = None
+
+    def get_encoded(self) -> Union[str, bytes]:
+        """Получить содержимое файла в base64"""
+        if self._image is None:
+            return self.content
+        data = self._image.read(self._offset, self._length)
+        return data if self._image.encoded else base64.b64encode(data)
+
+    def get_payload(self) -> Tuple[Union[str, bytes], bool]:
+        """Получить содержимое как хранится: (данные, закодированы ли они в base64)"""
+        if self._image is None:
+            return self.content, True
+        return self._image.read(self._offset, self._length), self._image.encoded
+
+    def get_bytes(self) -> bytes:
+        """Получить декодированные байты содержимого файла"""
+        if self._image is not None and not self._image.encoded:
+            return self._image.read(self._offset, self._length)
+        return base64.b64decode(self.get_encoded())
+
+    def is_empty(self) -> bool:
+        """Пустой ли файл"""
+        return not self._length if self._image is not None else not self.content
+
+    def size(self) -> int:
+        """Размер содержимого в байтах (по длине base64, без декодирования)"""
+        if self._image is not None and not self._image.encoded:
+            return self._length
+        start, end, clean = self._layout()
+        if clean and (end - start) % 4 == 0:
+            padding = self._encoded_slice(max(start, end - 2), end).count(b"=")
+            return max((end - start) // 4 * 3 - padding, 0)
+        return base64_decoded_size(self.get_encoded())
+
+    def _encoded_length(self) -> int:
+        return self._length if self._image is not None else len(self.content)
+
+    def _encoded_slice(self, start: int, end: int) -> bytes:
+        if self._image is not None:
+            return self._image.read(self._offset + start, end - start)
+        return self.content[start:end].encode('ascii', 'replace')
+
+    def _encoded_find(self, char: str, start: int, end: int) -> int:
+        if self._image is not None:
+            position = self._image.find(char.encode('ascii'), self._offset + start,
+                                        self._offset + end)
+            return position - self._offset if position >= 0 else -1
+        return self.content.find(char, start, end)
+
+    def _layout(self) -> Tuple[int, int, bool]:
+        """Границы значащей части base64 и отсутствие пробельных символов внутри нее"""
+        layout = self._layout_cache
+        if layout is None:
+            length = self._encoded_length()
+            start = 0
+            while start < length and self._encoded_slice(start, start + 1) in _BASE64_WHITESPACE_BYTES:
+                start += 1
+            end = length
+            while end > start and self._encoded_slice(end - 1, end) in _BASE64_WHITESPACE_BYTES:
+                end -= 1
+            clean = all(self._encoded_find(char, start, end) < 0 for char in BASE64_WHITESPACE)
+            layout = self._layout_cache = (start, end, clean)
+        return layout
+
+    def iter_bytes(self, start: int = 0, end: Optional[int] = None,
+                   chunk_size: int = DECODE_CHUNK_BYTES):
+        """
+        Потоково декодировать байты содержимого из диапазона [start, end)
+
+        Yields:
+            bytes: Порции декодированных данных не больше chunk_size
+        """
+        chunk_size = max(3, chunk_size - chunk_size % 3)
+        if self._image is not None and not self._image.encoded:
+            end = self._length if end is None else min(end, self._length)
+            for position in range(start, end, chunk_size):
+                yield self._image.read(self._offset + position, min(chunk_size, end - position))
+            return
+
+        first, last, clean = self._layout()
+        if not clean:
+            yield from self._iter_unaligned(start, end, chunk_size)
+            return
+
+        end = self.size() if end is None else min(end, self.size())
+        for position in range(start, end, chunk_size):
+            stop = min(end, position + chunk_size)
+            # Блок base64 из 4 символов кодирует 3 байта
+            block_start = first + position // 3 * 4
+            block_end = min(last, first + -(-stop // 3) * 4)
+            data = base64.b64decode(self._encoded_slice(block_start, block_end))
+            skip = position % 3
+            yield data[skip:skip + stop - position]
+
+    def _iter_unaligned(self, start: int, end: Optional[int], chunk_size: int):
+        """Декодирование от начала base64 с пробельными символами внутри"""
+        first, last, _ = self._layout()
+        encoded_chunk = chunk_size // 3 * 4
+        position = first
+        decoded = 0
+        carry = b""
+        while position < last and (end is None or decoded < end):
+            piece = self._encoded_slice(position, min(last, position + encoded_chunk))
+            position += encoded_chunk
+            piece = carry + piece.translate(None, _BASE64_WHITESPACE_BYTES)
+            usable = len(piece) - len(piece) % 4 if position < last else len(piece)
+            carry = piece[usable:]
+            data = base64.b64decode(piece[:usable])
+
+            low = max(start - decoded, 0)
+            high = len(data) if end is None else min(end - decoded, len(data))
+            if low < high:
+                yield data[low:high]
+            decoded += len(data)
+
+    def read_range(self, start: int, length: int) -> bytes:
+        """Прочитать length декодированных байт начиная со start"""
+        return b"".join(self.iter_bytes(start, start + length))
+
+    def iter_text(self, chunk_size: int = DECODE_CHUNK_BYTES):
+        """Потоково декодировать содержимое как UTF-8 (неверные байты заменяются)"""
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        for chunk in self.iter_bytes(chunk_size=chunk_size):
+            text = decoder.decode(chunk)
+            if text:
+                yield text
+        text = decoder.decode(b"", final=True)
+        if text:
+            yield text
+
+    def is_binary(self) -> bool:
+        """Двоичный ли файл: проверяются только первые BINARY_SAMPLE_BYTES байт"""
+        try:
+            sample = self.read_range(0, BINARY_SAMPLE_BYTES)
+        except ValueError:
+            return True
+        if b"\0" in sample:
+            return True
+        try:
+            sample.decode('utf-8')
+        except UnicodeDecodeError as e:
+            # Символ, обрезанный на границе выборки, не признак двоичных данных
+            return not (len(sample) == BINARY_SAMPLE_BYTES and e.start >= len(sample) - 3)
+        return False
+
+    def head_lines(self, count: int) -> bytes:
+        """Первые count строк содержимого"""
+        chunks = []
+        found = 0
+        for chunk in self.iter_bytes():
+            newlines = chunk.count(b"\n")
+            if found + newlines >= count:
+                position = -1
+                for _ in range(count - found):
+                    position = chunk.index(b"\n", position + 1)
+                chunks.append(chunk[:position + 1])
+                break
+            chunks.append(chunk)
+            found += newlines
+        return b"".join(chunks)
+
+    def tail_lines(self, count: int, chunk_size: int = DECODE_CHUNK_BYTES) -> bytes:
+        """Последние count строк содержимого: читается с конца, пока хватает строк"""
+        if count <= 0:
+            return b""
+        seekable = (self._image is not None and not self._image.encoded) or self._layout()[2]
+        if not seekable:
+            return b"".join(_split_lines(b"".join(self.iter_bytes()))[-count:])
+
+        end = self.size()
+        position = end
+        data = b""
+        # Завершающий перевод строки не начинает новую строку
+        while position > 0 and data.count(b"\n", 0, max(len(data) - 1, 0)) < count:
+            step = min(chunk_size, position)
+            position -= step
+            data = self.read_range(position, step) + data
+        return b"".join(_split_lines(data)[-count:])
 
     def get_content(self) -> str:
         """Получить декодированное содержимое файла"""
-        if self._decoded_content is None and self.content:
-            try:
-                self._decoded_content = base64.b64decode(self.content).decode('utf-8')
-            except:
-                self._decoded_content = "[Binary data]"
-        return self._decoded_content or ""
+        key = self.content_key()
+        cached = decode_cache.get(key)
+        if cached is not None:
+            if metrics.enabled:
+                metrics.increment("decode_cache.hit")
+            return cached
+
+        if self.is_empty():
+            return ""
+
+        started = time.perf_counter() if metrics.enabled else None
+        data = b""
+        try:
+            data = self.get_bytes()
+            decoded = data.decode('utf-8')
+        except:
+            decoded = "[Binary data]"
+        if started is not None:
+            metrics.observe("decode", time.perf_counter() - started)
+            metrics.increment("decode_cache.miss")
+            metrics.increment("decode.bytes", len(data))
+        decode_cache.put(key, decoded)
+        return decoded
+
+    def content_key(self):
+        """
+        Ключ содержимого в decode_cache
+
+        Файлы с общим содержимым (после дедупликации при загрузке) имеют
+        один ключ и делят одну декодированную копию.
+        """
+        if self._image is None:
+            return self.content
+        return self._image, self._offset, self._length
 
     def __str__(self):
         return f"File: {self.name}"
 
 
+def _split_lines(data: bytes) -> List[bytes]:
+    """Разбить данные на строки только по \\n, сохраняя переводы строк"""
+    lines = [line + b"\n" for line in data.split(b"\n")]
+    lines[-1] = lines[-1][:-1]
+    return lines if lines[-1] else lines[:-1]
+
+
+def join_path(directory_path: str, name: str) -> str:
+    """Полный путь дочернего узла директории"""
+    return directory_path + name if directory_path == "/" else directory_path + "/" + name
+
+
+def normalize_path(path: str, cwd: str = "/") -> str:
+    """
+    Нормализовать путь до полного абсолютного вида
+
+    Относительный путь отсчитывается от cwd; пустые компоненты и "."
+    отбрасываются, ".." поднимается на уровень выше (выше корня - корень).
+    """
+    if not path.startswith("/"):
+        path = join_path(cwd, path)
+
+    # Быстрый путь: в пути нет пустых компонентов, "." и ".."
+    if "//" not in path and "/." not in path and (path == "/" or not path.endswith("/")):
+        return path
+
+    parts: List[str] = []
+    for part in path.split('/'):
+        if not part or part == ".":
+            continue
+        if part == "..":
+            if parts:
+                parts.pop()
+        else:
+            parts.append(part)
+    return "/" + "/".join(parts)
+
+
 class VFSDirectory(VFSNode):
-    """Класс директории в VFS"""
+    """
+    Класс директории в VFS
+
+    path - закэшированный полный путь директории, он обновляется при
+    добавлении директории в дерево. Если дерево проиндексировано, index
+    указывает на его PathIndex, и изменения дерева сразу попадают в индекс.
+
+    owner - версия VFS, которой директория принадлежит единолично и
+    которая может менять ее на месте. Остальные директории могут быть
+    общими для нескольких версий и при изменении сначала копируются.
+
+    Отсортированный список имен детей строится при первом листинге и
+    дальше поддерживается add_child/remove_child бинарным поиском.
+
+    indexed - попадают ли вложенные директории в PathIndex при добавлении
+    поддерева. У компактных директорий (compact.CompactDirectory) и точек
+    монтирования (mount.MountDirectory) он выключен: их поддеревья
+    находятся по пути при обращении.
+
+    persistent - записывается ли директория при сохранении VFS. Точки
+    монтирования не записываются: их содержимое принадлежит своим образам.
+    """
+
+    __slots__ = ("children", "parent", "path", "index", "owner", "_sorted_names")
+
+    indexed = True
+    persistent = True
 
     def __init__(self, name: str, parent=None):
         super().__init__(name)
         self.children: Dict[str, VFSNode] = {}
         self.parent = parent
+        self.path = "/" + name
+        self.index: Optional['PathIndex'] = None
+        self.owner = None
+        self._sorted_names: Optional[List[str]] = None
 
     def add_child(self, node: VFSNode):
         """Добавить дочерний узел"""
+        old = self.children.get(node.name)
         self.children[node.name] = node
+        if old is None and self._sorted_names is not None:
+            bisect.insort(self._sorted_names, node.name)
         if isinstance(node, VFSDirectory):
             node.parent = self
+            # Поддерево с выключенным indexed само выводит пути от своего
+            if node.indexed and node.children:
+                _assign_paths(node, join_path(self.path, node.name))
+            else:
+                node.path = join_path(self.path, node.name)
+
+        if self.index is not None:
+            if isinstance(old, VFSDirectory):
+                self.index.remove(old)
+            if isinstance(node, VFSDirectory):
+                self.index.add(node)
+            self.index.generation += 1
+
+    def remove_child(self, name: str) -> Optional[VFSNode]:
+        """Удалить дочерний узел по имени"""
+        node = self.children.pop(name, None)
+        if node is not None and self._sorted_names is not None:
+            names = self._sorted_names
+            del names[bisect.bisect_left(names, name)]
+        if node is not None and self.index is not None:
+            if isinstance(node, VFSDirectory):
+                self.index.remove(node)
+            self.index.generation += 1
+        return node
 
     def get_child(self, name: str) -> Optional[VFSNode]:
         """Получить дочерний узел по имени"""
         return self.children.get(name)
 
+    def copy(self) -> 'VFSDirectory':
+        """Поверхностная копия: дети остаются общими с оригиналом"""
+        directory = VFSDirectory(self.name, self.parent)
+        directory.children = dict(self.children)
+        if self._sorted_names is not None:
+            directory._sorted_names = list(self._sorted_names)
+        directory.path = self.path
+        return directory
+
     def list_children(self) -> List[str]:
         """Получить список имен дочерних узлов"""
         return list(self.children.keys())
 
+    def child_count(self) -> int:
+        """Число дочерних узлов"""
+        return len(self.children)
+
+    def name_range(self, start: int, end: int) -> List[str]:
+        """Имена детей с позициями [start, end) в порядке sorted_names()"""
+        return self.sorted_names()[start:end]
+
+    def sorted_names(self) -> List[str]:
+        """
+        Имена детей в отсортированном порядке (список только для чтения)
+
+        Сортировка выполняется один раз; если children меняли в обход
+        add_child, список строится заново.
+        """
+        names = self._sorted_names
+        if names is None or len(names) != len(self.children):
+            names = self._sorted_names = sorted(self.children)
+        return names
+
+    def prefix_range(self, prefix: str) -> Tuple[int, int]:
+        """Границы [start, end) имен с префиксом prefix в sorted_names() (бинарный поиск)"""
+        names = self.sorted_names()
+        start = bisect.bisect_left(names, prefix)
+        end = bisect.bisect_left(names, prefix + "\U0010ffff", start) if prefix else len(names)
+        return start, end
+
+    def list_page(self, offset: int = 0, limit: Optional[int] = None) -> List[VFSNode]:
+        """Страница детей в порядке имен: стоимость зависит от размера страницы"""
+        names = self.sorted_names()
+        end = len(names) if limit is None else min(len(names), offset + limit)
+        children = self.children
+        return [children[name] for name in names[offset:end]]
+
     def __str__(self):
-        return f"Directory: {self.name} ({len(self.children)} items)"
+        return f"Directory: {self.name} ({self.child_count()} items)"
 
 
-class VFS:
-    """Виртуальная файловая система"""
+def iter_subdirectories(directory: VFSDirectory):
+    """
+    Обойти директорию и все вложенные в нее директории (без рекурсии)
+
+    Директории с выключенным indexed выдаются, но внутрь них обход не идет.
+    """
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        yield current
+        if not current.indexed:
+            continue
+        for child in current.children.values():
+            if isinstance(child, VFSDirectory):
+                stack.append(child)
+
+
+def walk(directory: VFSDirectory, path: Optional[str] = None, max_depth: Optional[int] = None):
+    """
+    Обойти поддерево в прямом порядке, не строя списков узлов
+
+    Хранится только стек итераторов по children, поэтому память зависит
+    от глубины дерева, а не от его размера. Остановить обход можно в любой
+    момент, просто перестав читать генератор.
+
+    Yields:
+        (полный путь, узел, глубина): дети directory имеют глубину 1
+    """
+    stack = [(iter(directory.children.values()), path or directory.path, 1)]
+    while stack:
+        children, parent_path, depth = stack[-1]
+        node = next(children, None)
+        if node is None:
+            stack.pop()
+            continue
+
+        node_path = join_path(parent_path, node.name)
+        yield node_path, node, depth
+        if isinstance(node, VFSDirectory) and (max_depth is None or depth < max_depth):
+            stack.append((iter(node.children.values()), node_path, depth + 1))
+
+
+def iter_disk_usage(directory: VFSDirectory, path: Optional[str] = None):
+    """
+    Посчитать размеры директорий поддерева в обратном порядке обхода
+
+    Размер директории выдается сразу после обхода ее содержимого; память,
+    как и в walk, зависит только от глубины.
+
+    Yields:
+        (полный путь, размер в байтах, глубина): сама directory имеет глубину 0
+    """
+    # Кадр стека: [итератор по детям, путь, накопленный размер, глубина]
+    stack = [[iter(directory.children.values()), path or directory.path, 0, 0]]
+    while stack:
+        frame = stack[-1]
+        node = next(frame[0], None)
+        if node is None:
+            stack.pop()
+            if stack:
+                stack[-1][2] += frame[2]
+            yield frame[1], frame[2], frame[3]
+        elif isinstance(node, VFSDirectory):
+            stack.append([iter(node.children.values()), join_path(frame[1], node.name),
+                          0, frame[3] + 1])
+        else:
+            frame[2] += node.size()
+
+
+def _assign_paths(directory: VFSDirectory, path: str):
+    """Пересчитать закэшированные пути директории и ее поддерева"""
+    directory.path = path
+    for current in iter_subdirectories(directory):
+        for child in current.children.values():
+            if isinstance(child, VFSDirectory):
+                child.path = join_path(current.path, child.name)
+
+
+class TreeBuilder:
+    """
+    Построитель дерева VFS для загрузчиков образов
+
+    Загрузчики (XML, ленивый XML, снимок) сообщают о директориях и файлах
+    через этот интерфейс и не зависят от способа хранения дерева. Здесь
+    строятся обычные объекты узлов; compact.CompactTreeBuilder с тем же
+    интерфейсом строит компактные таблицы. Описатели директорий (root и
+    результат add_directory) передаются обратно как parent.
+    """
 
     def __init__(self):
         self.root = VFSDirectory("")
-        self.current_directory = self.root
+
+    def add_directory(self, parent: VFSDirectory, name: str) -> VFSDirectory:
+        """Добавить директорию и вернуть ее описатель"""
+        directory = VFSDirectory(name, parent)
+        parent.add_child(directory)
+        return directory
+
+    def add_file(self, parent: VFSDirectory, name: str, content: str = "",
+                 image: Optional[VFSImage] = None, offset: int = 0, length: int = 0):
+        """Добавить файл с содержимым в base64 или участком образа"""
+        parent.add_child(VFSFile(name, content, image, offset, length))
+
+    def add_text(self, parent: VFSDirectory, name: str, text: str, blobs: BlobStore, key):
+        """
+        Добавить файл с содержимым base64, взятым из текста образа
+
+        Одинаковое содержимое (с тем же ключом key в blobs) хранится один раз.
+        """
+        self.add_file(parent, name, blobs.intern(key, text, len(text)))
+
+    def finish(self) -> VFSDirectory:
+        """Закончить построение и вернуть корень"""
+        return self.root
+
+
+def make_tree_builder(compact: bool = False):
+    """Построитель обычного или компактного (compact.py) дерева"""
+    if compact:
+        from compact import CompactTreeBuilder
+        return CompactTreeBuilder()
+    return TreeBuilder()
+
+
+class PathIndex:
+    """
+    Индекс директорий дерева: нормализованный полный путь -> директория
+
+    Файлы в индекс не попадают: путь к файлу разрешается через индекс его
+    директории и один поиск в children. generation растет при каждом
+    изменении дерева, по нему сбрасываются производные кэши.
+
+    Индекс может быть слоем поверх родительского: при ответвлении версии
+    VFS (VFS.fork) общий индекс замораживается, а изменения каждой версии
+    пишутся в ее собственный слой (удаления - как None).
+
+    Если в дереве есть компактные поддеревья (indexed выключен), индекс
+    становится ленивым (lazy): путь, которого нет в индексе, разрешается
+    спуском от ближайшей проиндексированной директории-предка.
+    """
+
+    def __init__(self, root: Optional[VFSDirectory] = None, parent: Optional['PathIndex'] = None):
+        self._directories: Dict[str, Optional[VFSDirectory]] = {}
+        self._parent = parent
+        self.layers = parent.layers + 1 if parent is not None else 1
+        self.generation = parent.generation if parent is not None else 0
+        self.lazy = parent.lazy if parent is not None else False
+        if root is not None:
+            root.path = "/"
+            self.add(root)
+
+    def add(self, directory: VFSDirectory):
+        """Проиндексировать директорию вместе с поддеревом"""
+        for current in iter_subdirectories(directory):
+            current.index = self
+            self._directories[current.path] = current
+            if not current.indexed:
+                self.lazy = True
+
+    def remove(self, directory: VFSDirectory):
+        """Убрать директорию вместе с поддеревом из индекса"""
+        for current in iter_subdirectories(directory):
+            if self.get_directory(current.path) is current:
+                self.discard(current.path)
+            if current.index is self:
+                current.index = None
+
+    def set(self, path: str, directory: VFSDirectory):
+        """Записать директорию в индекс (без поддерева)"""
+        self._directories[path] = directory
+
+    def discard(self, path: str):
+        """Убрать путь из индекса"""
+        if self._parent is None:
+            self._directories.pop(path, None)
+        else:
+            self._directories[path] = None
+
+    def _lookup(self, path: str) -> Optional[VFSDirectory]:
+        """Найти путь в слоях индекса (без спуска по дереву)"""
+        index = self
+        while index is not None:
+            directory = index._directories.get(path, index)
+            if directory is not index:
+                return directory
+            index = index._parent
+        return None
+
+    def _walk(self, path: str) -> Optional[VFSNode]:
+        """Найти узел спуском от ближайшей проиндексированной директории-предка"""
+        names = []
+        head = path
+        while True:
+            head, _, name = head.rpartition('/')
+            head = head or "/"
+            names.append(name)
+            node = self._lookup(head)
+            if node is not None:
+                break
+            if head == "/":
+                return None
+
+        for name in reversed(names):
+            if not isinstance(node, VFSDirectory):
+                return None
+            node = node.get_child(name)
+            if node is None:
+                return None
+        return node
+
+    def get_directory(self, path: str) -> Optional[VFSDirectory]:
+        """Найти директорию по нормализованному полному пути"""
+        directory = self._lookup(path)
+        if directory is None and self.lazy:
+            node = self._walk(path)
+            if isinstance(node, VFSDirectory):
+                return node
+        return directory
+
+    def get(self, path: str) -> Optional[VFSNode]:
+        """Найти узел (директорию или файл) по нормализованному полному пути"""
+        directory = self._lookup(path)
+        if directory is not None:
+            return directory
+        if self.lazy:
+            return self._walk(path)
+
+        parent_path, _, name = path.rpartition('/')
+        parent = self.get_directory(parent_path or "/")
+        if parent is None:
+            return None
+        return parent.get_child(name)
+
+    def is_empty_layer(self) -> bool:
+        """Нет ли в собственном слое ни одной записи"""
+        return not self._directories
+
+    def fork(self) -> 'PathIndex':
+        """Новый пустой слой поверх этого индекса (сам индекс больше не меняется)"""
+        if self.layers >= MAX_INDEX_LAYERS:
+            return PathIndex(parent=self.flatten())
+        return PathIndex(parent=self)
+
+    def flatten(self) -> 'PathIndex':
+        """Однослойная копия индекса"""
+        merged: Dict[str, Optional[VFSDirectory]] = {}
+        chain = []
+        index = self
+        while index is not None:
+            chain.append(index)
+            index = index._parent
+        for index in reversed(chain):
+            merged.update(index._directories)
+
+        flat = PathIndex()
+        flat._directories = {path: directory for path, directory in merged.items()
+                             if directory is not None}
+        flat.generation = self.generation
+        flat.lazy = self.lazy
+        return flat
+
+    def __len__(self):
+        return len(self.flatten()._directories) if self._parent is not None else len(self._directories)
+
+
+class VFSCursor:
+    """
+    Текущая директория одного сеанса работы с VFS
+
+    Несколько курсоров могут работать с одним деревом, у каждого своя
+    текущая директория. Курсор хранит путь; если дерево изменилось или
+    было загружено заново, директория заново находится по пути через
+    индекс (если ее больше нет - курсор переходит в корень).
+    """
+
+    def __init__(self, vfs: 'VFS', path: str = "/"):
+        self.vfs = vfs
         self.current_path = "/"
+        self._directory = vfs.root
+        self._index = vfs.index
+        self._generation = vfs.index.generation
+        if path != "/":
+            self.change_directory(path)
+
+    @property
+    def current_directory(self) -> VFSDirectory:
+        """Текущая директория"""
+        index = self.vfs.index
+        if self._index is not index or self._generation != index.generation:
+            directory = index.get_directory(self.current_path)
+            if directory is None:
+                directory = self.vfs.root
+                self.current_path = "/"
+            self._directory = directory
+            self._index = index
+            self._generation = index.generation
+        return self._directory
 
-    def load_from_xml(self, xml_path: str) -> bool:
+    def change_directory(self, path: str) -> bool:
+        """
+        Сменить текущую директорию
+
+        Args:
+            path: Путь для перехода
+
+        Returns:
+            bool: Успешно ли изменена директория
+        """
+        target_dir = self.resolve_path(path)
+
+        if target_dir and isinstance(target_dir, VFSDirectory):
+            self._directory = target_dir
+            self._index = self.vfs.index
+            self._generation = self.vfs.index.generation
+            self.current_path = target_dir.path
+            return True
+
+        return False
+
+    def resolve_full_path(self, path: str) -> str:
+        """Нормализованный полный путь относительно текущей директории"""
+        return normalize_path(path, self.current_path)
+
+    def resolve_path(self, path: str) -> Optional[VFSNode]:
+        """Разрешить абсолютный или относительный путь до узла"""
+        return self.vfs.resolve_path(path, self.current_path)
+
+    def list_current_directory(self) -> List[str]:
+        """Получить список содержимого текущей директории"""
+        return self.current_directory.list_children()
+
+    def get_file_content(self, filename: str) -> Optional[str]:
+        """Получить содержимое файла (по имени или пути)"""
+        node = self.resolve_path(filename)
+        if isinstance(node, VFSFile):
+            return node.get_content()
+        return None
+
+    def get_node_info(self, name: str) -> Optional[str]:
+        """Получить информацию о узле (файл/директория)"""
+        node = self.current_directory.get_child(name)
+        if node:
+            return str(node)
+        return None
+
+
+class VFS:
+    """
+    Виртуальная файловая система
+
+    Текущая директория хранится в курсорах (VFSCursor). Методы навигации
+    VFS работают с курсором по умолчанию; для отдельных сеансов над тем же
+    деревом создаются свои курсоры через open_cursor.
+    """
+
+    def __init__(self):
+        self._relative_cache: "OrderedDict[tuple, VFSNode]" = OrderedDict()
+        self._relative_generation = 0
+        # Курсоры разных потоков (фоновые команды, сервер) делят этот кэш
+        self._relative_lock = threading.Lock()
+        # Журнал изменений (journal.Journal), если изменения нужно сохранять
+        self.journal = None
+        # Статистика дедупликации содержимого последней загрузки (BlobStore.stats)
+        self.load_stats: Optional[dict] = None
+        self.set_root(VFSDirectory(""))
+
+    def set_root(self, root: VFSDirectory):
+        """Сделать директорию корнем VFS и проиндексировать дерево"""
+        self.root = root
+        self.index = PathIndex(root)
+        # Подключенные точки монтирования: полный путь -> mount.MountDirectory
+        self._mounts: Dict[str, VFSDirectory] = {}
+        # Индекс имен для locate (locate.NameIndex) строится по запросу для
+        # исходной VFS и общий для всех ее ответвлений; каждая версия сама
+        # помнит узлы, созданные после ответвления или построения индекса
+        self.names = None
+        self.names_origin: 'VFS' = self
+        self.names_created: Dict[str, bool] = {}
+        # Число удалений в этой VFS и в исходной на момент ответвления:
+        # удаленные в исходной VFS узлы могли не попасть в общий индекс
+        self.removals = 0
+        self.origin_removals = 0
+        self._relative_cache.clear()
+        self.cursor = VFSCursor(self)
+        # Метка версии: директории с этой меткой можно менять на месте
+        self._owner = object()
+
+    def fork(self) -> 'VFS':
+        """
+        Создать независимую версию VFS, разделяющую с этой все дерево
+
+        Стоимость не зависит от размера дерева: общий индекс путей
+        замораживается, а каждая версия пишет изменения в свой слой.
+        После ответвления обе версии копируют общие директории при записи.
+        """
+        other = VFS()
+        other.root = self.root
+
+        if self.index.is_empty_layer() and self.index._parent is not None:
+            # Эта версия еще не менялась - ответвляемся от ее основы
+            other.index = self.index._parent.fork()
+        else:
+            base = self.index
+            self.index = base.fork()
+            other.index = base.fork()
+
+        self._owner = object()
+        other._mounts = dict(self._mounts)
+        other.names_origin = self.names_origin
+        other.names_created = dict(self.names_created)
+        other.origin_removals = self.removals if self.names_origin is self else self.origin_removals
+        other.cursor = VFSCursor(other, self.cursor.current_path)
+        return other
+
+    def load_from_xml(self, xml_path: str,
+                      progress: Optional[Callable[[int, int, int], None]] = None,
+                      lazy: bool = False, compact: bool = False) -> bool:
         """
         Загрузить VFS из XML-файла
 
+        Образ разбирается потоково (iterparse): узлы VFS создаются по мере
+        закрытия элементов, а разобранные элементы сразу освобождаются,
+        поэтому в памяти не держится полное ElementTree. Вложенность
+        обрабатывается собственным стеком, без рекурсии.
+
+        В ленивом режиме образ отображается в память, а для каждого файла
+        запоминаются только смещение и длина его содержимого.
+
         Args:
             xml_path: Путь к XML-файлу
+            progress: Необязательный обработчик прогресса,
+                вызывается как progress(узлов, прочитано_байт, всего_байт)
+            lazy: Не загружать содержимое файлов в память
+            compact: Хранить дерево в компактных таблицах (compact.py)
 
         Returns:
             bool: Успешно ли загружена VFS
@@ -80,136 +1089,573 @@ class VFS:
             if not Path(xml_path).exists():
                 return False
 
-            tree = ET.parse(xml_path)
-            root_element = tree.getroot()
+            # Разбор и построение узлов идут одним потоковым проходом
+            builder = make_tree_builder(compact)
+            with metrics.timer("load.parse"):
+                if lazy:
+                    new_root = self._scan_xml_lazy(xml_path, progress, builder)
+                else:
+                    new_root = self._stream_xml(xml_path, progress, builder)
 
-            # Очищаем текущую VFS
-            self.root = VFSDirectory("")
-            self.current_directory = self.root
-            self.current_path = "/"
-
-            # Рекурсивно строим дерево VFS
-            self._parse_xml_element(root_element, self.root)
+            # Заменяем текущую VFS только после успешного разбора
+            with metrics.timer("load.index"):
+                self.set_root(new_root)
             return True
 
-        except ET.ParseError as e:
+        except (ET.ParseError, expat.ExpatError) as e:
             print(f"Ошибка парсинга XML: {e}")
             return False
         except Exception as e:
             print(f"Ошибка загрузки VFS: {e}")
             return False
 
-    def _parse_xml_element(self, element: ET.Element, current_dir: VFSDirectory):
-        """Рекурсивный парсинг XML элемента"""
-        for child in element:
-            if child.tag == 'directory':
-                dir_name = child.get('name', 'unnamed')
-                new_dir = VFSDirectory(dir_name, current_dir)
-                current_dir.add_child(new_dir)
-                self._parse_xml_element(child, new_dir)
-
-            elif child.tag == 'file':
-                file_name = child.get('name', 'unnamed')
-                content = child.text or ""
-                new_file = VFSFile(file_name, content)
-                current_dir.add_child(new_file)
+    def _stream_xml(self, xml_path: str, progress: Optional[Callable[[int, int, int], None]],
+                    builder: TreeBuilder) -> VFSDirectory:
+        """Потоковый разбор XML-образа в новое дерево VFS"""
+        root = builder.root
+        total_bytes = Path(xml_path).stat().st_size
+        nodes = 0
+        next_report = PROGRESS_INTERVAL
+        blobs = BlobStore()
 
-    def change_directory(self, path: str) -> bool:
+        # Для каждого открытого элемента храним описатель директории VFS, в
+        # которую добавляются его дети, или None, если содержимое элемента
+        # пропускается (содержимое <file> и неизвестных тегов)
+        dir_stack: list = []
+        elem_stack: List[ET.Element] = []
+
+        with open(xml_path, 'rb') as f:
+            for event, elem in ET.iterparse(f, events=("start", "end")):
+                if event == "start":
+                    parent = dir_stack[-1] if dir_stack else None
+                    if not dir_stack:
+                        dir_stack.append(root)
+                    elif parent is not None and elem.tag == 'directory':
+                        dir_stack.append(builder.add_directory(parent, elem.get('name', 'unnamed')))
+                        nodes += 1
+                    else:
+                        dir_stack.append(None)
+                    elem_stack.append(elem)
+                    continue
+
+                dir_stack.pop()
+                elem_stack.pop()
+                parent = dir_stack[-1] if dir_stack else None
+
+                if elem.tag == 'file' and parent is not None:
+                    text = elem.text or ""
+                    builder.add_text(parent, elem.get('name', 'unnamed'), text, blobs,
+                                     content_digest((text,)))
+                    nodes += 1
+
+                # Освобождаем разобранный элемент: он всегда единственный
+                # оставшийся ребенок своего родителя
+                elem.clear()
+                if elem_stack:
+                    del elem_stack[-1][:]
+
+                if progress is not None and nodes >= next_report:
+                    progress(nodes, f.tell(), total_bytes)
+                    next_report = nodes + PROGRESS_INTERVAL
+
+        if progress is not None:
+            progress(nodes, total_bytes, total_bytes)
+        self.load_stats = blobs.stats()
+        return builder.finish()
+
+    def _scan_xml_lazy(self, xml_path: str, progress: Optional[Callable[[int, int, int], None]],
+                       builder: TreeBuilder) -> VFSDirectory:
+        """Разбор отображенного в память образа без загрузки содержимого файлов"""
+        image = VFSImage(xml_path)
+        root = builder.root
+        parser = expat.ParserCreate()
+        total_bytes = len(image)
+        dir_stack: list = []
+        # Текущий <file>: [имя, глубина, начало текста, длина текста,
+        # куски текста, текст закончен]
+        pending: Optional[list] = None
+        nodes = 0
+        blobs = BlobStore()
+
+        def start_element(tag, attrs):
+            nonlocal pending, nodes
+            if pending is not None:
+                # Как и ET, берем только текст до первого вложенного элемента
+                pending[5] = True
+
+            parent = dir_stack[-1] if dir_stack else None
+            if not dir_stack:
+                dir_stack.append(root)
+            elif parent is not None and tag == 'directory':
+                dir_stack.append(builder.add_directory(parent, attrs.get('name', 'unnamed')))
+                nodes += 1
+            else:
+                dir_stack.append(None)
+                if tag == 'file' and parent is not None:
+                    pending = [attrs.get('name', 'unnamed'), len(dir_stack), None, 0, [], False]
+
+        def character_data(data):
+            if pending is None or pending[5]:
+                return
+            if pending[2] is None:
+                pending[2] = parser.CurrentByteIndex
+            pending[3] += len(data)
+            pending[4].append(data)
+
+        def end_element(tag):
+            nonlocal pending, nodes
+            if pending is not None and len(dir_stack) == pending[1]:
+                name, _, text_start, text_length, chunks, text_closed = pending
+                pending = None
+                text_end = parser.CurrentByteIndex
+                parent = dir_stack[-2]
+                if text_start is None:
+                    builder.add_file(parent, name)
+                elif not text_closed and text_end - text_start == text_length:
+                    # Одинаковое содержимое ссылается на первый его участок в образе
+                    offset, length = blobs.intern(content_digest(chunks),
+                                                  (text_start, text_length), text_length)
+                    builder.add_file(parent, name, image=image, offset=offset, length=length)
+                else:
+                    # Текст со ссылками на сущности или вложенными элементами
+                    # не совпадает с байтами образа - храним его явно
+                    builder.add_text(parent, name, "".join(chunks), blobs,
+                                     ("text", content_digest(chunks)))
+                nodes += 1
+            dir_stack.pop()
+
+        parser.StartElementHandler = start_element
+        parser.EndElementHandler = end_element
+        parser.CharacterDataHandler = character_data
+
+        next_report = PROGRESS_INTERVAL
+        for position in range(0, total_bytes, LAZY_PARSE_CHUNK):
+            parser.Parse(image.read(position, LAZY_PARSE_CHUNK), False)
+            if progress is not None and nodes >= next_report:
+                progress(nodes, min(position + LAZY_PARSE_CHUNK, total_bytes), total_bytes)
+                next_report = nodes + PROGRESS_INTERVAL
+        parser.Parse(b"", True)
+
+        if progress is not None:
+            progress(nodes, total_bytes, total_bytes)
+        self.load_stats = blobs.stats()
+        return builder.finish()
+
+    def save_to_xml(self, xml_path: str,
+                    progress: Optional[Callable[[int, int, int], None]] = None) -> bool:
         """
-        Сменить текущую директорию
+        Сохранить VFS в XML-файл
+
+        Дерево обходится собственным стеком и пишется в файл по одному
+        узлу, без построения ElementTree: в памяти держится только стек
+        открытых директорий и содержимое одного файла. Запись идет во
+        временный файл, который затем атомарно заменяет xml_path.
 
         Args:
-            path: Путь для перехода
+            xml_path: Путь к XML-файлу
+            progress: Необязательный обработчик прогресса,
+                вызывается как progress(узлов, записано_байт, 0)
 
         Returns:
-            bool: Успешно ли изменена директория
+            bool: Успешно ли сохранена VFS
         """
-        if path == "/":
-            self.current_directory = self.root
-            self.current_path = "/"
+        tmp_path = xml_path + ".tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8', newline='\n') as f:
+                self._write_xml(f, progress)
+            os.replace(tmp_path, xml_path)
             return True
+        except (OSError, ValueError) as e:
+            print(f"Ошибка сохранения VFS: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return False
 
-        # Обработка абсолютных и относительных путей
-        if path.startswith("/"):
-            target_dir = self._resolve_absolute_path(path)
-        else:
-            target_dir = self._resolve_relative_path(path)
+    def _write_xml(self, f, progress: Optional[Callable[[int, int, int], None]]):
+        """Потоковая запись дерева в открытый текстовый файл"""
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<vfs>\n')
+        nodes = 0
+        next_report = PROGRESS_INTERVAL
 
-        if target_dir and isinstance(target_dir, VFSDirectory):
-            self.current_directory = target_dir
-            self.current_path = self._get_full_path(target_dir)
+        # Элементы стека: (узел, глубина) или (None, глубина) - закрыть директорию
+        stack: List[Tuple[Optional[VFSNode], int]] = [
+            (child, 1) for child in reversed(list(self.root.children.values()))]
+        while stack:
+            node, depth = stack.pop()
+            indent = "    " * depth
+            if node is None:
+                f.write(f"{indent}</directory>\n")
+                continue
+
+            name = quoteattr(node.name)
+            if isinstance(node, VFSDirectory):
+                if not node.persistent:
+                    continue
+                if node.children:
+                    f.write(f"{indent}<directory name={name}>\n")
+                    stack.append((None, depth))
+                    stack.extend((child, depth + 1)
+                                 for child in reversed(list(node.children.values())))
+                else:
+                    f.write(f"{indent}<directory name={name} />\n")
+            else:
+                encoded = node.get_encoded()
+                if isinstance(encoded, bytes):
+                    encoded = encoded.decode('ascii', 'replace')
+                f.write(f"{indent}<file name={name}>{escape(encoded)}</file>\n")
+
+            nodes += 1
+            if progress is not None and nodes >= next_report:
+                progress(nodes, f.tell(), 0)
+                next_report = nodes + PROGRESS_INTERVAL
+
+        f.write("</vfs>\n")
+        if progress is not None:
+            progress(nodes, f.tell(), 0)
+
+    def save_snapshot(self, snapshot_path: str, source_path: Optional[str] = None) -> bool:
+        """
+        Сохранить VFS в компактный бинарный снимок
+
+        Args:
+            snapshot_path: Путь к файлу снимка
+            source_path: XML-образ, с которого снят снимок
+
+        Returns:
+            bool: Успешно ли сохранен снимок
+        """
+        from snapshot import save_snapshot
+        try:
+            save_snapshot(self.root, snapshot_path, source_path)
             return True
+        except Exception as e:
+            print(f"Ошибка сохранения снимка VFS: {e}")
+            return False
 
-        return False
+    def load_snapshot(self, snapshot_path: str, compact: bool = False) -> bool:
+        """
+        Загрузить VFS из бинарного снимка
 
-    def _resolve_absolute_path(self, path: str) -> Optional[VFSNode]:
-        """Разрешить абсолютный путь"""
-        parts = [p for p in path.split('/') if p]
-        current = self.root
+        Args:
+            snapshot_path: Путь к файлу снимка
+            compact: Хранить дерево в компактных таблицах (compact.py)
 
-        for part in parts:
-            if part == "..":
-                if current.parent is not None:
-                    current = current.parent
-            else:
-                if not isinstance(current, VFSDirectory):
-                    return None
-                current = current.get_child(part)
-                if current is None:
-                    return None
+        Returns:
+            bool: Успешно ли загружен снимок
+        """
+        from snapshot import load_snapshot
+        try:
+            if not Path(snapshot_path).exists():
+                return False
+            with metrics.timer("load.snapshot"):
+                root, self.load_stats = load_snapshot(snapshot_path, make_tree_builder(compact))
+            with metrics.timer("load.index"):
+                self.set_root(root)
+            return True
+        except Exception as e:
+            print(f"Ошибка загрузки снимка VFS: {e}")
+            return False
 
-        return current
+    def load_image(self, xml_path: str,
+                   progress: Optional[Callable[[int, int, int], None]] = None,
+                   lazy: bool = False, use_snapshot: bool = True,
+                   compact: bool = False) -> bool:
+        """
+        Загрузить XML-образ, используя снимок рядом с ним как кэш
 
-    def _resolve_relative_path(self, path: str) -> Optional[VFSNode]:
-        """Разрешить относительный путь"""
-        parts = [p for p in path.split('/') if p]
-        current = self.current_directory
+        Если рядом с образом есть свежий снимок, загружается он. Иначе
+        разбирается XML, и после успешной загрузки снимок пересоздается.
 
-        for part in parts:
-            if part == "..":
-                if current.parent is not None:
-                    current = current.parent
-            else:
-                if not isinstance(current, VFSDirectory):
-                    return None
-                current = current.get_child(part)
-                if current is None:
-                    return None
+        Returns:
+            bool: Успешно ли загружена VFS
+        """
+        from snapshot import is_snapshot_fresh, snapshot_path_for
+        snapshot_path = snapshot_path_for(xml_path)
+
+        if use_snapshot and is_snapshot_fresh(xml_path, snapshot_path):
+            if self.load_snapshot(snapshot_path, compact):
+                return True
+
+        if not self.load_from_xml(xml_path, progress, lazy, compact):
+            return False
+        if use_snapshot:
+            self.save_snapshot(snapshot_path, xml_path)
+        return True
+
+    def open_cursor(self, path: str = "/") -> VFSCursor:
+        """Создать новый курсор (текущую директорию) для отдельного сеанса"""
+        return VFSCursor(self, path)
+
+    @property
+    def current_directory(self) -> VFSDirectory:
+        """Текущая директория курсора по умолчанию"""
+        return self.cursor.current_directory
 
+    @property
+    def current_path(self) -> str:
+        """Текущий путь курсора по умолчанию"""
+        return self.cursor.current_path
+
+    def change_directory(self, path: str) -> bool:
+        """Сменить текущую директорию курсора по умолчанию"""
+        return self.cursor.change_directory(path)
+
+    def resolve_full_path(self, path: str) -> str:
+        """Нормализованный полный путь относительно текущей директории"""
+        return self.cursor.resolve_full_path(path)
+
+    def resolve_path(self, path: str, cwd: Optional[str] = None) -> Optional[VFSNode]:
+        """
+        Разрешить абсолютный или относительный путь до узла
+
+        Путь нормализуется и ищется в индексе за постоянное число
+        обращений к словарям, независимо от глубины. Результаты для
+        относительных путей запоминаются в небольшом LRU-кэше по паре
+        (текущая директория, путь), общем для всех курсоров.
+
+        Args:
+            path: Путь
+            cwd: Директория, от которой отсчитывается относительный путь
+                (по умолчанию - текущая директория курсора по умолчанию)
+        """
+        if path.startswith("/"):
+            return self.index.get(normalize_path(path))
+
+        if cwd is None:
+            cwd = self.cursor.current_path
+
+        key = (cwd, path)
+        with self._relative_lock:
+            if self._relative_generation != self.index.generation:
+                self._relative_cache.clear()
+                self._relative_generation = self.index.generation
+
+            node = self._relative_cache.get(key)
+            if node is not None:
+                self._relative_cache.move_to_end(key)
+                return node
+
+        node = self.index.get(normalize_path(path, cwd))
+        if node is not None:
+            with self._relative_lock:
+                self._relative_cache[key] = node
+                if len(self._relative_cache) > RELATIVE_PATH_CACHE_SIZE:
+                    self._relative_cache.popitem(last=False)
+        return node
+
+    def _writable_directory(self, path: str) -> VFSDirectory:
+        """
+        Получить директорию для изменения на месте
+
+        Общие с другими версиями директории на пути от корня копируются
+        (поверхностно, дети остаются общими) и становятся собственными для
+        этой версии; уже собственные используются как есть. Стоимость -
+        O(глубина пути), поддеревья в стороне от пути не затрагиваются.
+        """
+        if self.index.get_directory(path) is None:
+            raise VFSError(f"Директория '{path}' не найдена")
+
+        owner = self._owner
+        if self.root.owner is not owner:
+            self.root = self._own_copy(self.root, None)
+
+        current = self.root
+        for part in [part for part in path.split('/') if part]:
+            child = current.get_child(part)
+            if not child.persistent:
+                # Содержимое точки монтирования не попадает ни в журнал, ни
+                # в сохраняемый образ, поэтому изменить его нельзя
+                raise VFSError(f"Точка монтирования '{join_path(current.path, part)}' "
+                               f"доступна только для чтения")
+            if child.owner is not owner:
+                child = self._own_copy(child, current)
+                current.children[part] = child
+            current = child
         return current
 
-    def _get_full_path(self, directory: VFSDirectory) -> str:
-        """Получить полный путь для директории"""
-        if directory == self.root:
-            return "/"
+    def _own_copy(self, directory: VFSDirectory, parent: Optional[VFSDirectory]) -> VFSDirectory:
+        copy = directory.copy()
+        copy.parent = parent
+        copy.owner = self._owner
+        copy.index = self.index
+        self.index.set(copy.path, copy)
+        return copy
+
+    def _split_target(self, path: str, cwd: Optional[str]) -> Tuple[str, str]:
+        """Разбить путь на полный путь родителя и имя узла"""
+        full_path = normalize_path(path, cwd if cwd is not None else self.cursor.current_path)
+        if full_path == "/":
+            raise VFSError("Нельзя изменить корневую директорию")
+        parent_path, _, name = full_path.rpartition('/')
+        return parent_path or "/", name
 
-        parts = []
-        current = directory
+    def make_directory(self, path: str, cwd: Optional[str] = None, parents: bool = False):
+        """
+        Создать директорию
+
+        Args:
+            path: Путь новой директории
+            cwd: Директория для относительного пути
+            parents: Создавать недостающие родительские директории
+                и не считать ошибкой уже существующую директорию
+
+        Raises:
+            VFSError: Родитель не найден или имя занято
+        """
+        parent_path, name = self._split_target(path, cwd)
+        existing = self.index.get(join_path(parent_path, name))
+        if isinstance(existing, VFSDirectory) and parents:
+            return
+        if existing is not None:
+            raise VFSError(f"'{join_path(parent_path, name)}' уже существует")
+
+        if parents and self.index.get_directory(parent_path) is None:
+            self.make_directory(parent_path, parents=True)
+
+        parent = self._writable_directory(parent_path)
+        directory = VFSDirectory(name)
+        directory.owner = self._owner
+        parent.add_child(directory)
+        self._note_created(join_path(parent_path, name), True)
+        self._log("mkdir", join_path(parent_path, name))
+
+    def write_file(self, path: str, data: bytes, cwd: Optional[str] = None, append: bool = False):
+        """
+        Записать содержимое файла, создав файл при необходимости
+
+        Raises:
+            VFSError: Родитель не найден или путь указывает на директорию
+        """
+        parent_path, name = self._split_target(path, cwd)
+        existing = self.index.get(join_path(parent_path, name))
+        if isinstance(existing, VFSDirectory):
+            raise VFSError(f"'{join_path(parent_path, name)}' является директорией")
+
+        content = existing.get_bytes() + data if append and existing is not None else data
+
+        parent = self._writable_directory(parent_path)
+        parent.add_child(VFSFile(name, base64.b64encode(content).decode('ascii')))
+        if existing is None:
+            self._note_created(join_path(parent_path, name), False)
+        # В журнал попадают только дописанные байты, а не весь файл
+        self._log("write", join_path(parent_path, name), data=data, append=append)
+
+    def touch(self, path: str, cwd: Optional[str] = None):
+        """Создать пустой файл, если его еще нет"""
+        parent_path, name = self._split_target(path, cwd)
+        if self.index.get(join_path(parent_path, name)) is None:
+            self.write_file(join_path(parent_path, name), b"")
+
+    def remove(self, path: str, cwd: Optional[str] = None, recursive: bool = False):
+        """
+        Удалить файл или директорию
+
+        Raises:
+            VFSError: Узел не найден или директория не пуста без recursive
+        """
+        parent_path, name = self._split_target(path, cwd)
+        full_path = join_path(parent_path, name)
+        node = self.index.get(full_path)
+        if node is None:
+            raise VFSError(f"'{full_path}' не найден")
+        if isinstance(node, VFSDirectory) and not node.persistent:
+            # Точка монтирования отключается, а не удаляется: в журнале ее нет
+            self._writable_directory(parent_path).remove_child(name)
+            return
+        if isinstance(node, VFSDirectory) and node.children and not recursive:
+            raise VFSError(f"Директория '{full_path}' не пуста")
+
+        self._writable_directory(parent_path).remove_child(name)
+        self.removals += 1
+        # Вложенные созданные узлы отсеются проверкой при выдаче locate
+        self.names_created.pop(full_path, None)
+        self._log("rm", full_path)
+
+    def mount(self, image_path: str, path: str, cwd: Optional[str] = None,
+              lazy: bool = False, compact: bool = False, use_snapshot: bool = True) -> VFSDirectory:
+        """
+        Подключить XML-образ в точку монтирования
+
+        Образ не читается: в дерево добавляется директория-заглушка
+        (mount.MountDirectory), которая загрузит его при первом обращении.
+        Точки монтирования не записываются в журнал и в сохраняемый образ,
+        поэтому их содержимое доступно только для чтения, а rm точки
+        монтирования только отключает ее.
 
-        while current != self.root and current is not None:
-            parts.append(current.name)
-            current = current.parent
+        Args:
+            image_path: Путь к XML-образу в файловой системе
+            path: Путь точки монтирования в VFS (родитель должен существовать)
+            cwd: Директория для относительного пути
+            lazy, compact, use_snapshot: Параметры загрузки образа (см. load_image)
+
+        Returns:
+            VFSDirectory: Точка монтирования
+
+        Raises:
+            VFSError: Образ не найден, родитель не найден или имя занято
+        """
+        from mount import MountDirectory
+        if not Path(image_path).is_file():
+            raise VFSError(f"Образ '{image_path}' не найден")
+        parent_path, name = self._split_target(path, cwd)
+        full_path = join_path(parent_path, name)
+        if self.index.get(full_path) is not None:
+            raise VFSError(f"'{full_path}' уже существует")
+
+        mount = MountDirectory(name, image_path, lazy, compact, use_snapshot)
+        self._writable_directory(parent_path).add_child(mount)
+        self._mounts[full_path] = mount
+        self._note_created(full_path, True)
+        return mount
+
+    def mounts(self) -> List[VFSDirectory]:
+        """Точки монтирования, которые сейчас есть в дереве, по порядку путей"""
+        return [mount for path, mount in sorted(self._mounts.items())
+                if self.index.get(path) is mount]
+
+    def unload(self, path: str, cwd: Optional[str] = None) -> bool:
+        """
+        Выгрузить содержимое точки монтирования, чтобы освободить память
+
+        Returns:
+            bool: Был ли образ загружен
 
-        parts.reverse()
-        return "/" + "/".join(parts)
+        Raises:
+            VFSError: Путь не является точкой монтирования
+        """
+        from mount import MountDirectory
+        full_path = normalize_path(path, cwd if cwd is not None else self.cursor.current_path)
+        mount = self.index.get(full_path)
+        if not isinstance(mount, MountDirectory):
+            raise VFSError(f"'{full_path}' не является точкой монтирования")
+        unloaded = mount.unload()
+        # Курсоры и кэш путей больше не должны ссылаться на узлы образа
+        self.index.generation += 1
+        return unloaded
+
+    def _note_created(self, path: str, is_directory: bool):
+        """Запомнить новый узел для индекса имен, если индекс может его не знать"""
+        if self.names is not None or self.names_origin is not self:
+            self.names_created[path] = is_directory
+
+    def _log(self, operation: str, path: str, **fields):
+        """Записать выполненное изменение в журнал, если он подключен"""
+        if self.journal is not None:
+            self.journal.append(operation, path, **fields)
 
     def list_current_directory(self) -> List[str]:
         """Получить список содержимого текущей директории"""
-        return self.current_directory.list_children()
+        return self.cursor.list_current_directory()
 
     def get_file_content(self, filename: str) -> Optional[str]:
-        """Получить содержимое файла"""
-        node = self.current_directory.get_child(filename)
-        if isinstance(node, VFSFile):
-            return node.get_content()
-        return None
+        """Получить содержимое файла (по имени или пути)"""
+        return self.cursor.get_file_content(filename)
 
     def get_node_info(self, name: str) -> Optional[str]:
         """Получить информацию о узле (файл/директория)"""
-        node = self.current_directory.get_child(name)
-        if node:
-            return str(node)
-        return None
+        return self.cursor.get_node_info(name)
 
 
 def create_default_vfs() -> VFS: